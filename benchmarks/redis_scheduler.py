@@ -0,0 +1,172 @@
+"""
+Redis调度器的多节点测试：
+1.连接一个Redis（需自行启动，比如本机的redis-server），启动多个子进程作为节点，共用同一个采集标识的Redis调度器
+2.最先抢到的节点添加起始请求，其中夹带一个无法序列化的请求对象，应被拒绝且不计入请求数
+3.所有节点的多个线程同时取出、处理、确认请求对象，检查每个请求对象都被处理、没有重复处理，且所有节点都能判断完成并退出
+4.加上-k时，第一个节点处理到一半直接退出（不确认手上的请求对象），其余节点应在可见超时后接手这些请求对象并正常完成
+5.所有节点结束后，Redis里只应保留引擎循环启动状态与请求数、响应数（带过期时间），异常退出的节点不影响删除
+6.之后再加入一个节点，应直接结束，不重新添加起始请求
+7.在项目根目录执行：python -m benchmarks.redis_scheduler [-H 地址] [-p 端口] [-n 请求数] [-w 节点数] [-t 每个节点的线程数] [-k]
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import multiprocessing
+from queue import Empty
+from threading import Thread, Lock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+import services
+from benchmarks.worker_loop import load_offline
+
+_builder_name = 'bench_redis'  # 测试用的业务名称
+
+
+def run_node(index, args, results):
+    """
+    节点子进程，添加（抢到时）并处理请求对象，结束后把处理过的请求对象编号交给主进程
+    :param index:(type=int) 节点序号
+    :param args:(type=Namespace) 脚本参数
+    :param results:(type=Queue) 交回结果的队列
+    """
+
+    from utils.redis import Redis
+    from framework.object.request import Request
+    from framework.core.redis_scheduler import RedisScheduler
+
+    load_offline('')
+    services.redis['bench'] = Redis(host=args.host, port=args.port, db=args.db)
+    scheduler = RedisScheduler('bench', args.run_key, visibility=args.visibility, interval=0.05,
+                               heartbeat=args.visibility)
+    scheduler.set_weight(_builder_name, 1)
+
+    # 1.最先抢到的节点添加起始请求，无法序列化的请求对象应被拒绝，没抢到的节点rejected为None
+    rejected = None
+    if scheduler.start_stage('start_requests') is None:
+        for i in range(args.number):
+            request = Request('test', meta=i)
+            request.builder_name = _builder_name
+            scheduler.add_request(request)
+        request = Request('test', meta=-1, callback=lambda: None)
+        request.builder_name = _builder_name
+        rejected = not scheduler.add_request(request)
+        scheduler.finish_start('start_requests', False)
+
+    # 2.多个线程同时取出、处理、确认，直到所有节点的请求数与响应数相等
+    # 开启-k时，第一个节点处理到一半直接退出，手上未确认的请求对象留给其他节点在可见超时后接手
+    done, lock = list(), Lock()
+
+    def work():
+        while not scheduler.is_finish():
+            request = scheduler.get_request(block=True, timeout=0.2)
+            if request is None:
+                continue
+            time.sleep(args.latency)
+            with lock:
+                if args.kill and index == 0 and len(done) >= args.number // (args.workers * 2):
+                    results.put((index, list(done), rejected))
+                    results.close()
+                    results.join_thread()
+                    os._exit(0)
+                done.append(request.meta)
+            scheduler.ack(request)
+
+    threads = [Thread(target=work) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+    results.put((index, done, rejected))
+
+
+def main():
+    """
+    启动多个节点，检查结果并播报
+    """
+
+    parser = argparse.ArgumentParser(description='多个节点共用Redis调度器，检查请求对象不丢失、不重复，且所有节点都能结束。')
+    parser.add_argument('-H', '--host', default='127.0.0.1', help='Redis地址，默认127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=6379, help='Redis端口，默认6379')
+    parser.add_argument('-d', '--db', type=int, default=15, help='Redis库，默认15')
+    parser.add_argument('-n', '--number', type=int, default=2000, help='请求数，默认2000')
+    parser.add_argument('-w', '--workers', type=int, default=3, help='节点数，默认3')
+    parser.add_argument('-t', '--threads', type=int, default=4, help='每个节点的线程数，默认4')
+    parser.add_argument('-l', '--latency', type=float, default=0.002, help='处理每个请求对象的耗时（秒），默认0.002')
+    parser.add_argument('-v', '--visibility', type=int, default=3, help='可见超时（秒），默认3')
+    parser.add_argument('-k', '--kill', action='store_true', help='第一个节点处理到一半直接退出')
+    args = parser.parse_args()
+    args.run_key = 'bench_%s' % uuid.uuid4().hex
+    timeout = 60 + args.visibility * 2
+
+    print('Redis：%s:%s/%s，节点%s个，每个节点线程%s个，请求%s个%s' % (
+        args.host, args.port, args.db, args.workers, args.threads, args.number, '，第一个节点中途退出' if args.kill else ''))
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    nodes = [context.Process(target=run_node, args=(i, args, results)) for i in range(args.workers)]
+    start = time.perf_counter()
+    for node in nodes:
+        node.start()
+
+    # 结果需在等待子进程退出前取出，否则子进程会阻塞在写入队列
+    reports = list()
+    deadline = time.monotonic() + timeout
+    while len(reports) < args.workers and time.monotonic() < deadline:
+        try:
+            reports.append(results.get(timeout=1))
+        except Empty:
+            if not any(node.is_alive() for node in nodes) and results.empty():
+                break
+    spend = time.perf_counter() - start
+    for node in nodes:
+        node.join(5)
+    stuck = [node for node in nodes if node.is_alive()]
+    for node in stuck:
+        node.terminate()
+
+    # 所有节点结束后只应保留带过期时间的引擎循环启动状态与请求数、响应数
+    client = redis.Redis(host=args.host, port=args.port, db=args.db)
+    prefix = 'c3:scheduler:%s:' % args.run_key
+    kept = {prefix + name for name in ('stage', 'request', 'response')}
+    left = [key.decode() for key in client.scan_iter(prefix + '*')]
+    leaked = [key for key in left if key not in kept or client.pttl(key) < 0]
+
+    # 之后加入的节点应直接结束，不重新添加起始请求
+    late = context.Process(target=run_node, args=(args.workers, args, results))
+    late.start()
+    try:
+        late_index, late_done, late_added = results.get(timeout=timeout)
+    except Empty:
+        late_done, late_added = None, None
+    late.join(5)
+    if late.is_alive():
+        late.terminate()
+
+    # 统一清理，即使检查没通过也不留下数据
+    keys = list(client.scan_iter(prefix + '*'))
+    if keys:
+        client.delete(*keys)
+
+    processed = [meta for index, done, rejected in reports for meta in done]
+    for index, done, rejected in sorted(reports):
+        print('节点%s：处理请求%s个' % (index, len(done)))
+    missing = args.number - len(set(processed))
+    duplicated = len(processed) - len(set(processed))
+    rejected = any(rejected for index, done, rejected in reports)
+    print('耗时%.3f秒，每秒请求数%.1f' % (spend, len(processed) / spend))
+    print('未处理%s个，重复处理%s个，无法序列化的请求对象%s，卡死的节点%s个' % (
+        missing, duplicated, '已拒绝' if rejected else '未拒绝', len(stuck)))
+    late_ok = late_done == [] and late_added is None
+    print('结束后残留的键%s个%s，之后加入的节点%s' % (
+        len(leaked), '（%s）' % '、'.join(leaked) if leaked else '', '直接结束' if late_ok else '没有直接结束'))
+    if missing or duplicated or not rejected or stuck or leaked or not late_ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
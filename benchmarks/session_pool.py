@@ -0,0 +1,104 @@
+"""
+网络请求会话池的基准测试：
+1.在本机启动支持长连接（HTTP/1.1 keep-alive）的测试服务，不需要访问外网
+2.多个线程同时按顺序请求测试服务，分别以每次新建连接与从会话池取出会话的方式，对比每个请求的平均耗时
+3.在项目根目录执行：python -m benchmarks.session_pool [-n 每个线程的请求数] [-t 线程数]
+"""
+
+import os
+import sys
+import time
+import argparse
+from threading import Thread
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import common_function as cf
+from framework.core.session_pool import SessionPool
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    支持长连接的测试服务，返回固定的json
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 响应头与响应体分开写出，长连接下不关闭Nagle会等待对端延迟确认
+    body = b'{"code": 0, "data": []}'
+
+    def do_GET(self):
+        """
+        返回固定的json
+        """
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        """
+        不打印访问日志
+        """
+
+        pass
+
+
+def run_once(url, number, threads, session_pool):
+    """
+    多个线程同时按顺序请求测试服务
+    :param url:(type=str) 测试服务地址
+    :param number:(type=int) 每个线程的请求数
+    :param threads:(type=int) 线程数
+    :param session_pool:(type=SessionPool) 会话池，None为每次新建连接
+    :return spend:(type=float) 每个请求的平均耗时（毫秒）
+    """
+
+    def work():
+        for i in range(number):
+            if session_pool is None:
+                cf.request_get_response(url=url)
+            else:
+                with session_pool.session(url) as session:
+                    cf.request_get_response(url=url, session=session)
+
+    workers = [Thread(target=work) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    spend = (time.perf_counter() - start) * 1000 / number
+    return spend
+
+
+def main():
+    """
+    分别运行两种方式并播报结果
+    """
+
+    parser = argparse.ArgumentParser(description='对比每次新建连接与使用会话池的请求平均耗时。')
+    parser.add_argument('-n', '--number', type=int, default=500, help='每个线程的请求数，默认500')
+    parser.add_argument('-t', '--threads', type=int, default=4, help='线程数，默认4')
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%s/' % server.server_port
+
+    print('测试服务：%s，线程数%s，每个线程请求%s次' % (url, args.threads, args.number))
+    for name, session_pool in (('每次新建连接', None), ('会话池', SessionPool(size=args.threads))):
+        run_once(url, 10, args.threads, session_pool)  # 预热
+        spend = run_once(url, args.number, args.threads, session_pool)
+        print('%s：每个请求平均耗时%.3f毫秒' % (name, spend))
+        if session_pool is not None:
+            created, reused = session_pool.stats()
+            print('会话池创建会话%s个，复用会话%s次' % (sum(created.values()), reused))
+            session_pool.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+引擎基准测试套件：
+1.使用合成的业务建造器驱动引擎，覆盖几种典型的业务形态：
+    ① fanout：一个请求扇出大量请求
+    ② chain：多条很深的请求链，每个响应只产生下一个请求
+    ③ items：每个响应产生大批数据对象交给管道
+    ④ latency：test方式的请求由假下载器注入固定延迟，模拟等待网络或数据库
+2.公共服务使用离线替身，合成的业务模块直接注册到sys.modules，不需要在business目录下新建文件
+3.每种形态在单独的子进程里运行，播报每秒请求数、单个请求耗时的P50/P99、内存峰值（RSS）与CPU时间
+4.结果可写入json文件（附带git提交号），并与另一次的结果文件对比，用于判断引擎的改动是否变快
+5.在项目根目录执行：python -m benchmarks.suite [-s 形态，多个用逗号分隔] [-x 规模倍数] [-n 运行次数] [-o 结果文件] [-b 对比的结果文件]
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import resource
+import platform
+import threading
+import contextlib
+import subprocess
+from importlib import import_module
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.worker_loop import load_offline
+from config import business_name, p_parser, pk_main, pk_dt, pk_module, pk_builder, pk_pipeline
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 项目根目录
+_shapes = ('fanout', 'chain', 'items', 'latency')  # 所有形态
+_latency = 0.005  # latency形态注入的下载延迟（单位：秒）
+
+
+def create_builder(shape, scale):
+    """
+    创建形态对应的合成业务建造器
+    :param shape:(type=str) 形态
+    :param scale:(type=int) 规模倍数
+    :return builder_class:(type=type) 业务建造器类
+    """
+
+    from framework.core.builder import Builder
+
+    class BenchBuilder(Builder):
+        name = 'bench_%s' % shape
+
+        def start_requests(self):
+            if shape == 'fanout':
+                yield self.request('test', parse='fan_out')
+            elif shape == 'chain':
+                for i in range(20):
+                    yield self.request('test', parse='chain', meta=0, chain=i)
+            elif shape == 'items':
+                for i in range(50 * scale):
+                    yield self.request('test', parse='items', index=i)
+            else:
+                for i in range(500 * scale):
+                    yield self.request('test', parse='one_item', latency=_latency, index=i)
+
+        def fan_out(self, response):
+            for i in range(2000 * scale):
+                yield self.request('test', parse='one_item', index=i)
+
+        def chain(self, response):
+            if response.meta < 100 * scale:
+                yield self.request('test', parse='chain', meta=response.meta + 1, chain=response.meta)
+            else:
+                yield self.item(response.meta)
+
+        def items(self, response):
+            for i in range(1000):
+                yield self.item({'index': i, 'value': 'x' * 32})
+
+        def one_item(self, response):
+            yield self.item(response.data)
+
+    return BenchBuilder
+
+
+def create_pipeline():
+    """
+    创建合成业务的管道，数据对象直接丢弃，不入库
+    :return pipeline_class:(type=type) 业务管道类
+    """
+
+    from framework.core.pipeline import Pipeline
+
+    class BenchPipeline(Pipeline):
+        def process_item(self, item):
+            return None
+
+    return BenchPipeline
+
+
+def register_builder(shape, scale):
+    """
+    把合成的业务模块注册到sys.modules，引擎按demo模块的路径加载
+    :param shape:(type=str) 形态
+    :param scale:(type=int) 规模倍数
+    :return code:(type=str) 业务代码
+    """
+
+    code = 'bench_%s' % shape
+    module_name = '%s.%s.%s.%s' % (business_name, p_parser[pk_main][pk_dt][pk_module], code, code)
+    module = types.ModuleType(module_name)
+    setattr(module, p_parser[pk_main][pk_dt][pk_builder], create_builder(shape, scale))
+    setattr(module, p_parser[pk_main][pk_dt][pk_pipeline], create_pipeline())
+    sys.modules[module_name] = module
+    return code
+
+
+def install_fake_downloader(engine_module):
+    """
+    把引擎使用的下载器替换为假下载器，下载信息里带有latency的请求先等待对应的秒数
+    :param engine_module:(type=module) 引擎模块
+    """
+
+    class FakeDownloader(engine_module.Downloader):
+        def get_response(self, request):
+            latency = request.kwargs.get('latency')
+            if latency:
+                time.sleep(latency)
+            return super().get_response(request)
+
+    engine_module.Downloader = FakeDownloader
+
+
+def create_engine(engine_module, latencies):
+    """
+    创建引擎，记录每个请求从下载前到解析完成的耗时，同一个请求的下载与解析在同一个线程里完成
+    :param engine_module:(type=module) 引擎模块
+    :param latencies:(type=list) 存放单个请求耗时的列表
+    :return engine:(type=Engine) 引擎
+    """
+
+    class BenchEngine(engine_module.Engine):
+        local = threading.local()
+
+        def _prepare_request(self, request, builder_name):
+            self.local.begin = time.perf_counter()
+            return super()._prepare_request(request, builder_name)
+
+        def _handle_response(self, response, request, builder_name, parse_name, batch=None):
+            try:
+                super()._handle_response(response, request, builder_name, parse_name, batch)
+            finally:
+                latencies.append(time.perf_counter() - self.local.begin)
+
+    engine = BenchEngine()
+    return engine
+
+
+def percentile(values, rate):
+    """
+    计算分位数
+    :param values:(type=list) 已排序的数值
+    :param rate:(type=float) 分位
+    :return value:(type=float) 分位数，没有数值则为0
+    """
+
+    value = values[min(len(values) - 1, int(len(values) * rate))] if values else 0.0
+    return value
+
+
+def run_child(shape, scale, number, worker_loop, every_async):
+    """
+    子进程里运行某种形态，以json格式打印结果
+    :param shape:(type=str) 形态
+    :param scale:(type=int) 规模倍数
+    :param number:(type=int) 运行次数
+    :param worker_loop:(type=bool) 是否使用常驻线程模式
+    :param every_async:(type=int) 每个业务开启的并发
+    """
+
+    code = register_builder(shape, scale)
+    load_offline(code)
+    engine_module = import_module('framework.core.engine')
+    engine_module.F_worker_loop = worker_loop
+    engine_module.F_every_async = every_async
+    install_fake_downloader(engine_module)
+
+    total_requests, total_spend, latencies = 0, 0.0, list()
+    cpu = time.process_time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(number):
+            engine = create_engine(engine_module, latencies)
+            start = time.perf_counter()
+            engine.start()
+            total_spend += time.perf_counter() - start
+            total_requests += engine.total_response_nums
+    cpu = time.process_time() - cpu
+    latencies.sort()
+    result = {
+        'requests': total_requests, 'seconds': total_spend, 'rps': total_requests / total_spend,
+        'p50_ms': percentile(latencies, 0.5) * 1000, 'p99_ms': percentile(latencies, 0.99) * 1000,
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'cpu_s': cpu}
+    print(json.dumps(result))
+
+
+def run_shape(shape, args):
+    """
+    在单独的子进程里运行某种形态，内存峰值互不影响
+    :param shape:(type=str) 形态
+    :param args:(type=Namespace) 命令行参数
+    :return result:(type=dict) 运行结果
+    """
+
+    command = [sys.executable, '-m', 'benchmarks.suite', '--child', shape, '-x', str(args.scale),
+               '-n', str(args.number), '-a', str(args.every_async)] + (['-w'] if args.worker_loop else [])
+    output = subprocess.run(command, cwd=_root, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result
+
+
+def git_commit():
+    """
+    获取当前的git提交号，用于标记结果文件
+    :return commit:(type=str) 提交号，获取失败则为None
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=_root, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, check=True, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return commit
+
+
+def main():
+    """
+    依次运行各形态并播报结果，按需写入结果文件与对比
+    """
+
+    parser = argparse.ArgumentParser(description='使用合成业务对引擎做基准测试。')
+    parser.add_argument('-s', '--shapes', default=','.join(_shapes), help='形态，多个用逗号分隔，默认全部：%s' % ','.join(_shapes))
+    parser.add_argument('-x', '--scale', type=int, default=1, help='规模倍数，默认1')
+    parser.add_argument('-n', '--number', type=int, default=3, help='每种形态运行引擎的次数，默认3')
+    parser.add_argument('-a', '--every-async', type=int, default=4, help='每个业务开启的并发，默认4')
+    parser.add_argument('-w', '--worker-loop', action='store_true', help='使用常驻线程模式，默认回调模式')
+    parser.add_argument('-o', '--output', help='结果写入的json文件')
+    parser.add_argument('-b', '--baseline', help='对比的结果文件（之前用-o写入的）')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child, args.scale, args.number, args.worker_loop, args.every_async)
+        return
+
+    # 1.依次运行各形态
+    shapes = [shape for shape in args.shapes.split(',') if shape in _shapes]
+    report = {
+        'commit': git_commit(), 'python': platform.python_version(), 'scale': args.scale, 'number': args.number,
+        'every_async': args.every_async, 'worker_loop': args.worker_loop, 'results': dict()}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print('提交%s，规模倍数%s，每种形态运行%s次，并发%s，%s' % (
+        report['commit'], args.scale, args.number, args.every_async, '常驻线程模式' if args.worker_loop else '回调模式'))
+    for shape in shapes:
+        result = report['results'][shape] = run_shape(shape, args)
+        line = '%-8s 完成请求%s个，每秒请求数%.1f，P50/P99为%.2f/%.2f毫秒，内存峰值%.1fMB，CPU时间%.2f秒' % (
+            shape, result['requests'], result['rps'], result['p50_ms'], result['p99_ms'], result['rss_mb'],
+            result['cpu_s'])
+
+        # 2.与对比的结果文件比较每秒请求数
+        old = baseline['results'].get(shape) if baseline else None
+        if old:
+            line += '，每秒请求数对比%s：%+.1f%%' % (baseline.get('commit'), (result['rps'] / old['rps'] - 1) * 100)
+        print(line)
+
+    # 3.写入结果文件
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print('结果已写入%s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+引擎工作线程模式的基准测试：
+1.使用演示和调试模块（demo）的业务建造器，分别以回调模式与常驻线程模式运行引擎，对比每秒完成的请求数
+2.公共服务使用离线替身，不需要连接任何数据库，也不需要account模块下的连接信息
+3.在项目根目录执行：python -m benchmarks.worker_loop [-n 运行次数] [-c demo业务代码，多个用逗号分隔]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import contextlib
+from importlib import import_module
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services
+from config import p_parser, pk_main, pk_dt
+
+
+def load_offline(codes):
+    """
+    加载离线的公共服务替身，代替services.load.load
+    :param codes:(type=str) 要运行的demo业务代码，多个用逗号分隔
+    """
+
+    logger = logging.getLogger('benchmarks')
+    logger.ding_exception = lambda msg, e, key='', *args, **kwargs: logger.exception(msg)
+    services.argv = argparse.Namespace(**{name.replace('-', '_'): None for parser_dict in p_parser.values()
+                                          for name in parser_dict.keys()})
+    services.argv.main_key_dict = {pk_dt: codes}
+    services.launch = {'datetime': None, 'pid': os.getpid(), 'ip': '127.0.0.1'}
+    services.logger = logger
+    services.redis, services.mysql, services.clickhouse, services.postgresql = dict(), dict(), dict(), dict()
+
+
+def run_once(engine_module, worker_loop):
+    """
+    以指定的工作线程模式运行一次引擎
+    :param engine_module:(type=module) 引擎模块
+    :param worker_loop:(type=bool) 是否使用常驻线程模式
+    :return result:(type=tuple) 完成的请求数与耗时（秒）
+    """
+
+    engine_module.F_worker_loop = worker_loop
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        engine = engine_module.Engine()
+        engine.start()
+        spend = time.perf_counter() - start
+    result = (engine.total_response_nums, spend)
+    return result
+
+
+def main():
+    """
+    分别运行两种模式并播报结果
+    """
+
+    parser = argparse.ArgumentParser(description='对比回调模式与常驻线程模式的每秒请求数。')
+    parser.add_argument('-n', '--number', type=int, default=50, help='每种模式运行引擎的次数，默认50')
+    parser.add_argument('-c', '--codes', default='demo1,demo2,demo3', help='demo业务代码，默认demo1,demo2,demo3')
+    args = parser.parse_args()
+    load_offline(args.codes)
+    engine_module = import_module('framework.core.engine')
+
+    print('%s模块业务：%s，每种模式运行%s次' % (p_parser[pk_main][pk_dt]['module'], args.codes, args.number))
+    for name, worker_loop in (('回调模式', False), ('常驻线程模式', True)):
+        run_once(engine_module, worker_loop)  # 预热，加载业务模块
+        total_requests, total_spend = 0, 0.0
+        for i in range(args.number):
+            requests, spend = run_once(engine_module, worker_loop)
+            total_requests += requests
+            total_spend += spend
+        print('%s：完成请求%s个，耗时%.3f秒，每秒请求数%.1f' % (
+            name, total_requests, total_spend, total_requests / total_spend))
+
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,197 @@ F_max_async = 12
 # 每个业务开启的并发
 F_every_async = 4
 
+# 引擎的工作线程模式
+# False为回调模式，每完成一个任务，再通过线程池回调重新提交下一个任务
+# True为常驻线程模式，开启固定数量的常驻线程阻塞等待请求对象，省去线程池的调度开销与队列为空时的空转
+F_worker_loop = False
+
+# 常驻线程模式下，工作线程阻塞等待请求对象的超时时间（单位：秒）
+F_worker_timeout = 1
+
+# 进程池模式（业务建造器process_parse属性为True）下的进程数
+# None为使用CPU核数
+F_process_async = None
+
+# 是否使用异步引擎（AsyncEngine）代替引擎（Engine）
+# 异步引擎在事件循环里调度请求，web方式的网络请求不占用线程，适合大量等待网络或数据库的业务
+# 异步引擎下F_max_async为执行中间件、解析函数、管道等同步业务代码的线程数
+F_async_engine = False
+
+# 异步引擎同时处理的请求数上限，也是web方式同时打开的连接数上限
+F_async_max = 200
+
+# 异步引擎执行db、shell、file、sdk等同步下载方式的线程数
+F_async_io = 32
+
+# 每个业务的调度权重，业务名称为key，权重为value
+# 配置了的业务以此为准，没配置的业务使用业务建造器的weight属性
+# 例：{"demo1": 3}
+F_builder_weight = {}
+
+# 每个业务的并发上限（同时处理中的请求数上限），业务名称为key，并发上限为value（None为不限制）
+# 配置了的业务以此为准，没配置的业务使用业务建造器的max_async属性
+# 例：{"demo1": 4}
+F_builder_async = {}
+
+# 是否开启自适应并发
+# 开启后按采集方式与目标（db方式为db_name，web方式为url的域名）分别控制同时下载的请求数，最大为F_max_async（实际还受开启的并发数限制）
+# 每个目标从并发1开始，每完成一批下载，出错率超过F_adaptive_error或耗时明显变慢则并发上限减半，否则并发曾达到上限则并发上限增加
+# 比如数据库从库变慢时自动降低并发，空闲时段自动提高并发
+# 目标达到并发上限时，调度器暂不分发该目标的请求，工作线程继续处理其他目标的请求
+F_adaptive_async = False
+
+# 自适应并发每完成多少个下载调整一次并发上限
+F_adaptive_window = 20
+
+# 自适应并发耗时的90分位数超过基准耗时（各批下载耗时中位数的较小值）的多少倍视为变慢
+F_adaptive_latency = 2.0
+
+# 自适应并发下载出错率（即交给downloader_error_callback处理的比例）超过多少视为出错过多
+F_adaptive_error = 0.1
+
+# 是否开启分阶段耗时统计
+# 开启后按阶段、业务与函数统计耗时，引擎结束时打印，阶段为：
+# scheduler（从调度器获取请求对象，含等待）、downloader_mw（下载器中间件）、download（下载）、
+# builder_mw（建造器中间件）、parse（解析函数）、pipeline（管道函数）
+F_timings = False
+
+# 分阶段耗时统计写入的json文件路径
+# None为不写入文件
+F_timings_path = None
+
+# 运行指标HTTP端点监听的端口
+# None为不开启，开启后以Prometheus文本格式输出请求/响应/错误总数、每个业务等待中与处理中的请求数、分阶段耗时直方图、管道写入每个表的数据行数
+F_metrics_port = None
+
+# 运行指标HTTP端点监听的地址
+F_metrics_host = '127.0.0.1'
+
+# 运行指标定时写入的文件路径
+# None为不写入，可与HTTP端点同时开启
+F_metrics_path = None
+
+# 运行指标定时写入文件的间隔（单位：秒）
+F_metrics_interval = 10
+
+# 存放检查点文件的目录
+# None为不开启，开启后定时把每个业务当前的任务、等待中与处理中的请求对象、统计计数与去重过滤器写入检查点文件，正常结束后删除
+# 中断后以相同的脚本传参加上-r 1（断点续跑）重新运行，从中断的任务继续，不再从start_requests重新开始
+# 处理中的请求对象恢复后会重新处理，管道入库需能容忍重复；Redis调度器不使用检查点
+# meta里带有线程锁等无法序列化对象的请求对象不写入检查点，该业务恢复时重新执行当前任务（重新添加起始请求）
+# 磁盘调度器溢出到磁盘的请求对象以硬链接的方式引用分段文件，与F_spill_path在同一个文件系统时不复制数据
+F_checkpoint_path = None
+
+# 写入检查点的间隔（单位：秒）
+F_checkpoint_interval = 300
+
+# 下载器web方式是否使用会话池，复用到同一目标（协议+域名+端口）的长连接（keep-alive），不再每次请求都新建TCP与TLS连接
+# 会话交回时清空cookies，与每次直接调用requests.get/post一致；异步引擎的web方式本身已复用连接，不使用会话池
+F_web_session = True
+
+# 会话池每个目标空闲的会话数上限，None为与最大并发数F_max_async一致
+F_web_session_size = None
+
+# 按域名单独配置会话池每个目标空闲的会话数上限，域名（不带端口）为key，上限为value，比如{'api.example.com': 20}
+F_web_session_hosts = {}
+
+# web方式限流（请求对象的下载信息带上web_limit）按限流标识单独配置，优先于请求对象里的限流参数，不需要修改业务代码即可调整
+# 限流标识为key，value为dict：rate为速率（每秒请求数，None为不限速率），burst为突发上限（令牌桶容量，默认1），concurrency为同时处理的请求数上限（默认None不限制）
+# 比如{'demo1_api': {'rate': 5, 'burst': 10, 'concurrency': 3}}
+F_web_limits = {}
+
+# web方式限流共享令牌桶使用的Redis连接名称，即account模块下Redis配置的key
+# None为只在本进程内限流；不为None时令牌桶保存在Redis里，多个进程（多台机器）共同遵守同一个接口配额，同时处理数上限仍按进程计算
+F_web_limit_redis = None
+
+# web方式的响应缓存模式，请求对象的下载信息带上web_cache=True才使用，cache_ttl为缓存时间（秒，默认0每次都发起条件请求）
+# 缓存时间内直接返回缓存的响应；超过后带上ETag/Last-Modified发起条件请求，服务端返回304时使用缓存的响应，没有变化的报表只花一次304的代价
+# None为不缓存，"memory"为只缓存在内存里，"disk"为同时保存到磁盘，下次运行仍可使用（适合定时重复拉取同一份报表）
+F_web_cache = 'memory'
+
+# 响应缓存在内存里缓存的响应数上限，超过后淘汰最久未使用的
+F_web_cache_size = 1000
+
+# 响应缓存模式为"disk"时存放缓存文件的目录
+# None为项目根目录下temporary目录里的web_cache目录，可随时删除该目录清空缓存
+F_web_cache_path = None
+
+# 是否开启管道阶段
+# False为解析函数yield的数据对象直接在解析的线程里交给管道处理
+# True为数据对象放入有界通道，由单独的管道线程处理，下载、解析与管道入库在不同的线程里同时进行，适合解析出大量数据对象的业务
+# 同一个响应对象的数据对象全部处理完成后才计入完成响应；管道出错只影响该数据对象，解析函数继续执行
+F_pipeline_stream = False
+
+# 管道阶段的通道容量（数据对象数），按管道线程数平分给每个管道线程的通道，通道已满时解析线程阻塞等待
+F_pipeline_queue = 1000
+
+# 管道阶段的管道线程数，与下载的并发数（F_max_async、F_every_async）分开配置，入库慢的业务可调大
+# 同一个响应对象的数据对象只交给一个管道线程，按yield的顺序处理；不同响应对象的数据对象由多个管道线程同时处理
+F_pipeline_workers = 4
+
+# 管道阶段的积压上限（数据对象数），通道里等待中的数据对象达到该数量时，工作线程暂停从调度器获取新的请求对象，降到一半以下再继续
+# 即管道入库跟不上时让下载侧慢下来，而不是让解析到一半的线程阻塞在放入通道；None为不暂停，需小于等于F_pipeline_queue
+F_pipeline_backlog = 500
+
+# 收到终止信号（SIGTERM，比如发布或定时任务重叠时kill）后，等待处理中的请求完成的最长时间（单位：秒）
+# None为不处理终止信号（收到即退出），收到后调度器不再分发新的请求，也不再执行后续任务
+# 处理中的请求（包括解析与管道入库）继续完成，超过该时间仍未完成的直接放弃，再次收到终止信号时不再等待
+# 停止后播报放弃的请求数，并调用每个管道的close方法；开启了检查点时写入最终的检查点，加上-r 1重新运行即从中断处继续
+F_drain_timeout = 60
+
+# 是否使用全局统一的引擎循环启动
+# True为所有业务的start_requests都完成后，才一起执行end_requests_1，以此类推
+# False为每个业务的请求全部完成后，立即执行该业务的下一个end_requests，不等待其他业务
+# 异步引擎与Redis调度器只能使用全局统一的循环启动
+F_stage_barrier = True
+
+# 调度器等待中的请求对象总数上限
+# 必须为None或大于等于1的整数，None为不限制
+# 达到上限后，添加请求对象的线程（起始请求、解析函数）阻塞等待，直到有请求对象被取出，防止大量扇出的业务耗尽内存
+# 所有工作线程都阻塞在添加请求对象时，会超出上限添加，避免引擎卡死
+# 使用Redis调度器时不生效，请求对象都保存在Redis里
+F_scheduler_max = None
+
+# 调度器类型
+# "memory"为内存调度器，所有请求对象都保存在内存里
+# "disk"为磁盘调度器，每个业务只在内存里保留少量请求对象，其余的写入磁盘，适合长时间跨度补数据等请求对象非常多的场景
+# 磁盘调度器的请求对象必须可以序列化（pickle），无法序列化的（比如meta里带有数据库连接）不添加，记录错误日志
+# "redis"为Redis调度器，多台机器上以相同脚本传参启动的多个进程共用同一个调度器，分摊同一次采集
+F_scheduler_backend = 'memory'
+
+# 磁盘调度器存放临时文件的目录
+# None为项目根目录下的temporary目录
+F_spill_path = None
+
+# 磁盘调度器每个业务在内存里保留的请求对象数上限，每个用到的优先级各自计算
+F_spill_head = 10000
+
+# 调度器的去重过滤模式
+# None为不去重，"set"为集合模式（精确去重），"bloom"为布隆过滤器模式（内存固定，极小概率误判为重复）
+# 业务名称、采集方式、解析函数与下载信息都相同的请求对象视为重复，meta不参与判断；请求对象传参dont_filter=True可不参与去重
+# 下载信息里的对象需能跨进程稳定表示：services里配置的数据库对象按配置名称、模块级的函数与类按名称计算
+# 临时创建的数据库对象、lambda等无法稳定表示的请求对象不参与去重，否则断点续跑与多节点时会重复采集
+# 使用Redis调度器时，统一使用Redis的集合去重
+F_dupe_filter = None
+
+# 布隆过滤器模式预计的请求对象数，超过后误判率会上升
+F_bloom_capacity = 10000000
+
+# 布隆过滤器模式的误判率
+F_bloom_error = 0.001
+
+# Redis调度器使用的Redis连接名称，即account模块下Redis配置的key
+# 每个节点定时写入心跳，最后一个结束的节点（没有其他心跳未超时的节点）删除该次采集在Redis里的数据，异常退出的节点不影响删除
+# 删除后引擎循环启动状态与请求数、响应数再保留一个可见超时，期间以相同采集标识启动的节点直接结束，需要立即重新采集请换一个采集标识
+# 所有节点都异常退出时数据不会删除，重新采集前请删除“c3:scheduler:采集标识:*”的键，或换一个采集标识
+# 请求对象必须可以序列化（pickle），无法序列化的（比如meta里带有数据库连接）不添加，记录错误日志
+F_redis_scheduler = '127_0'
+
+# Redis调度器的可见超时（单位：秒）
+# 请求对象取出后超过该时间仍未处理完成（比如进程崩溃），会重新入队给其他进程处理
+# 请大于单个请求对象最长的处理时间，否则同一个请求对象会被重复处理
+F_redis_visibility = 600
+
 """通用配置"""
 
 # 业务模块名称
@@ -64,6 +255,8 @@ pk_ea = 'every-async'
 pk_ps = 'pass-something'
 pk_jd = 'just-do'
 pk_type = 'type'
+pk_rk = 'run-key'
+pk_resume = 'resume'
 p_parser = {  # 所有传参构成的字典
     pk_main: {  # 主参数
         pk_dt: {
@@ -118,6 +311,14 @@ p_parser = {  # 所有传参构成的字典
         pk_type: {
             pk_simple: 't',
             pk_help: '执行类型，不同业务不同用法，具体参照业务参数说明。'
+        },
+        pk_rk: {
+            pk_simple: 'rk',
+            pk_help: '采集标识，使用Redis调度器时，共同分摊同一次采集的进程必须相同；不传则根据其余脚本传参生成。'
+        },
+        pk_resume: {
+            pk_simple: 'r',
+            pk_help: '断点续跑，传任意值（比如1）则从检查点恢复运行，其余脚本传参需与中断的那次相同；需配置config中的F_checkpoint_path。'
         }
     }
 }
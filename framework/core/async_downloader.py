@@ -0,0 +1,234 @@
+"""
+异步下载器组件：
+1.供异步引擎使用，web方式在事件循环里发起网络请求，等待响应时不占用线程
+2.db、shell、file、sdk等同步方式交给线程池执行，不阻塞事件循环
+3.返回的数据与下载器一致，业务建造器不需要做任何修改
+"""
+
+import asyncio
+import aiohttp  # pip3 install aiohttp
+import requests
+from lxml import etree
+from framework.core.downloader import Downloader
+from framework.core.rate_limiter import RateLimiter
+from framework.object.response import Response
+from framework.error.check_error import ParameterError, LackParameter
+from utils import common_function as cf
+
+
+class AsyncDownloader(Downloader):
+    """
+    异步下载器组件
+    """
+
+    def __init__(self, executor, limit=100, rate_limiter=None, http_cache=None):
+        """
+        初始配置
+        :param executor:(type=ThreadPoolExecutor) 执行同步下载方式的线程池
+        :param limit:(type=int) web方式同时打开的连接数上限，默认100
+        :param rate_limiter:(type=RateLimiter) web方式使用的限流器，默认None只在本进程内限流且不读取配置
+        :param http_cache:(type=HttpCache) web方式使用的响应缓存，与下载器共用，默认None不缓存
+        """
+
+        rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        super().__init__(rate_limiter=rate_limiter, http_cache=http_cache)
+        self.__executor = executor
+        self.__http_cache = http_cache
+        self.__limit = limit
+        self.__session = None  # 网络请求会话，需要在事件循环里创建，见open函数
+
+        # web方法限流用，与下载器共用令牌桶，但同时处理数上限使用协程信号量，等待时不占用线程
+        self.__rate_limiter = rate_limiter
+        self.__web_slots = dict()
+
+    async def open(self):
+        """
+        在事件循环里创建网络请求会话
+        """
+
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.__limit))
+
+    async def close(self):
+        """
+        关闭网络请求会话
+        """
+
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    async def __request(self, url, method='get', retry=2, timeout=60, retry_interval=3, verify=True, **kwargs):
+        """
+        发起网络请求，参数与非业务公共函数request_get_response一致，重连失败抛IOError异常
+        1.响应体读取完成后构造成requests的响应对象，业务代码可以像同步方式一样使用text、content、json等
+        2.上传文件（带上files参数）的请求交给线程池使用同步方式执行
+        3.带上web_cache=True时使用响应缓存，与下载器一致
+        :param url:(type=str) 请求地址
+        :param method:(type=str) 请求方式，get或post，默认get
+        :param retry:(type=int) 请求次数，该数字应该大于等于1，默认2
+        :param timeout:(type=int) 超时时间（秒），默认60
+        :param retry_interval:(type=int) 重连请求间隔时间（秒），默认3
+        :param verify:(type=bool) 是否进行证书验证，默认True
+        :param kwargs:(type=dict) 其余的关键字参数，用于接收请求头与请求体
+        :return response:(type=requests.Response) 响应数据
+        """
+
+        # 上传文件使用同步方式
+        if kwargs.get('files') is not None:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self.__executor, lambda: cf.request_get_response(
+                url, method=method, retry=retry, timeout=timeout, retry_interval=retry_interval, verify=verify,
+                **kwargs))
+            return response
+
+        # 创建默认请求头与请求体
+        kwargs.setdefault('headers', {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                          'Chrome/83.0.4103.116 Safari/537.36 '
+        })
+        kwargs.setdefault('data', dict())
+
+        # 发起请求，重连次数达上限后抛异常
+        if retry < 1:
+            raise ValueError('retry为大于等于1的数字！')
+        if method.lower() not in ('get', 'post'):
+            raise ValueError('method只能为"get"或"post"！')
+        data = kwargs['data'] if method.lower() == 'post' else None
+        headers = kwargs['headers']
+        cache = self.__http_cache if kwargs.get('web_cache') else None
+        if cache is not None:  # 缓存时间内直接返回缓存的响应，否则发起条件请求
+            ttl = cache.ttl(kwargs)
+            key = cache.key(method, url, data, headers)
+            entry = cache.get(key)
+            if entry is not None and not cache.match(entry, headers):
+                entry = None
+            if entry is not None and cache.fresh(entry, ttl):
+                return cache.response(entry)
+            headers = dict(headers, **cache.validators(entry))
+        for i in range(retry):
+            try:
+                async with self.__session.request(method.upper(), url, headers=headers, data=data,
+                                                  timeout=aiohttp.ClientTimeout(total=timeout),
+                                                  ssl=None if verify else False) as aio_response:
+                    content = await aio_response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if i == retry - 1:
+                    raise IOError('请求失败，请排查！（报错信息：%s）；（URL：%s）；（请求头：%s）；（请求体：%s）'
+                                  % (e, url, kwargs['headers'], kwargs['data']))
+                else:
+                    await asyncio.sleep(retry_interval)
+            else:
+                response = requests.models.Response()
+                response.status_code = aio_response.status
+                response.reason = aio_response.reason
+                response.headers = requests.structures.CaseInsensitiveDict(aio_response.headers)
+                response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+                response.url = str(aio_response.url)
+                response._content = content
+                if cache is not None:
+                    if response.status_code == 304 and entry is not None:
+                        response = cache.response(cache.revalidate(key, entry, response))
+                    else:
+                        cache.put(key, response, ttl, kwargs['headers'])
+                return response
+
+    async def __repetition_json(self, url, interval_=1, retry_=3, **kwargs):
+        """
+        与非业务公共函数repetition_json一致，响应数据不是标准json时再次请求，请求成功则返回解析后的json数据
+        :param url:(type=str) 请求地址
+        :param interval_:(type=int) 重试间隔时间（秒），默认1
+        :param retry_:(type=int) 重试次数，默认3
+        :param kwargs:(type=dict) 其余的关键字参数，传参给发起网络请求的函数使用
+        :return json_data:(type=dict,list) 解析后的json数据
+        """
+
+        for i in range(retry_):
+            response = await self.__request(url, **kwargs)
+            try:
+                json_data = cf.json_loads(response.content.decode())
+            except ValueError as e:
+                if i == retry_ - 1:
+                    raise e
+                else:
+                    await asyncio.sleep(interval_)
+            else:
+                return json_data
+
+    async def __web(self, kwargs):
+        """
+        发起网络请求，获取响应数据，参数与下载器的web方式一致
+        :param kwargs:(type=dict) 下载信息
+        :return response:(type=requests.Response,dict,list) 发起网络请求获取到的响应数据
+        """
+
+        # 校验有没有url参数
+        if kwargs.get('url') is None:
+            raise LackParameter(['url'])
+
+        # 限流保护机制，与下载器一致，先占用同时处理数，再等待令牌，等待期间让出事件循环
+        web_limit = kwargs.get('web_limit')
+        if not isinstance(web_limit, str):
+            response = await self.__fetch(kwargs)
+            return response
+        concurrency = self.__rate_limiter.settings(web_limit, kwargs)[2]
+        slot = None
+        if concurrency is not None:
+            slot = self.__web_slots.setdefault(web_limit, asyncio.Semaphore(concurrency))
+            await slot.acquire()
+        try:
+            if self.__rate_limiter.shared:  # 令牌桶保存在Redis里，交给线程池预支令牌，不阻塞事件循环
+                loop = asyncio.get_running_loop()
+                wait = await loop.run_in_executor(self.__executor, self.__rate_limiter.reserve, web_limit, kwargs)
+            else:
+                wait = self.__rate_limiter.reserve(web_limit, kwargs)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            response = await self.__fetch(kwargs)
+        finally:
+            if slot is not None:
+                slot.release()
+        return response
+
+    async def __fetch(self, kwargs):
+        """
+        发起请求，根据web_type参数返回不同类型的数据，与下载器一致
+        :param kwargs:(type=dict) 下载信息
+        :return response:(type=requests.Response,dict,list) 发起网络请求获取到的响应数据
+        """
+
+        web_type = kwargs.get('web_type', 'json')
+        if web_type == 'json':
+            response = await self.__repetition_json(**kwargs)
+        elif web_type == 'response':
+            response = await self.__request(**kwargs)
+        elif web_type == 'xpath':
+            response = etree.HTML((await self.__request(**kwargs)).text)
+        elif web_type == 'text':
+            response = (await self.__request(**kwargs)).text
+        elif web_type == 'csv':
+            response = cf.analyze_csv((await self.__request(**kwargs)).text)
+        else:
+            raise ParameterError('web_type', ['“json”（解析json后的数据）', '“response”（原生响应对象）', '“xpath”（Element对象）',
+                                              '“text”（响应体文本str）', '“csv”（解析csv后的数据）'])
+        return response
+
+    async def get_response_async(self, request):
+        """
+        发起请求获取响应
+        1.web方式在事件循环里执行
+        2.db等同步方式交给线程池执行下载器的get_response，数据库连接池本身已限制了连接数
+        3.流式下载（stream=True）的web方式同样交给线程池执行，响应体在执行业务代码的线程里遍历时读取，不阻塞事件循环
+        :param request:(type=Request) 即将发起请求的请求对象
+        :return response:(type=Response) 发起请求后获得的响应对象
+        """
+
+        way = request.way.lower()
+        if way == 'web' and not request.kwargs.get('stream'):
+            response = Response(await self.__web(request.kwargs))
+        elif way == 'test':
+            response = Response(request.kwargs.get('test_data'))
+        else:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self.__executor, self.get_response, request)
+        return response
@@ -0,0 +1,236 @@
+"""
+异步引擎组件：
+1.与引擎使用完全相同的建造器、管道、中间件规范，业务代码不需要做任何修改
+2.请求任务在事件循环里调度，web方式的网络请求在事件循环里等待，同时处理的请求数不再受线程数限制
+3.中间件、解析函数、管道等同步的业务代码交给线程池执行，不阻塞事件循环
+4.收到终止信号后与引擎一致，不再调度新的请求任务，处理中的任务超过截止时间仍未完成则取消
+"""
+
+import asyncio
+from functools import partial
+from time import perf_counter, monotonic
+from concurrent.futures import ThreadPoolExecutor
+from .engine import Engine
+from .async_downloader import AsyncDownloader
+from framework.error.check_error import CheckUnPass
+from utils import common_function as cf
+from config import F_max_async, F_async_max, F_async_io, F_worker_timeout
+
+
+class AsyncEngine(Engine):
+    """
+    异步引擎组件
+    """
+
+    def __init__(self):
+        """
+        初始配置，组件、中间件的初始化与引擎一致
+        """
+
+        super().__init__()
+        self.__loop = asyncio.new_event_loop()  # 事件循环，各轮引擎循环启动共用
+        self.__executor = None  # 执行同步业务代码的线程池，校验过配置后再创建
+        self.__io_executor = None  # 执行同步下载方式的线程池
+        self.__downloader = None  # 异步下载器
+        self.__new_request = None  # 调度器有新请求对象的事件，需要在事件循环里创建
+        self.__abandoned = set()  # 收到终止信号停止时仍未完成的任务（包括添加起始请求），关闭时取消
+
+    def _pipelined(self):
+        """
+        异步引擎在事件循环里按引擎循环启动调度，只使用全局统一的循环启动
+        :return result:(type=bool) 是否按业务推进
+        """
+
+        return False
+
+    def _add_request(self, request, builder_name, block=True):
+        """
+        添加请求任务后，唤醒事件循环进行调度
+        :param request:(type=Request) 请求对象
+        :param builder_name:(type=str) 业务名称
+        :param block:(type=bool) 调度器达到上限时是否阻塞等待，默认True
+        :return result:(type=bool) 是否已添加
+        """
+
+        result = super()._add_request(request, builder_name, block)
+        if result:
+            self.__loop.call_soon_threadsafe(self.__new_request.set)
+        return result
+
+    def _release_target(self, request, latency=None, error=False):
+        """
+        归还目标的并发名额后，有请求对象可以出队时唤醒事件循环进行调度，在事件循环里调用
+        :param request:(type=Request) 从调度器获取的请求对象
+        :param latency:(type=float) 下载耗时（单位：秒），默认None没有下载，只归还名额
+        :param error:(type=bool) 下载是否出错，默认False
+        :return result:(type=bool) 是否唤醒了调度器
+        """
+
+        result = super()._release_target(request, latency, error)
+        if result:
+            self.__new_request.set()
+        return result
+
+    def _wake(self):
+        """
+        收到终止信号或停止时，同时唤醒事件循环，重新判断是否停止
+        """
+
+        super()._wake()
+        if self.__new_request is not None:
+            self.__loop.call_soon_threadsafe(self.__new_request.set)
+
+    @staticmethod
+    def __set_done(future):
+        """
+        在事件循环里标记数据对象批次已全部处理完成
+        :param future:(type=Future) 等待批次完成的future
+        """
+
+        if not future.done():
+            future.set_result(None)
+
+    async def __execute_request_response_item(self, request):
+        """
+        处理一个请求任务，流程与引擎一致
+        开启管道阶段时，任务等待该响应对象的数据对象全部处理完成后才结束，同时处理的任务数同样受F_async_max限制
+        :param request:(type=Request) 从调度器获取的请求对象
+        """
+
+        loop = asyncio.get_running_loop()
+        builder_name = request.builder_name  # 业务名称
+        parse_name = request.parse  # 解析函数
+        claimed_request = request  # 从调度器获取的请求对象，处理完成后交回调度器确认
+        abandoned = False  # 是否因收到终止信号停止而被取消
+        batch = self._new_batch()
+        try:
+            request = await loop.run_in_executor(self.__executor, self._prepare_request, request, builder_name)
+            begin = perf_counter()
+            try:
+                response = await self.__downloader.get_response_async(request)
+            except Exception as e:  # 下载过程中出错，把原生错误对象与请求对象交回给建造器处理
+                self._release_target(claimed_request, perf_counter() - begin, error=True)
+                await loop.run_in_executor(self.__executor, self._download_error, e, request, builder_name)
+                return
+            self._release_target(claimed_request, perf_counter() - begin)
+            self._timing('download', builder_name, request.way, begin)
+            await loop.run_in_executor(self.__executor, self._handle_response, response, request, builder_name,
+                                       parse_name, batch)
+
+        # 无论是正常执行还是报错，都需要完成响应，否则引擎会一直卡死
+        # 收到终止信号停止时被取消的任务已放弃，不确认也不计入完成响应（Redis调度器里的请求对象超时后重新入队）
+        except asyncio.CancelledError:
+            abandoned = True
+            raise
+        except Exception as e:
+            await loop.run_in_executor(self.__executor, self._handle_error, e, builder_name, parse_name)
+        finally:
+            self._release_target(claimed_request)  # 下载前出错或被取消时归还目标的并发名额
+            if not abandoned:
+                if batch is not None:
+                    done = loop.create_future()
+                    batch.finish(partial(loop.call_soon_threadsafe, self.__set_done, done))
+                    await done
+                if self._scheduler.distributed:
+                    await loop.run_in_executor(self.__executor, self._scheduler.ack, claimed_request)
+                else:
+                    self._scheduler.ack(claimed_request)
+                self._statistics('response', builder_name)
+
+    async def __run_stage(self, request_type):
+        """
+        一次引擎循环启动的调度循环
+        1.起始请求交给线程池添加，添加过程中产生的请求对象会立即调度
+        2.同时处理的请求任务数不超过F_async_max，有任务完成或调度器有新请求对象时再继续调度
+        3.开启管道阶段时，管道积压中暂不调度新的请求任务，积压的数据对象所属的任务完成后再继续调度
+        4.起始请求已全部添加、没有处理中的任务且调度器为空时，该次循环启动完成
+        5.分布式调度器的请求对象可能由其他节点添加，需定时从调度器获取，并以所有节点的统计判断是否完成
+        6.收到终止信号后调度器暂停出队，处理中的任务全部完成或超过截止时间即停止，不再等待起始请求添加完成
+        :param request_type:(type=str) 引擎循环启动的类型
+        """
+
+        loop = asyncio.get_running_loop()
+        if self.__new_request is None:
+            self.__new_request = asyncio.Event()
+            await self.__downloader.open()
+        start_future = loop.run_in_executor(self.__executor, self._start_request, request_type)
+        running = set()
+        distributed = self._scheduler.distributed
+        timeout = F_worker_timeout if distributed else None
+        while True:
+            self.__new_request.clear()
+            while len(running) < F_async_max and self._wait_pipeline(0):  # 管道阶段积压中则暂不调度新的请求任务
+                request = self._scheduler.get_request()
+                if request is None:
+                    break
+                running.add(loop.create_task(self.__execute_request_response_item(request)))
+            deadline = self._stop_deadline()
+            if deadline is not None and (not running or monotonic() >= deadline):
+                self.__abandoned = running if start_future.done() else running | {start_future}
+                break
+            if start_future.done() and not running and (not distributed or self._is_finish()):
+                start_future.result()  # 添加起始请求时的框架级错误在此抛出
+                break
+
+            # 等待任一任务完成、起始请求添加完成或调度器有新请求对象
+            waiters = set(running)
+            if not start_future.done():
+                waiters.add(start_future)
+            new_request = loop.create_task(self.__new_request.wait())
+            waiters.add(new_request)
+            wait_timeout = timeout
+            if deadline is not None:
+                remaining = max(0, deadline - monotonic())
+                wait_timeout = remaining if timeout is None else min(timeout, remaining)
+            done, pending = await asyncio.wait(waiters, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not new_request.done():
+                new_request.cancel()
+            running -= done
+
+    def _start_engine(self, request_type):
+        """
+        调用组件，框架运作
+        :param request_type:(type=str) 引擎循环启动的类型
+        """
+
+        # 循环启动初始化
+        self._init_stage(request_type)
+
+        # 第一次循环启动引擎才做校验，校验通过则创建线程池与异步下载器
+        if self.__executor is None:
+            for name, value in (('F_max_async', F_max_async), ('F_async_max', F_async_max),
+                                ('F_async_io', F_async_io)):
+                if not isinstance(value, int) or value < 1:
+                    raise CheckUnPass('配置config中的%s不为int类型或小于1，请修改！' % name)
+            self.__executor = ThreadPoolExecutor(F_max_async)
+            self.__io_executor = ThreadPoolExecutor(F_async_io)
+            self.__downloader = AsyncDownloader(self.__io_executor, limit=F_async_max, rate_limiter=self._rate_limiter,
+                                                http_cache=self._http_cache)
+            cf.print_log('异步引擎同时处理请求数上限%s，执行业务代码线程数%s，执行同步下载方式线程数%s！' % (
+                F_async_max, F_max_async, F_async_io))
+
+        # 调度器有上限时，添加请求对象的是执行业务代码的线程，防止其全部阻塞
+        self._scheduler.set_consumers(F_max_async)
+
+        # 在事件循环里调度，完成后收尾
+        self.__loop.run_until_complete(self.__run_stage(request_type))
+        self._finish_stage()
+
+    def _close_workers(self):
+        """
+        引擎真正结束后，关闭异步下载器、线程池与事件循环
+        收到终止信号停止时，先取消仍未完成的任务，线程池里执行中的业务代码不再等待
+        """
+
+        if self.__abandoned:
+            for task in self.__abandoned:
+                task.cancel()
+            self.__loop.run_until_complete(asyncio.gather(*self.__abandoned, return_exceptions=True))
+        super()._close_workers()
+        if self.__downloader is not None:
+            self.__loop.run_until_complete(self.__downloader.close())
+        if self.__executor is not None:
+            wait = self._stop_deadline() is None
+            self.__executor.shutdown(wait=wait)
+            self.__io_executor.shutdown(wait=wait)
+        self.__loop.close()
@@ -59,6 +59,29 @@ class Builder(object):
     # 如果要启用替换华为os功能，则为os_hw，例：{"register": ["os_hw"]}
     pegging_field = None
 
+    # 调度权重
+    # 继承类后可重写该属性，必须为大于等于1的整数，不重写则默认1
+    # config里的F_builder_weight配置了该业务时，以config为准
+    # 调度器里每个业务一个子队列，子队列之间按权重轮流出队，所有业务权重相同即为轮询
+    # 例：权重为3的业务与权重为1的业务同时有请求对象等待时，前者每出队3个，后者出队1个
+    weight = 1
+
+    # 并发上限
+    # 继承类后可重写该属性，必须为None或大于等于1的整数，不重写则默认None不限制
+    # 即该业务同时处理中的请求数上限，达到上限后该业务的请求对象暂不出队，工作线程优先处理其他业务的请求
+    # 可防止某个请求多、响应慢的业务占满所有工作线程，让其他业务的请求长时间等待甚至超时
+    # config里的F_builder_async配置了该业务时，以config为准
+    max_async = None
+
+    # 是否把解析函数交给进程池执行
+    # 继承类后可重写该属性，True为使用，False为不使用，不重写则默认不使用
+    # 适用于解析函数有大量纯Python计算（格式化时间、构造字典、反查IP等），在线程池里受GIL限制的业务
+    # 启用后只有解析函数在子进程执行，下载与管道依然在主进程的线程里执行，因此：
+    # 1.响应对象的data与meta、解析函数yield的请求对象与数据对象都必须能被pickle序列化，例如meta里不能带Lock
+    # 2.子进程会重新初始化业务建造器并加载公共服务，解析函数对建造器实例属性的修改不会同步回主进程
+    # 3.解析函数yield的所有对象会在解析完成后一并交回主进程，再由主进程交给调度器或管道
+    process_parse = False
+
     @staticmethod
     def request(*args, **kwargs):
         """
@@ -0,0 +1,179 @@
+"""
+检查点组件：
+1.引擎定时把运行状态写入检查点文件：每个业务当前的引擎循环启动编号、等待中与处理中的请求对象、统计计数与去重过滤器
+2.中断后以相同的脚本传参加上--resume重新运行，从检查点恢复，不再从start_requests重新开始
+3.检查点文件按采集标识（与Redis调度器一致）命名，正常结束后删除
+4.处理中的请求对象也会写入检查点，恢复后重新处理，因此同一个请求对象可能被处理两次（至少一次），管道入库需能容忍重复
+5.meta等属性里带有无法序列化对象（比如线程锁）的请求对象不写入检查点，该业务恢复时重新执行当前的引擎循环启动（重新添加起始请求）
+6.磁盘调度器溢出到磁盘的请求对象不读出，检查点只引用分段文件与读取范围（在检查点目录里创建硬链接），检查点文件只有内存里的部分
+"""
+
+import os
+import uuid
+import shutil
+import pickle
+from .disk_scheduler import SpillQueue
+from utils import common_function as cf
+
+
+class Checkpoint(object):
+    """
+    检查点组件
+    """
+
+    def __init__(self, path, run_key):
+        """
+        初始配置
+        :param path:(type=str) 存放检查点文件的目录
+        :param run_key:(type=str) 采集标识
+        """
+
+        self.__file = os.path.join(path, 'checkpoint_%s.pkl' % run_key)
+        self.__dir = os.path.join(path, 'checkpoint_%s' % run_key)  # 存放引用的分段文件的目录
+        self.__restart = set()  # 上一次写入时需要重新执行当前任务的业务，变化时才播报
+        self.__token = uuid.uuid4().hex[:8]  # 本次运行引用的分段文件名前缀，不与上一次运行的重名
+        self.__times = 0  # 引用分段文件的次数，分段文件名带上，区分每次写入
+
+    @property
+    def file(self):
+        """
+        检查点文件路径
+        :return file:(type=str) 文件路径
+        """
+
+        return self.__file
+
+    def dumps_requests(self, requests):
+        """
+        按业务序列化请求对象，业务只要有一个请求对象无法序列化，该业务的请求对象都不写入检查点
+        :param requests:(type=list) 请求对象
+        :return result:(type=dict) 业务名称为key，序列化后的请求对象列表为value
+        :return restart:(type=set) 恢复时需要重新执行当前任务的业务
+        """
+
+        result, restart = dict(), set()
+        for request in requests:
+            builder_name = request.builder_name
+            if builder_name in restart:
+                continue
+            try:
+                data = pickle.dumps(request, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                restart.add(builder_name)
+                result.pop(builder_name, None)
+            else:
+                result.setdefault(builder_name, list()).append(data)
+        if restart - self.__restart:
+            cf.print_log('业务%s有无法序列化的请求对象（比如meta里带有线程锁），从检查点恢复时将重新执行当前任务！' % '、'.join(
+                sorted(restart - self.__restart)))
+        self.__restart = restart
+        return result, restart
+
+    def link_segments(self, segments):
+        """
+        引用磁盘调度器的分段文件，在调度器的锁外调用（分段文件已被调度器引用，读完也不会删除）
+        1.在检查点目录里创建硬链接，不复制数据；无法创建硬链接（比如不在同一个文件系统）时复制读取范围内的数据
+        2.文件名带上本次的序号，写入检查点后删除上一次的
+        :param segments:(type=dict) 业务名称为key，(分段文件与读取范围, 请求对象数)为value
+        :return result:(type=dict) 业务名称为key，(检查点目录里的文件名与读取范围, 请求对象数)为value
+        """
+
+        self.__times += 1
+        result = dict()
+        for builder_name, (files, count) in segments.items():
+            if not count:
+                continue
+            os.makedirs(self.__dir, exist_ok=True)
+            linked = list()
+            for path, start, end in files:
+                name = '%s_%s_%s' % (self.__token, self.__times, os.path.basename(path))
+                try:
+                    os.link(path, os.path.join(self.__dir, name))
+                except OSError:
+                    self.__copy(path, os.path.join(self.__dir, name), start, end)
+                    start, end = 0, None
+                linked.append((name, start, end))
+            result[builder_name] = (linked, count)
+        return result
+
+    @staticmethod
+    def __copy(source, target, start, end):
+        """
+        复制分段文件读取范围内的数据
+        :param source:(type=str) 分段文件路径
+        :param target:(type=str) 复制到的文件路径
+        :param start:(type=int) 起始位置
+        :param end:(type=int) 结束位置，None为到文件末尾
+        """
+
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            src.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                data = src.read(1024 * 1024 if remaining is None else min(1024 * 1024, remaining))
+                if not data:
+                    break
+                dst.write(data)
+                if remaining is not None:
+                    remaining -= len(data)
+
+    def check_segments(self, files):
+        """
+        从检查点恢复前，检查引用的分段文件是否都还在
+        :param files:(type=list) 检查点目录里的文件名与读取范围
+        """
+
+        for name, start, end in files:
+            path = os.path.join(self.__dir, name)
+            if os.path.getsize(path) < (start if end is None else end):
+                raise EOFError('检查点引用的分段文件%s不完整！' % path)
+
+    def read_segments(self, files):
+        """
+        按顺序读取检查点引用的分段文件里的请求对象
+        :param files:(type=list) 检查点目录里的文件名与读取范围
+        :return requests:(type=generator) 请求对象
+        """
+
+        for name, start, end in files:
+            yield from SpillQueue.read(os.path.join(self.__dir, name), start, end)
+
+    def save(self, state):
+        """
+        写入检查点，先写临时文件再替换，写入过程中中断也不会损坏上一个检查点
+        替换后删除不再被引用的分段文件（上一次写入时引用的）
+        :param state:(type=dict) 引擎的运行状态
+        """
+
+        os.makedirs(os.path.dirname(self.__file), exist_ok=True)
+        temporary = '%s.tmp' % self.__file
+        with open(temporary, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.__file)
+        if os.path.isdir(self.__dir):
+            names = {name for files, count in state['segments'].values() for name, start, end in files}
+            for name in os.listdir(self.__dir):
+                if name not in names:
+                    os.remove(os.path.join(self.__dir, name))
+
+    def load(self):
+        """
+        读取检查点
+        :return state:(type=dict,None) 引擎的运行状态，没有检查点文件则为None
+        """
+
+        if not os.path.exists(self.__file):
+            return None
+        with open(self.__file, 'rb') as f:
+            state = pickle.load(f)
+        return state
+
+    def remove(self):
+        """
+        引擎正常结束后删除检查点文件与引用的分段文件
+        """
+
+        for file in (self.__file, '%s.tmp' % self.__file):
+            if os.path.exists(file):
+                os.remove(file)
+        shutil.rmtree(self.__dir, ignore_errors=True)
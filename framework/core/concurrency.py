@@ -0,0 +1,192 @@
+"""
+自适应并发控制器：
+1.按采集方式与目标（db方式为db_name，web方式为url的域名）分别控制同时下载的请求数，其余采集方式不控制
+2.每完成一批（窗口）下载统计一次耗时分位数与下载出错率，加性增、乘性减（AIMD）调整并发上限
+3.出错率超过阈值，或耗时的90分位数超过基准耗时的倍数，并发上限减半；否则该批下载期间并发曾达到上限，则并发上限加1
+4.每个目标从并发1开始慢启动，第一次减半前并发上限翻倍增长，保证基准耗时在目标空闲时测得
+5.基准耗时取各批下载耗时的中位数的较小值，并逐批缓慢上调，目标长期变慢后会成为新的基准
+6.作为调度器的出队闸门，目标达到并发上限时调度器出队跳过该目标的请求对象，工作线程不阻塞等待，也不占用已出队的请求对象与业务并发
+"""
+
+from threading import Lock
+from urllib.parse import urlsplit
+
+
+class ConcurrencyController(object):
+    """
+    自适应并发控制器
+    """
+
+    def __init__(self, maximum, window=20, latency_factor=2.0, error_rate=0.1):
+        """
+        初始配置
+        :param maximum:(type=int) 每个目标的并发上限最大值
+        :param window:(type=int) 每完成多少个下载调整一次并发上限，默认20
+        :param latency_factor:(type=float) 耗时的90分位数超过基准耗时的多少倍视为变慢，默认2.0
+        :param error_rate:(type=float) 下载出错率超过多少视为出错过多，默认0.1
+        """
+
+        self.__maximum = maximum
+        self.__window = window
+        self.__latency_factor = latency_factor
+        self.__error_rate = error_rate
+        self.__lock = Lock()
+        self.__limits = dict()  # 目标的并发上限
+        self.__running = dict()  # 目标正在下载的请求数
+        self.__saturated = dict()  # 目标在该批下载期间并发是否曾达到上限
+        self.__latencies = dict()  # 目标在该批下载的耗时
+        self.__errors = dict()  # 目标在该批下载的出错数
+        self.__baselines = dict()  # 目标的基准耗时
+        self.__slow_start = set()  # 已结束慢启动的目标
+        self.__ranges = dict()  # 目标的并发上限曾经的最小值与最大值
+        self.__claimed = dict()  # 已占用并发名额的请求对象，内存地址为key，目标为value，归还时使用
+
+    @staticmethod
+    def target(request):
+        """
+        获取请求对象的控制目标
+        :param request:(type=Request) 即将下载的请求对象
+        :return key:(type=tuple) 采集方式与目标，不控制的采集方式返回None
+        """
+
+        way = request.way.lower()
+        if way == 'db':
+            key = (way, str(request.kwargs.get('db_name')))
+        elif way == 'web':
+            key = (way, urlsplit(str(request.kwargs.get('url'))).netloc)
+        else:
+            key = None
+        return key
+
+    def admit(self, request):
+        """
+        调度器出队前判断请求对象的目标是否未达到并发上限，达到则记录该批下载期间并发曾达到上限
+        :param request:(type=Request) 子队列里即将出队的请求对象
+        :return result:(type=bool) 是否可以出队，不控制的采集方式总是为True
+        """
+
+        key = self.target(request)
+        if key is None:
+            return True
+        with self.__lock:
+            result = self.__admit(key)
+        return result
+
+    def __admit(self, key):
+        """
+        判断目标是否未达到并发上限，调用方需持有锁
+        :param key:(type=tuple) 采集方式与目标
+        :return result:(type=bool) 是否未达到
+        """
+
+        limit = self.__limits.setdefault(key, 1)
+        self.__ranges.setdefault(key, [limit, limit])
+        result = self.__running.get(key, 0) < limit
+        if not result:
+            self.__saturated[key] = True
+        return result
+
+    def acquire(self, request):
+        """
+        请求对象出队时占用目标的一个并发名额，不阻塞等待，调用方需已确认admit为True
+        :param request:(type=Request) 出队的请求对象，下载完成后同一个请求对象交回release
+        """
+
+        key = self.target(request)
+        if key is None:
+            return
+        with self.__lock:
+            self.__admit(key)
+            self.__take(key, request)
+
+    def try_acquire(self, request):
+        """
+        目标未达到并发上限则占用一个并发名额，供不经过admit判断就取出请求对象的调度器（比如Redis调度器）使用
+        :param request:(type=Request) 取出的请求对象
+        :return result:(type=bool) 是否已占用，不控制的采集方式总是为True
+        """
+
+        key = self.target(request)
+        if key is None:
+            return True
+        with self.__lock:
+            result = self.__admit(key)
+            if result:
+                self.__take(key, request)
+        return result
+
+    def __take(self, key, request):
+        """
+        占用目标的一个并发名额，调用方需持有锁
+        :param key:(type=tuple) 采集方式与目标
+        :param request:(type=Request) 请求对象
+        """
+
+        self.__running[key] = self.__running.get(key, 0) + 1
+        if self.__running[key] >= self.__limits[key]:
+            self.__saturated[key] = True
+        self.__claimed[id(request)] = key
+
+    def release(self, request, latency=None, error=False):
+        """
+        下载完成后归还目标的并发名额，并记录耗时与是否出错，每完成一批下载调整一次并发上限
+        1.没有下载（比如下载前出错）时只归还名额，不记录耗时
+        2.已归还过或不控制的请求对象直接返回，因此可以在处理完成时再调用一次兜底
+        :param request:(type=Request) 出队时占用了名额的请求对象
+        :param latency:(type=float) 下载耗时（单位：秒），默认None没有下载
+        :param error:(type=bool) 下载是否出错，默认False
+        :return result:(type=bool) 是否可能有因目标达到并发上限而暂不出队的请求对象可以出队了
+        """
+
+        with self.__lock:
+            key = self.__claimed.pop(id(request), None)
+            if key is None:
+                return False
+            limit = self.__limits[key]
+            result = self.__running[key] >= limit
+            self.__running[key] -= 1
+            if latency is not None:
+                latencies = self.__latencies.setdefault(key, list())
+                latencies.append(latency)
+                self.__errors[key] = self.__errors.get(key, 0) + bool(error)
+                if len(latencies) >= self.__window:
+                    self.__adjust(key)
+                    result = result or self.__limits[key] > limit
+        return result
+
+    def __adjust(self, key):
+        """
+        根据该批下载的耗时分位数与出错率调整目标的并发上限，调用方需持有锁
+        :param key:(type=tuple) 采集方式与目标
+        """
+
+        latencies = sorted(self.__latencies.pop(key))
+        errors = self.__errors.pop(key)
+        saturated = self.__saturated.pop(key, False)
+        p50 = latencies[len(latencies) // 2]
+        p90 = latencies[int(len(latencies) * 0.9)]
+        baseline = self.__baselines.get(key)
+
+        # 1.出错过多或变慢，乘性减并结束慢启动；并发曾达到上限，慢启动时翻倍，否则加性增
+        limit = self.__limits[key]
+        if errors / len(latencies) > self.__error_rate or (baseline and p90 > baseline * self.__latency_factor):
+            limit = max(1, limit // 2)
+            self.__slow_start.add(key)
+        elif saturated:
+            limit = min(self.__maximum, limit + 1 if key in self.__slow_start else limit * 2)
+        self.__limits[key] = limit
+        ranges = self.__ranges[key]
+        ranges[0], ranges[1] = min(ranges[0], limit), max(ranges[1], limit)
+
+        # 2.更新基准耗时，取较小值并每批上调5%
+        self.__baselines[key] = p50 if baseline is None else min(p50, baseline * 1.05)
+
+    def limits(self):
+        """
+        获取各目标的并发上限
+        :return limits:(type=dict) 采集方式与目标为key，value为（当前并发上限, 最小值, 最大值）
+        """
+
+        with self.__lock:
+            limits = {key: (limit, *self.__ranges[key]) for key, limit in self.__limits.items()}
+        return limits
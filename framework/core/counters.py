@@ -0,0 +1,78 @@
+"""
+引擎统计计数器：
+1.每个线程有一份自己的计数（条带），计数时只修改本线程的条带，不需要加锁
+2.读取时把所有线程的条带加起来，读取不阻塞计数，可以频繁用于判断完成与播报进度
+3.每个计数只增不减（除非主动修改），因此先读响应数、再读请求数即可保证判断完成时不会过早关闭
+"""
+
+from threading import Lock, local
+
+
+class Counters(object):
+    """
+    引擎统计计数器
+    """
+
+    def __init__(self, *names):
+        """
+        初始配置
+        :param names:(type=tuple) 计数的名称
+        """
+
+        self.__index = {name: i for i, name in enumerate(names)}  # 计数名称对应条带里的下标
+        self.__base = [0] * len(names)  # 主动修改计数时的修正值
+        self.__stripes = list()  # 所有线程的条带
+        self.__local = local()
+        self.__lock = Lock()  # 只在新线程第一次计数、主动修改计数时使用
+
+    def __stripe(self):
+        """
+        获取本线程的条带，第一次计数时创建并登记
+        :return stripe:(type=list) 条带
+        """
+
+        stripe = getattr(self.__local, 'stripe', None)
+        if stripe is None:
+            stripe = self.__local.stripe = [0] * len(self.__index)
+            with self.__lock:
+                self.__stripes.append(stripe)
+        return stripe
+
+    def incr(self, name, amount=1):
+        """
+        计数，只修改本线程的条带
+        :param name:(type=str) 计数的名称
+        :param amount:(type=int) 增量，默认1
+        """
+
+        self.__stripe()[self.__index[name]] += amount
+
+    def get(self, name):
+        """
+        读取计数，为所有线程的条带之和
+        :param name:(type=str) 计数的名称
+        :return value:(type=int) 计数
+        """
+
+        i = self.__index[name]
+        value = self.__base[i] + sum([stripe[i] for stripe in self.__stripes])
+        return value
+
+    def set(self, name, value):
+        """
+        主动修改计数，只应在没有线程计数时使用
+        :param name:(type=str) 计数的名称
+        :param value:(type=int) 修改后的计数
+        """
+
+        with self.__lock:
+            self.__base[self.__index[name]] += value - self.get(name)
+
+    def snapshot(self):
+        """
+        读取所有计数
+        :return snapshot:(type=dict) 计数的名称为key，计数为value
+        """
+
+        snapshot = {name: self.get(name) for name in self.__index}
+        return snapshot
@@ -0,0 +1,426 @@
+"""
+磁盘调度器组件：
+1.与调度器的调度规则一致，每个业务的子队列只在内存里保留少量请求对象（队头），其余的溢出写入磁盘
+2.溢出的请求对象按先进先出追加写入分段文件，读完的分段文件即时删除，内存占用不随积压的请求对象数增长
+3.适合长时间跨度补数据等一次性产生大量请求对象的场景
+4.每个优先级一条通道（各自的内存队头与分段文件），优先级高的通道先出队，带优先级的请求对象同样溢出写入磁盘
+5.设置了出队闸门时内存队头按目标分组，出队时可越过达到并发上限的目标，内存队头不足一半时即从磁盘补充，越过的范围保持在队头上限附近
+6.请求对象添加时即在锁外序列化，无法序列化的请求对象（比如meta里带有数据库连接）直接拒绝并记录错误日志，不打乱先进先出
+7.写入检查点时只引用分段文件与读取范围，不读出磁盘里的请求对象，引用期间读完的分段文件暂不删除
+"""
+
+import os
+import shutil
+import pickle
+import services
+from bisect import insort
+from struct import Struct
+from collections import deque
+from itertools import count
+from .scheduler import Scheduler, MemoryQueue
+from framework.object.request import Request
+from framework.error.check_error import CheckUnPass
+
+_header = Struct('>IQ')  # 每条记录前的长度与入队序号
+_segment_size = 64 * 1024 * 1024  # 单个分段文件的大小上限（字节）
+_dir_count = count()  # 同一进程里多个磁盘调度器的目录序号
+
+
+def _dumps(request):
+    """
+    序列化请求对象，只保存必要的属性
+    :param request:(type=Request) 请求对象
+    :return data:(type=bytes) 序列化后的数据
+    """
+
+    extra = {k: v for k, v in request.__dict__.items() if k not in ('way', 'parse', 'meta', 'priority', 'kwargs')}
+    data = pickle.dumps((request.way, request.parse, request.meta, request.priority, request.kwargs, extra),
+                        pickle.HIGHEST_PROTOCOL)
+    return data
+
+
+def _loads(data):
+    """
+    反序列化请求对象
+    :param data:(type=bytes) 序列化后的数据
+    :return request:(type=Request) 请求对象
+    """
+
+    way, parse, meta, priority, kwargs, extra = pickle.loads(data)
+    request = Request(way, parse=parse, meta=meta, priority=priority, **kwargs)
+    request.__dict__.update(extra)
+    return request
+
+
+class SpillLane(object):
+    """
+    磁盘子队列里同一优先级的通道，内存队头 + 磁盘分段文件，先进先出
+    """
+
+    def __init__(self, path, head_size, key=None):
+        """
+        初始配置
+        :param path:(type=str) 分段文件路径前缀
+        :param head_size:(type=int) 内存队头的请求对象数上限
+        :param key:(type=function) 内存队头按目标分组用的函数，默认None不分组
+        """
+
+        self.__path = path
+        self.__head_size = head_size
+        self.__head = MemoryQueue(key)  # 内存队头
+        self.__segments = deque()  # 未读完的分段文件路径，最后一个为正在写入的分段文件
+        self.__segment_num = 0  # 分段文件序号
+        self.__writer = None  # 正在写入的分段文件
+        self.__reader = None  # 正在读取的分段文件
+        self.__disk = 0  # 磁盘里的请求对象数
+        self.__pinned = 0  # 写入检查点时引用分段文件的次数，大于0时读完的分段文件暂不删除
+        self.__garbage = list()  # 引用期间读完的分段文件，解除引用后删除
+
+    def __write(self, count_, data):
+        """
+        追加写入一条记录，当前分段文件超过大小上限则新开一个
+        :param count_:(type=int) 入队序号
+        :param data:(type=bytes) 序列化后的数据
+        """
+
+        if self.__writer is None or self.__writer.tell() >= _segment_size:
+            if self.__writer is not None:
+                self.__writer.close()
+            path = '%s_%s.seg' % (self.__path, self.__segment_num)
+            self.__segment_num += 1
+            self.__writer = open(path, 'wb')
+            self.__segments.append(path)
+        self.__writer.write(_header.pack(len(data), count_))
+        self.__writer.write(data)
+        self.__disk += 1
+
+    def __refill(self):
+        """
+        内存队头不足一半时，从磁盘读取一批请求对象放回内存队头，让出队时可越过的请求对象保持在队头上限附近
+        """
+
+        if not self.__disk or len(self.__head) > self.__head_size // 2:
+            return
+        self.__writer.flush()
+        while len(self.__head) < self.__head_size and self.__disk:
+            if self.__reader is None:
+                self.__reader = open(self.__segments[0], 'rb')
+            header = self.__reader.read(_header.size)
+
+            # 读完一个分段文件（肯定不是正在写入的分段文件），删除后继续读下一个
+            if len(header) < _header.size:
+                self.__reader.close()
+                self.__reader = None
+                self.__remove(self.__segments.popleft())
+                continue
+            size, count_ = _header.unpack(header)
+            request = _loads(self.__reader.read(size))
+            self.__head.push(request.priority, count_, request)
+            self.__disk -= 1
+
+        # 磁盘里的请求对象已全部读出，删除所有分段文件，下次溢出重新写入
+        if not self.__disk:
+            self.__close_files()
+
+    def __close_files(self):
+        """
+        关闭并删除所有分段文件
+        """
+
+        for file in (self.__reader, self.__writer):
+            if file is not None:
+                file.close()
+        self.__reader, self.__writer = None, None
+        while self.__segments:
+            self.__remove(self.__segments.popleft())
+
+    def __remove(self, path):
+        """
+        删除读完的分段文件，写入检查点引用期间则等解除引用后再删除
+        :param path:(type=str) 分段文件路径
+        """
+
+        if self.__pinned:
+            self.__garbage.append(path)
+        else:
+            os.remove(path)
+
+    def push(self, count_, request, data=None):
+        """
+        请求对象入队
+        1.磁盘里没有请求对象且内存队头未满时，放入内存队头
+        2.磁盘里已有请求对象时，为保证先进先出，同样写入磁盘
+        :param count_:(type=int) 入队序号
+        :param request:(type=Request) 请求对象
+        :param data:(type=bytes) 添加时已序列化的数据，默认None则需要写入磁盘时再序列化（从检查点恢复的请求对象）
+        """
+
+        if not self.__disk and len(self.__head) < self.__head_size:
+            self.__head.push(request.priority, count_, request)
+        else:
+            self.__write(count_, data if data is not None else _dumps(request))
+
+    def pop(self, admit=None):
+        """
+        请求对象出队，调用前需确保通道里有可以出队的请求对象
+        :param admit:(type=function) 判断请求对象能否出队的函数，默认None
+        :return request:(type=Request) 请求对象
+        """
+
+        self.__refill()
+        request = self.__head.pop(admit)
+        return request
+
+    def peek(self, admit=None):
+        """
+        获取下一个出队的请求对象，不出队，只在内存队头里找
+        :param admit:(type=function) 判断请求对象能否出队的函数，默认None
+        :return request:(type=Request,None) 请求对象，没有可以出队的则为None
+        """
+
+        self.__refill()
+        request = self.__head.peek(admit)
+        return request
+
+    def requests(self):
+        """
+        按出队顺序获取内存队头里的请求对象，不出队
+        :return requests:(type=list) 请求对象
+        """
+
+        requests = self.__head.requests()
+        return requests
+
+    def pin(self):
+        """
+        写入检查点时引用磁盘里的请求对象，只返回分段文件与读取范围，不读出请求对象
+        1.引用期间读完的分段文件暂不删除，调用unpin解除引用后再删除
+        2.正在写入的分段文件之后追加的记录不在读取范围内
+        :return segments:(type=list) 元素为(分段文件路径, 起始位置, 结束位置)，结束位置为None则读到文件末尾
+        :return count:(type=int) 磁盘里的请求对象数
+        """
+
+        self.__pinned += 1
+        if not self.__disk:
+            return list(), 0
+        self.__writer.flush()
+        segments = list()
+        for i, path in enumerate(self.__segments):
+            start = self.__reader.tell() if i == 0 and self.__reader is not None else 0  # 第一个分段文件可能已读出一部分
+            end = self.__writer.tell() if i == len(self.__segments) - 1 else None
+            segments.append((path, start, end))
+        return segments, self.__disk
+
+    def unpin(self):
+        """
+        解除写入检查点时对分段文件的引用，删除引用期间读完的分段文件
+        """
+
+        self.__pinned -= 1
+        if not self.__pinned:
+            while self.__garbage:
+                os.remove(self.__garbage.pop())
+
+    def close(self):
+        """
+        关闭通道，删除所有分段文件
+        """
+
+        self.__head.close()
+        self.__close_files()
+        self.__disk = 0
+        self.__pinned = 0
+        while self.__garbage:
+            os.remove(self.__garbage.pop())
+
+    def __len__(self):
+        return len(self.__head) + self.__disk
+
+
+class SpillQueue(object):
+    """
+    业务的磁盘子队列，每个优先级一条通道，优先级高的通道先出队
+    """
+
+    def __init__(self, path, head_size, key=None):
+        """
+        初始配置
+        :param path:(type=str) 分段文件路径前缀
+        :param head_size:(type=int) 每条通道的内存队头的请求对象数上限
+        :param key:(type=function) 内存队头按目标分组用的函数，默认None不分组
+        """
+
+        self.__path = path
+        self.__head_size = head_size
+        self.__key = key
+        self.__lanes = dict()  # 优先级为key，通道为value
+        self.__order = list()  # 所有通道的优先级取反后从小到大排列，即出队顺序
+
+    def __first(self, admit=None):
+        """
+        按出队顺序获取第一条有可以出队的请求对象的通道
+        :param admit:(type=function) 判断请求对象能否出队的函数，默认None
+        :return lane:(type=SpillLane,None) 通道，没有则为None
+        """
+
+        for priority in self.__order:
+            lane = self.__lanes[-priority]
+            if len(lane) and (admit is None or lane.peek(admit) is not None):
+                return lane
+
+    def push(self, priority, count_, request, data=None):
+        """
+        请求对象放入其优先级的通道
+        :param priority:(type=int) 优先级
+        :param count_:(type=int) 入队序号
+        :param request:(type=Request) 请求对象
+        :param data:(type=bytes) 添加时已序列化的数据，默认None则需要写入磁盘时再序列化
+        """
+
+        lane = self.__lanes.get(priority)
+        if lane is None:
+            lane = self.__lanes[priority] = SpillLane('%s_p%s' % (self.__path, priority), self.__head_size,
+                                                      self.__key)
+            insort(self.__order, -priority)
+        lane.push(count_, request, data)
+
+    def pop(self, admit=None):
+        """
+        请求对象出队，调用前需确保有可以出队的请求对象
+        :param admit:(type=function) 判断请求对象能否出队的函数，默认None
+        :return request:(type=Request) 请求对象
+        """
+
+        request = self.__first(admit).pop(admit)
+        return request
+
+    def peek(self, admit=None):
+        """
+        获取下一个出队的请求对象，不出队
+        :param admit:(type=function) 判断请求对象能否出队的函数，默认None
+        :return request:(type=Request,None) 请求对象，没有可以出队的则为None
+        """
+
+        lane = self.__first(admit)
+        request = lane.peek(admit) if lane is not None else None
+        return request
+
+    def requests(self):
+        """
+        按出队顺序获取所有通道内存队头里的请求对象，不出队，磁盘里的请求对象见pin函数
+        :return requests:(type=list) 请求对象
+        """
+
+        requests = [request for priority in self.__order for request in self.__lanes[-priority].requests()]
+        return requests
+
+    def pin(self):
+        """
+        写入检查点时引用所有通道磁盘里的请求对象，只返回分段文件与读取范围，不读出请求对象
+        1.按通道的出队顺序排列，恢复时重新入队会回到各自优先级的通道，同一优先级仍先进先出
+        2.调用unpin解除引用
+        :return segments:(type=list) 元素为(分段文件路径, 起始位置, 结束位置)，结束位置为None则读到文件末尾
+        :return count:(type=int) 磁盘里的请求对象数
+        """
+
+        segments, total = list(), 0
+        for priority in self.__order:
+            files, count_ = self.__lanes[-priority].pin()
+            segments.extend(files)
+            total += count_
+        return segments, total
+
+    def unpin(self):
+        """
+        解除写入检查点时对所有通道分段文件的引用
+        """
+
+        for lane in self.__lanes.values():
+            lane.unpin()
+
+    @staticmethod
+    def read(path, start=0, end=None):
+        """
+        按顺序读取分段文件里的请求对象，用于从检查点恢复
+        :param path:(type=str) 分段文件路径
+        :param start:(type=int) 起始位置，默认0
+        :param end:(type=int) 结束位置，默认None读到文件末尾
+        :return requests:(type=generator) 请求对象
+        """
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while end is None or f.tell() < end:
+                header = f.read(_header.size)
+                if len(header) < _header.size:
+                    break
+                yield _loads(f.read(_header.unpack(header)[0]))
+
+    def close(self):
+        """
+        关闭子队列，删除所有分段文件
+        """
+
+        for lane in self.__lanes.values():
+            lane.close()
+
+    def __len__(self):
+        return sum(len(lane) for lane in self.__lanes.values())
+
+
+class DiskScheduler(Scheduler):
+    """
+    磁盘调度器组件
+    """
+
+    def __init__(self, max_size=None, dupe_filter=None, path=None, head_size=10000):
+        """
+        初始配置
+        :param max_size:(type=int) 等待中的请求对象总数上限，与调度器一致，默认None不限制
+        :param dupe_filter:(type=SetFilter,BloomFilter) 去重过滤器，与调度器一致，默认None不去重
+        :param path:(type=str) 存放分段文件的目录，默认None为项目根目录下的temporary目录
+        :param head_size:(type=int) 每个业务的内存队头的请求对象数上限，必须为大于等于1的整数，默认10000
+        """
+
+        if not isinstance(head_size, int) or head_size < 1:
+            raise CheckUnPass('磁盘调度器的内存队头上限必须为大于等于1的整数！')
+        super().__init__(max_size=max_size, dupe_filter=dupe_filter)
+        self.__head_size = head_size
+        path = path if path is not None else os.path.join(os.getcwd(), 'temporary')
+        self.__dir = os.path.join(path, 'scheduler_%s_%s' % (os.getpid(), next(_dir_count)))  # 有业务添加请求对象时才创建
+
+    def _new_queue(self, builder_name):
+        """
+        创建业务的磁盘子队列
+        :param builder_name:(type=str) 业务名称
+        :return queue:(type=SpillQueue) 子队列
+        """
+
+        os.makedirs(self.__dir, exist_ok=True)
+        queue = SpillQueue(os.path.join(self.__dir, builder_name), self.__head_size, self._target)
+        return queue
+
+    def _encode(self, request):
+        """
+        添加请求对象时在锁外序列化，溢出写入磁盘时直接使用，无法序列化的请求对象拒绝添加
+        1.无法序列化的请求对象如果留在内存里，会越过已溢出的请求对象先出队，且不受内存队头上限约束
+        2.因此与Redis调度器一致，直接拒绝并记录错误日志
+        :param request:(type=Request) 请求对象
+        :return data:(type=bytes,bool) 序列化后的数据，无法序列化则为False
+        """
+
+        try:
+            data = _dumps(request)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            services.logger.exception('磁盘调度器无法序列化业务%s的请求对象（%s），已丢弃：%s' % (
+                request.builder_name, request.parse, e))
+            return False
+        return data
+
+    def close(self):
+        """
+        引擎真正结束后，关闭所有子队列并删除存放分段文件的目录
+        """
+
+        super().close()
+        shutil.rmtree(self.__dir, ignore_errors=True)
@@ -4,9 +4,10 @@
 """
 
 from threading import Lock
-from time import sleep
+from contextlib import nullcontext, ExitStack
 from lxml import etree
 from framework.object.response import Response
+from framework.core.rate_limiter import RateLimiter
 from framework.error.check_error import ParameterError, LackParameter, CheckUnPass
 from utils import common_function as cf
 from utils.mongodb import mongodb_operation
@@ -18,14 +19,17 @@ class Downloader(object):
     下载器组件
     """
 
-    def __init__(self):
+    def __init__(self, session_pool=None, rate_limiter=None, http_cache=None):
         """
         下载器不用于继承，每次启动程序只有一个实例，可以直接在init实现初始化
+        :param session_pool:(type=SessionPool) web方式使用的会话池，默认None每次请求都新建连接
+        :param rate_limiter:(type=RateLimiter) web方式使用的限流器，默认None只在本进程内限流且不读取配置
+        :param http_cache:(type=HttpCache) web方式使用的响应缓存，默认None不缓存
         """
 
-        # web方法限流用
-        self.web_lock = dict()  # 存储线程锁
-        self.web_first = set()  # 存储“首跳”
+        self.__session_pool = session_pool
+        self.__http_cache = http_cache
+        self.__rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter  # web方法限流用
 
         # db方法防死锁用
         self.db_lock = dict()
@@ -48,19 +52,11 @@ class Downloader(object):
         # 1.如果请求对象带上web_limit参数，将启动限流保护机制
         # 2.web_limit应该为字符串，是一个唯一标识，建议带上业务名称，可进一步增加唯一性
         # 3.启动限流保护机制后，如first_pass为True，则第一次访问不会阻塞，默认True
-        # 4.根据limit_s阻塞多少秒，应为float或int
+        # 4.每个限流标识一个令牌桶，limit_rate为每秒请求数，没有则按limit_s（默认1）每limit_s秒一个请求，应为float或int
+        # 5.limit_burst为突发上限（令牌桶容量），默认1；limit_concurrency为同时处理的请求数上限，默认不限制
+        # 6.config的F_web_limits可按限流标识覆盖以上参数，等待令牌时不持有锁，同一个限流标识的线程不会互相串行等待
         web_limit = kwargs.get('web_limit')
-        if isinstance(web_limit, str):
-            lock = self.web_lock.setdefault(web_limit, Lock())
-            with lock:
-                limit_s = kwargs.get('limit_s', 1)
-                if kwargs.get('first_pass', True):
-                    if web_limit not in self.web_first:
-                        self.web_first.add(web_limit)
-                    else:
-                        sleep(limit_s)
-                else:
-                    sleep(limit_s)
+        limit = self.__rate_limiter.limit(web_limit, kwargs) if isinstance(web_limit, str) else nullcontext()
 
         # 发起请求，返回响应，根据web_type参数返回不同类型的数据：
         # ① “json”返回解析json后的数据（默认）
@@ -68,22 +64,78 @@ class Downloader(object):
         # ③ “xpath”返回Element对象
         # ④ “text”返回响应体文本str
         # ⑤ “csv”返回解析csv后的数据
+        # 开启会话池时，从会话池取出会话发起请求，复用到同一目标的长连接，请求完成后交回
+        # 下载信息带上web_cache=True时使用响应缓存，cache_ttl为缓存时间（秒），默认0每次都发起条件请求
+        # 下载信息带上stream=True时流式下载，stream_chunk为每次生成的数据条数（默认None逐条生成），encoding为响应体的编码
+        # “json”返回逐个解析顶层数组元素的生成器（读取出错时重新请求并跳过已生成过的元素），“csv”返回逐行解析的生成器
+        # 流式下载的响应体在解析函数遍历时才读取，连接由生成器独占，读取完成后关闭，因此不使用会话池与响应缓存
+        # 流式下载时限流的同时处理数一直占用到生成器遍历完成（或关闭），“response”的原生响应对象无法得知何时读取完成，不能限制同时处理数
         web_type = kwargs.get('web_type', 'json')
-        if web_type == 'json':
-            response = cf.repetition_json(**kwargs)
-        elif web_type == 'response':
-            response = cf.request_get_response(**kwargs)
-        elif web_type == 'xpath':
-            response = etree.HTML(cf.request_get_response(**kwargs).text)
-        elif web_type == 'text':
-            response = cf.request_get_response(**kwargs).text
-        elif web_type == 'csv':
-            response = cf.analyze_csv(cf.request_get_response(**kwargs).text)
+        stream = kwargs.get('stream', False)
+        concurrency = self.__rate_limiter.settings(web_limit, kwargs)[2] if isinstance(web_limit, str) else None
+        if stream and web_type == 'response' and concurrency is not None:
+            raise CheckUnPass('限流标识%s限制了同时处理数，不能流式下载原生响应对象，请使用“json”或“csv”！' % web_limit)
+        if self.__session_pool is not None and not stream:
+            context = self.__session_pool.session(kwargs['url'])
         else:
-            raise ParameterError('web_type', ['“json”（解析json后的数据）', '“response”（原生响应对象）', '“xpath”（Element对象）',
-                                              '“text”（响应体文本str）', '“csv”（解析csv后的数据）'])
+            context = nullcontext()
+        with ExitStack() as stack:
+            stack.enter_context(limit)
+            session = stack.enter_context(context)
+            if kwargs.get('web_cache') and self.__http_cache is not None and not stream:
+                session = self.__http_cache.client(self.__http_cache.ttl(kwargs), session)
+            if session is not None:
+                kwargs = dict(kwargs, session=session)
+            if web_type == 'json' and stream:
+                response = cf.stream_json(chunk=kwargs.get('stream_chunk'), **kwargs)
+            elif web_type == 'json':
+                response = cf.repetition_json(**kwargs)
+            elif web_type == 'response':
+                response = cf.request_get_response(**kwargs)
+            elif web_type == 'xpath':
+                response = etree.HTML(cf.request_get_response(**kwargs).text)
+            elif web_type == 'text':
+                response = cf.request_get_response(**kwargs).text
+            elif web_type == 'csv' and stream:
+                response = cf.stream_csv(cf.request_get_response(**kwargs), chunk=kwargs.get('stream_chunk'),
+                                         encoding=kwargs.get('encoding'))
+            elif web_type == 'csv':
+                response = cf.analyze_csv(cf.request_get_response(**kwargs).text)
+            else:
+                raise ParameterError('web_type', ['“json”（解析json后的数据）', '“response”（原生响应对象）',
+                                                  '“xpath”（Element对象）', '“text”（响应体文本str）', '“csv”（解析csv后的数据）'])
+            if stream and web_type in ('json', 'csv'):
+                response = self.__hold(response, stack.pop_all())
         return response
 
+    @staticmethod
+    def __hold(result, stack):
+        """
+        包装流式下载的生成器，遍历完成（或关闭、被回收）时才退出限流，释放同时处理数
+        生成器创建后先执行到第一个yield，即使解析函数没有遍历，关闭或被回收时也会释放
+        :param result:(type=generator) 流式下载的生成器
+        :param stack:(type=ExitStack) 发起请求时进入的限流等上下文
+        :return wrapper:(type=generator) 包装后的生成器
+        """
+
+        def items():
+            """
+            先生成一个占位的None，之后逐个生成流式下载的生成器的数据
+            """
+
+            try:
+                yield
+                yield from result
+            finally:
+                try:
+                    result.close()
+                finally:
+                    stack.close()
+
+        wrapper = items()
+        next(wrapper)  # 执行到占位的yield，进入try，之后关闭或被回收都会执行finally
+        return wrapper
+
     def __db(self, kwargs):
         """
         获取数据库数据
@@ -0,0 +1,152 @@
+"""
+请求对象去重过滤器：
+1.根据业务名称、采集方式、解析函数与下载信息（kwargs）计算请求对象的特征值，meta不参与计算
+2.特征值跨进程稳定（断点续跑、Redis调度器多节点共用），下载信息里有无法稳定表示的对象（比如临时创建的数据库对象）时不去重
+3.集合模式精确去重，每个特征值占用几十字节内存
+4.布隆过滤器模式占用固定大小的内存，适合请求对象非常多的场景，有极小的概率把没重复的请求对象误判为重复
+"""
+
+import json
+import math
+import types
+import hashlib
+import services
+
+_services = ('mysql', 'clickhouse', 'postgresql', 'redis')  # 可按配置名称表示的数据库连接池
+
+
+def _stable(value):
+    """
+    json序列化时转换无法直接序列化的对象，得到跨进程稳定的表示，repr里的内存地址每次运行都不同，不能参与计算
+    1.bytes转十六进制，集合按元素排序
+    2.模块级的函数与类转为“模块.名称”，绑定方法再加上所属对象的表示
+    3.services里配置的数据库连接池转为“服务:配置名称”
+    4.其余对象的repr不带内存地址（比如datetime、Decimal）则使用repr，否则按json的约定抛出TypeError
+    :param value:(type=object) json无法直接序列化的对象
+    :return result:(type=str,list) 稳定的表示
+    """
+
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=lambda x: json.dumps(x, sort_keys=True, ensure_ascii=False, default=_stable))
+    if isinstance(value, types.MethodType) or (isinstance(value, types.BuiltinMethodType) and not isinstance(
+            value.__self__, (types.ModuleType, type(None)))):
+        return [value.__self__, value.__qualname__]
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        if '<' in value.__qualname__:  # lambda与函数内定义的函数同名的可能不是同一个
+            raise TypeError('%s无法稳定表示' % value.__qualname__)
+        return '%s.%s' % (value.__module__, value.__qualname__)
+    for service in _services:
+        for name, pool in (getattr(services, service, None) or dict()).items():
+            if pool is value:
+                return '%s:%s' % (service, name)
+    result = repr(value)
+    if type(value).__repr__ is object.__repr__ or ' at 0x' in result:
+        raise TypeError('%s无法稳定表示' % result)
+    return result
+
+
+def request_fingerprint(request):
+    """
+    计算请求对象的特征值，下载信息的key排序后再计算，与传参顺序无关
+    下载信息里有无法稳定表示的对象时返回None，该请求对象不去重，否则不同进程算出的特征值不同，断点续跑与多节点去重都会失效
+    :param request:(type=Request) 已绑定业务名称的请求对象
+    :return fp:(type=bytes,None) 特征值，无法稳定计算则为None
+    """
+
+    try:
+        kwargs = json.dumps(request.kwargs, sort_keys=True, ensure_ascii=False, default=_stable)
+    except TypeError:
+        return None
+    fp = hashlib.sha1(('%s\0%s\0%s\0%s' % (request.builder_name, request.way, request.parse, kwargs)).encode()).digest()
+    return fp
+
+
+class SetFilter(object):
+    """
+    集合模式去重过滤器
+    """
+
+    def __init__(self):
+        """
+        初始配置
+        """
+
+        self.__fps = set()
+
+    def seen(self, fp):
+        """
+        判断特征值是否已出现过，没出现过则记录下来，需由调用方保证线程安全
+        :param fp:(type=bytes) 特征值
+        :return result:(type=bool) 已出现过为True
+        """
+
+        if fp in self.__fps:
+            return True
+        self.__fps.add(fp)
+        return False
+
+    def __contains__(self, fp):
+        """
+        只判断特征值是否已出现过，不记录，写入检查点期间过滤器被冻结时使用
+        :param fp:(type=bytes) 特征值
+        :return result:(type=bool) 已出现过为True
+        """
+
+        result = fp in self.__fps
+        return result
+
+
+class BloomFilter(object):
+    """
+    布隆过滤器模式去重过滤器
+    """
+
+    def __init__(self, capacity=10000000, error_rate=0.001):
+        """
+        初始配置，根据预计的特征值数量与误判率计算位数组大小与哈希次数
+        :param capacity:(type=int) 预计的特征值数量，超过后误判率会上升，默认一千万
+        :param error_rate:(type=float) 误判率，默认0.001
+        """
+
+        self.__size = int(-capacity * math.log(error_rate) / math.log(2) ** 2) + 1  # 位数组的位数
+        self.__hashes = max(1, round(self.__size / capacity * math.log(2)))  # 哈希次数
+        self.__bits = bytearray((self.__size + 7) // 8)
+
+    def seen(self, fp):
+        """
+        判断特征值是否已出现过，没出现过则记录下来，需由调用方保证线程安全
+        :param fp:(type=bytes) 特征值，由两段64位整数组合出多个哈希值
+        :return result:(type=bool) 已出现过（或误判）为True
+        """
+
+        result = True
+        for index, bit in self.__positions(fp):
+            if not self.__bits[index] & bit:
+                self.__bits[index] |= bit
+                result = False
+        return result
+
+    def __positions(self, fp):
+        """
+        由特征值的两段64位整数组合出多个哈希值，得到每个哈希值在位数组里的位置
+        :param fp:(type=bytes) 特征值
+        :return positions:(type=generator) 元素为(字节序号, 位掩码)
+        """
+
+        h1 = int.from_bytes(fp[:8], 'big')
+        h2 = int.from_bytes(fp[8:16], 'big') | 1
+        for i in range(self.__hashes):
+            position = (h1 + i * h2) % self.__size
+            yield position >> 3, 1 << (position & 7)
+
+    def __contains__(self, fp):
+        """
+        只判断特征值是否已出现过，不记录，写入检查点期间过滤器被冻结时使用
+        :param fp:(type=bytes) 特征值
+        :return result:(type=bool) 已出现过（或误判）为True
+        """
+
+        result = all(self.__bits[index] & bit for index, bit in self.__positions(fp))
+        return result
@@ -2,19 +2,39 @@
 引擎组件：
 1.对外提供整个的程序的入口
 2.依次调用其他组件对外提供的接口，实现整个框架的运作
+3.收到终止信号（SIGTERM）后停止分发新的请求，等待处理中的请求完成后再关闭，播报放弃的请求
 """
 
-import time
 import sys
 import os
+import pickle
+import signal
+from time import perf_counter, monotonic, sleep
 from importlib import import_module
 from types import GeneratorType
+from functools import partial
+from multiprocessing import get_context
 from multiprocessing.dummy import Pool
-from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from queue import Queue
+from threading import Lock, Condition, Thread, Event, current_thread, main_thread
 from .builder import Builder
 from .scheduler import Scheduler
+from .disk_scheduler import DiskScheduler
+from .redis_scheduler import RedisScheduler
+from .dupe_filter import SetFilter, BloomFilter
+from .counters import Counters
+from .concurrency import ConcurrencyController
+from .timings import Timings
+from .metrics import Metrics
+from .checkpoint import Checkpoint
 from .downloader import Downloader
-from .pipeline import Pipeline
+from .session_pool import SessionPool
+from .rate_limiter import RateLimiter
+from .http_cache import HttpCache
+from .pipeline import Pipeline, written_rows
+from .pipeline_stage import PipelineStage, Batch
 from framework.object.request import Request
 from framework.object.response import Response
 from framework.object.item import Item
@@ -24,11 +44,52 @@ from framework.error.check_error import *
 from utils import common_function as cf, common_profession as cp
 from config import *
 from services import logger, argv
+from services.load import load
+
+# 进程池模式下，子进程里初始化好的业务建造器，每个子进程每个业务只初始化一次
+_process_builders = dict()
+
+
+def process_parse(builder_class, parse_name, response):
+    """
+    进程池模式下，在子进程执行业务建造器的解析函数
+    1.业务建造器以类的形式传给子进程，并在子进程初始化
+    2.校验规则与引擎在线程里执行解析函数时一致
+    3.解析函数yield的所有对象收集成列表后返回主进程
+    :param builder_class:(type=type) 业务建造器类
+    :param parse_name:(type=str) 解析函数名
+    :param response:(type=Response) 响应对象
+    :return result:(type=list) 解析函数yield的所有请求对象与数据对象
+    """
+
+    builder = _process_builders.get(builder_class)
+    if builder is None:
+        builder = _process_builders.setdefault(builder_class, builder_class())
+    try:
+        func = getattr(builder, parse_name)
+    except AttributeError:
+        raise ParseUnExist
+    try:
+        response_list = func(response)
+    except TypeError as e:
+        if 'argument' in str(e):
+            raise ArgumentNumError
+        else:
+            raise e
+    if not isinstance(response_list, GeneratorType):
+        raise FaultReturn
+    result = list(response_list)
+    return result
 
 
 class Engine(object):
     """
     引擎组件
+    供子类（比如异步引擎）重写或调用的受保护接口如下，其余方法与属性均为私有，子类不应依赖：
+    1.可重写：_start_engine、_close_workers、_pipelined、_add_request、_release_target、_wake
+    2.一次引擎循环启动：_init_stage、_start_request、_finish_stage、_is_finish、_stop_deadline、_wait_pipeline
+    3.一个请求任务：_new_batch、_prepare_request、_download_error、_handle_response、_handle_error、_timing、_statistics
+    4.组件：_scheduler、_rate_limiter、_http_cache
     """
 
     def __init__(self):
@@ -42,8 +103,14 @@ class Engine(object):
         # 组件、中间件初始化
         try:
             self.__builders = dict()  # 建造器
-            self.__scheduler = Scheduler()  # 调度器
-            self.__downloader = Downloader()  # 下载器
+            self._scheduler = self.__create_scheduler()  # 调度器
+            self.__session_pool = SessionPool(
+                size=F_max_async if F_web_session_size is None else F_web_session_size,
+                host_sizes=F_web_session_hosts) if F_web_session else None  # web方式的会话池
+            self._rate_limiter = RateLimiter(limits=F_web_limits, redis_name=F_web_limit_redis)  # web方式的限流器
+            self._http_cache = self.__create_http_cache()  # web方式的响应缓存
+            self.__downloader = Downloader(session_pool=self.__session_pool, rate_limiter=self._rate_limiter,
+                                           http_cache=self._http_cache)  # 下载器
             self.__pipelines = dict()  # 管道
             self.__builder_mws = dict()  # 建造器中间件
             self.__downloader_mws = dict()  # 下载器中间件
@@ -55,19 +122,71 @@ class Engine(object):
                 cf.print_log('没有获取到任何业务，引擎关闭！')
                 sys.exit()
 
-            # 请求与响应统计
-            self.total_request_nums = 0
-            self.total_response_nums = 0
-            self.total_error_nums = 0
+            # 请求与响应统计，各线程分别计数，读取时汇总，不需要互斥锁
+            # 每个业务也单独统计请求数与响应数，用于按业务推进引擎循环启动
+            self.__counters = Counters('request', 'response', 'error', *[
+                (type_, builder_name) for builder_name in self.__builders for type_ in ('request', 'response')])
             self.last_finish = 0  # 用于记录上一次引擎循环完成了几个任务
+            metrics = F_metrics_port is not None or F_metrics_path is not None  # 是否开启运行指标
+            self.__timings = Timings() if F_timings or metrics else None  # 分阶段耗时统计，运行指标也需要
+            self.__metrics = Metrics(self.__metrics_snapshot, host=F_metrics_host, port=F_metrics_port,
+                                     path=F_metrics_path, interval=F_metrics_interval) if metrics else None
 
             # 异步任务相关
             self.__while_run = True  # 引擎是否继续循环启动的标志
             self.__is_running = False  # 引擎是否运作的标志
             self.__pool = None  # 线程池，校验过配置的最大并发数后再创建
-            self.request_mutex = Lock()  # 请求数互斥锁
-            self.response_mutex = Lock()  # 响应数互斥锁
-            self.error_mutex = Lock()  # 错误数互斥锁
+            self.__async_checked = False  # 是否已校验并发配置的标志
+            self.__workers = list()  # 常驻线程模式下的工作线程
+            self.__process_pool = None  # 进程池，有业务启用进程池模式才创建
+            self.__worker_alive = True  # 常驻线程是否继续循环的标志
+            self.__finish_condition = Condition()  # 引擎关闭时机的条件变量，主线程在此等待最后一个响应完成
+            self.__start_done = False  # 起始请求是否已全部添加的标志
+            self.__builder_start_done = dict()  # 按业务推进时，每个业务当前的起始请求是否已全部添加
+            self.__stage = 0  # 全局统一循环启动时，当前的循环启动编号，start_requests为0
+            self.__stages = dict()  # 按业务推进时，每个未结束的业务当前的循环启动编号
+            self.__stage_tasks = Queue()  # 按业务推进时，待添加起始请求的(业务名称, 循环启动类型)，由专用线程依次处理
+
+            # 检查点，分布式调度器的请求对象已保存在Redis里，不需要检查点
+            self.__checkpoint = None
+            self.__checkpoint_stop = Event()
+            self.__checkpoint_lock = Lock()  # 定时写入与停止后写入的检查点互斥
+            self.__resume = None  # 从检查点恢复的运行状态，恢复后清空
+            if F_checkpoint_path is not None and not self._scheduler.distributed:
+                self.__checkpoint = Checkpoint(F_checkpoint_path, self.__run_key())
+                if cp.get_argv(pk_resume) is not None:
+                    self.__resume = self.__load_checkpoint()
+            elif cp.get_argv(pk_resume) is not None:
+                logger.exception('没有开启检查点（F_checkpoint_path为None）或使用了Redis调度器，无法从检查点恢复，已从头开始运行！')
+
+            # 终止信号相关
+            self.__stop_deadline = None  # 收到终止信号后等待处理中的请求完成的截止时间（monotonic），None为未收到
+            self.__drained = False  # 收到终止信号后，处理中的请求是否已完成（或已超过截止时间）
+            self.__signal_name = None  # 收到的终止信号名称
+            self.__signal_event = Event()  # 收到终止信号（或引擎结束）时设置，唤醒等待中的__drain线程
+            self.__forced = False  # 是否再次收到终止信号，不再等待处理中的请求与管道线程
+            self.__pipelines_busy = False  # 停止时是否仍有线程可能在调用管道，是则不关闭管道
+
+            # 管道阶段，数据对象交给单独的管道线程处理，详见管道阶段组件
+            # 管道线程数与下载的并发数分开配置，积压时下载侧暂停获取新的请求对象
+            self.__pipeline_stage = PipelineStage(
+                self.__stage_process, size=F_pipeline_queue, workers=F_pipeline_workers, backlog=F_pipeline_backlog,
+                error_callback=self.__error_callback) if F_pipeline_stream else None
+
+            # 自适应并发控制器，按采集方式与目标根据下载耗时与出错率调整同时下载的请求数
+            self.__controller = ConcurrencyController(
+                F_max_async, window=F_adaptive_window, latency_factor=F_adaptive_latency,
+                error_rate=F_adaptive_error) if F_adaptive_async else None
+            if self.__controller is not None:  # 目标达到并发上限时由调度器在出队时跳过，工作线程不阻塞等待
+                self._scheduler.set_gate(self.__controller)
+
+            # 有业务启用了进程池模式，则创建进程池，解析函数交给子进程执行
+            # 使用spawn方式创建子进程，子进程重新加载公共服务，避免与主进程共用fork出来的数据库连接
+            process_names = [name for name, builder in self.__builders.items() if builder.process_parse]
+            if process_names:
+                self.__process_pool = ProcessPoolExecutor(max_workers=F_process_async, mp_context=get_context('spawn'),
+                                                          initializer=load)
+                cf.print_log('业务%s启用进程池模式执行解析函数！' % '、'.join(process_names))
 
             # 警告语模板
             total_warning = '，请规范写法，详情请查看报错提示信息、文档或相关类的说明。'
@@ -85,6 +204,71 @@ class Engine(object):
             logger.ding_exception('框架级错误！引擎初始化失败！', e, self.framework_key)
             sys.exit()
 
+    @staticmethod
+    def __create_scheduler():
+        """
+        根据配置创建调度器与去重过滤器
+        :return scheduler:(type=Scheduler) 调度器
+        """
+
+        # 去重过滤器
+        if F_dupe_filter is None:
+            dupe_filter = None
+        elif F_dupe_filter == 'set':
+            dupe_filter = SetFilter()
+        elif F_dupe_filter == 'bloom':
+            dupe_filter = BloomFilter(capacity=F_bloom_capacity, error_rate=F_bloom_error)
+        else:
+            raise CheckUnPass('配置config中的去重过滤模式F_dupe_filter只能为None、"set"或"bloom"，请修改！')
+
+        # 调度器
+        if F_scheduler_backend == 'memory':
+            scheduler = Scheduler(max_size=F_scheduler_max, dupe_filter=dupe_filter)
+        elif F_scheduler_backend == 'disk':
+            scheduler = DiskScheduler(max_size=F_scheduler_max, dupe_filter=dupe_filter, path=F_spill_path,
+                                      head_size=F_spill_head)
+        elif F_scheduler_backend == 'redis':
+            run_key = Engine.__run_key()
+            scheduler = RedisScheduler(F_redis_scheduler, run_key, visibility=F_redis_visibility,
+                                       dupe_filter=dupe_filter)
+            cf.print_log('使用Redis调度器，采集标识为%s！' % run_key)
+        else:
+            raise CheckUnPass('配置config中的调度器类型F_scheduler_backend只能为"memory"、"disk"或"redis"，请修改！')
+        return scheduler
+
+    @staticmethod
+    def __create_http_cache():
+        """
+        根据配置创建web方式的响应缓存
+        :return http_cache:(type=HttpCache,None) 响应缓存，不缓存时为None
+        """
+
+        if F_web_cache is None:
+            http_cache = None
+        elif F_web_cache == 'memory':
+            http_cache = HttpCache(size=F_web_cache_size)
+        elif F_web_cache == 'disk':
+            path = F_web_cache_path
+            if path is None:
+                path = os.path.join(os.getcwd(), 'temporary', 'web_cache')
+            http_cache = HttpCache(size=F_web_cache_size, path=path)
+        else:
+            raise CheckUnPass('配置config中的响应缓存模式F_web_cache只能为None、"memory"或"disk"，请修改！')
+        return http_cache
+
+    @staticmethod
+    def __run_key():
+        """
+        获取采集标识，没有传采集标识时，根据其余脚本传参（不包括断点续跑）生成，相同脚本传参的运行为同一次采集
+        :return run_key:(type=str) 采集标识
+        """
+
+        run_key = cp.get_argv(pk_rk)
+        if run_key is None:
+            run_key = cf.calculate_fp(['%s=%s' % (k, v) for k, v in sorted(vars(argv).items()) if k not in (
+                'main_key_dict', pk_rk.replace('-', '_'), pk_resume.replace('-', '_'))])
+        return run_key
+
     def __init_all(self):
         """
         把通过脚本传参开启的业务初始化为引擎能用的格式
@@ -152,6 +336,18 @@ class Engine(object):
                     logger.ding_exception('业务建造器（%s）初始化失败！' % obj_name, e, obj_name)
                     continue
 
+                # 1.5 设置业务在调度器里的权重与并发上限，config里有配置则以config为准，不规范则使用默认值
+                weight = F_builder_weight.get(obj_name, obj.weight)
+                if isinstance(weight, int) and weight >= 1:
+                    self._scheduler.set_weight(obj_name, weight)
+                else:
+                    logger.exception('业务建造器（%s）的weight属性不为大于等于1的整数，已使用默认权重1！请规范写法。' % obj_name)
+                max_async = F_builder_async.get(obj_name, obj.max_async)
+                if max_async is None or (isinstance(max_async, int) and max_async >= 1):
+                    self._scheduler.set_limit(obj_name, max_async)
+                else:
+                    logger.exception('业务建造器（%s）的max_async属性不为None或大于等于1的整数，已不限制并发！请规范写法。' % obj_name)
+
                 # 2.添加业务管道
                 # 业务管道、中间件等都是附加组件，可以没有，没有则使用默认
                 # 如果这些附加组件没有分别继承对应内置父类，也使用默认
@@ -212,10 +408,69 @@ class Engine(object):
         :param temp:(type=?) 未知参数，底层模块写法，待探究
         """
 
-        if self.__is_running:
+        if self.__is_running and self.__stop_deadline is None:  # 收到终止信号后不再提交新的任务
             self.__pool.apply_async(self.__execute_request_response_item, callback=self.__call_back,
                                     error_callback=self.__error_callback)
 
+    def __worker_loop(self):
+        """
+        常驻线程模式下每个工作线程的循环
+        1.阻塞等待调度器的请求对象，超时后继续等待，不再通过线程池回调重新提交任务
+        2.引擎真正结束时，调度器会放入结束标记唤醒阻塞中的线程，线程检查到标志后退出
+        """
+
+        while self.__worker_alive:
+            try:
+                self.__execute_request_response_item(block=True)
+            except Exception as e:
+                self.__error_callback(e)
+
+    def _close_workers(self):
+        """
+        引擎真正结束后，关闭线程池或常驻线程
+        收到终止信号后超过截止时间仍未完成的请求直接放弃，不再等待其所在的线程（守护线程，随进程退出）
+        """
+
+        self.__is_running = False
+        wait = self.__stop_deadline is None
+        if self.__pool is not None:
+            self.__pool.terminate()  # 此时所有请求均已完成，剩下的只是获取不到请求对象的空任务
+        if self.__workers:
+            self.__worker_alive = False
+            self._scheduler.wake(len(self.__workers))
+            for worker in self.__workers:
+                worker.join(None if wait else 0)
+        if self.__process_pool is not None:
+            self.__process_pool.shutdown(wait=wait)
+        if self.__pipeline_stage is not None:
+            # 收到终止信号时放弃通道里的数据对象，最多等待F_drain_timeout秒让管道线程处理完手上的数据对象
+            # 再次收到终止信号时不再等待
+            stopped, dropped = self.__pipeline_stage.close(None if wait else 0 if self.__forced else F_drain_timeout)
+            if dropped:
+                cf.print_log('管道阶段放弃通道里的数据对象%s个，所属的请求对象均未确认！' % dropped)
+            self.__pipelines_busy = not stopped
+        elif not wait:  # 没有开启管道阶段时，未完成的请求所在的线程可能正在调用管道
+            self.__pipelines_busy = self.__running_nums() > 0
+        if self.__session_pool is not None:
+            self.__session_pool.close()
+        self._scheduler.close()
+
+    def __close_pipelines(self):
+        """
+        引擎真正结束后，依次调用每个管道的close方法，把缓冲中的数据写入数据库，多个业务共用的管道只调用一次
+        收到终止信号停止时仍有线程可能在调用管道，则不关闭管道，避免与这些线程同时写入缓冲
+        """
+
+        if self.__pipelines_busy:
+            cf.print_log('仍有线程在调用管道，不关闭管道，管道缓冲中的数据不会写入数据库！')
+            return
+        pipelines = {id(pipeline): (builder_name, pipeline) for builder_name, pipeline in self.__pipelines.items()}
+        for builder_name, pipeline in pipelines.values():
+            try:
+                pipeline.close()
+            except Exception as e:
+                logger.ding_exception('业务管道（%s）关闭失败！' % builder_name, e, builder_name)
+
     def __error_callback(self, exception):
         """
         异常回调函数，触发此函数的都是框架级错误
@@ -281,22 +536,98 @@ class Engine(object):
         else:
             return func
 
-    def __statistics_lock(self, type_):
+    @property
+    def total_request_nums(self):
         """
-        避免线程安全问题，利用互斥锁统计数据
-        :param type_:(type=str) 数据的名称
+        请求数
+        :return nums:(type=int) 请求数
         """
 
-        lock = getattr(self, '%s_mutex' % type_)
-        with lock:
-            nums_name = 'total_%s_nums' % type_
-            setattr(self, nums_name, getattr(self, nums_name) + 1)
+        nums = self.__counters.get('request')
+        return nums
 
-    def __add_request(self, request, builder_name):
+    @property
+    def total_response_nums(self):
+        """
+        完成响应数
+        :return nums:(type=int) 完成响应数
+        """
+
+        nums = self.__counters.get('response')
+        return nums
+
+    @total_response_nums.setter
+    def total_response_nums(self, value):
+        self.__counters.set('response', value)
+
+    @property
+    def total_error_nums(self):
+        """
+        错误响应数
+        :return nums:(type=int) 错误响应数
+        """
+
+        nums = self.__counters.get('error')
+        return nums
+
+    def _statistics(self, type_, builder_name=None):
+        """
+        统计数据，只修改本线程的计数
+        :param type_:(type=str) 数据的名称，response或error
+        :param builder_name:(type=str) 业务名称，统计响应数时传入则同时统计该业务的响应数，默认None
+        """
+
+        if builder_name is not None and type_ == 'response':
+            self.__counters.incr(('response', builder_name))
+        self.__counters.incr(type_)
+
+        # 响应数变动后，如已符合关闭条件，则唤醒等待中的主线程
+        if type_ != 'error':
+            self.__notify_finish(builder_name)
+
+    def _is_finish(self):
+        """
+        判断该次引擎循环启动是否已完成
+        1.起始请求必须已全部添加，否则可能在添加过程中因请求数暂时等于响应数而过早关闭
+        2.请求数要大于上一次循环结束（初始值为0）时的请求数，并且完成响应数要大于等于发起请求数
+        3.请求对象先计数再入队，因此先读响应数、再读请求数，读到的请求数不会少于已完成响应的请求对象数
+        4.分布式调度器则以所有节点的请求数与响应数为准
+        5.收到终止信号并已停止时，直接视为完成
+        :return result:(type=bool) 是否完成
+        """
+
+        if self.__drained:
+            result = True
+        elif not self.__start_done:
+            result = False
+        elif self._scheduler.distributed:
+            result = self._scheduler.is_finish()
+        else:
+            response_nums = self.total_response_nums
+            result = self.last_finish < self.total_request_nums <= response_nums
+        return result
+
+    def __notify_finish(self, builder_name=None):
+        """
+        符合关闭条件（按业务推进时为该业务完成当前任务）时唤醒主线程，分布式调度器由主线程定时检查
+        :param builder_name:(type=str) 业务名称，默认None
+        """
+
+        if self.__builder_start_done:
+            finish = builder_name is not None and self.__is_builder_finish(builder_name)
+        else:
+            finish = not self._scheduler.distributed and self._is_finish()
+        if finish:
+            with self.__finish_condition:
+                self.__finish_condition.notify_all()
+
+    def _add_request(self, request, builder_name, block=True):
         """
         添加请求任务
         :param request:(type=Request) 请求对象
         :param builder_name:(type=str) 业务名称
+        :param block:(type=bool) 调度器达到上限时是否阻塞等待，默认True
+        :return result:(type=bool) 是否已添加，开启去重过滤时重复的请求对象为False
         """
 
         # 校验是否内置对象
@@ -309,171 +640,373 @@ class Engine(object):
         # 给请求对象绑定建造器名称（业务名称）
         request.builder_name = builder_name
 
-        # 把请求对象添加给调度器
-        self.__scheduler.add_request(request)
+        # 请求+1，先计数再添加给调度器，否则请求对象可能在计数前就已完成响应，导致引擎过早关闭
+        # 请求数增加不会让引擎符合关闭条件，不需要唤醒主线程
+        self.__counters.incr('request')
+        self.__counters.incr(('request', builder_name))
 
-        # 请求+1
-        self.__statistics_lock('request')
+        # 把请求对象添加给调度器，被去重过滤的不计入请求数
+        result = self._scheduler.add_request(request, block=block)
+        if not result:
+            self.__counters.incr(('request', builder_name), -1)
+            self.__counters.incr('request', -1)
+        return result
 
-    def __start_request(self, request_type):
+    def __start_builder_request(self, builder_name, request_type):
         """
-        处理每次引擎循环启动的起始请求
+        处理一个业务建造器的起始请求
+        :param builder_name:(type=str) 业务名称
         :param request_type:(type=str) 引擎循环启动的类型
+        :return has_task:(type=bool) 该业务在该点是否有任务
         """
 
         # 1.调用建造器，获取请求对象列表
-        no_task = True  # 该点是否没有任务的标记
-        for builder_name, builder in self.__builders.items():
-            a_gc = True if builder.auto_gc and request_type == 'start_requests' else False  # 通用流程标记
+        builder = self.__builders[builder_name]
+        a_gc = True if builder.auto_gc and request_type == 'start_requests' else False  # 通用流程标记
+        has_task = False
+        try:
             try:
-                try:
-                    if a_gc:  # 使用通用的游戏数据采集流程
-                        start_list = self.__check_return(self.__check_argument(builder.auto_game_collection))
-                    else:  # 其余走正常流程
-                        start_list = self.__check_return(self.__check_argument(getattr(builder, request_type)))
-                except AttributeError:
-                    self.__add_request(Request('test', parse='_funny'), builder_name)  # 彩蛋请求让引擎有机会关闭
-                    continue
-                else:
-                    no_task = False
-                empty = True  # 标记是否空start_list
+                if a_gc:  # 使用通用的游戏数据采集流程
+                    start_list = self.__check_return(self.__check_argument(builder.auto_game_collection))
+                else:  # 其余走正常流程
+                    start_list = self.__check_return(self.__check_argument(getattr(builder, request_type)))
+            except AttributeError:
+                self._add_request(Request('test', parse='_funny'), builder_name)  # 彩蛋请求让引擎有机会关闭
+                return has_task
+            else:
+                has_task = True
+            empty = True  # 标记是否空start_list
 
-                # 2.添加请求对象到调度器中
-                for start_request in start_list:
+            # 2.添加请求对象到调度器中
+            for start_request in start_list:
+                if self._add_request(start_request, builder_name):
                     empty = False
-                    self.__add_request(start_request, builder_name)
-
-                # 当编写人比较皮，所有业务建造器中的start都是一个空列表时，会出现引擎卡死的现象
-                # 为了防止这种现象，如果start_list为空时，加个彩蛋请求，让引擎有机会关闭
-                if empty:
-                    self.__add_request(Request('test', parse='_funny'), builder_name)
-
-            # 处理异常
-            except FaultReturn:  # 校验yield不通过
-                logger.exception(self.__fr_warning.format(
-                    builder_name, 'auto_game_collection' if a_gc else request_type))
-                self.__add_request(Request('test', parse='_funny'), builder_name)  # 彩蛋请求，作用同上
-            except TypeDifferent:  # 校验类型不通过
-                logger.exception(self.__td_warning.format(builder_name))
-                self.__add_request(Request('test', parse='_funny'), builder_name)
-            except ArgumentNumError:  # 校验函数传参不通过
-                logger.exception(self.__ane_warning.format(builder_name))
-                self.__add_request(Request('test', parse='_funny'), builder_name)
-            except CheckUnPass:  # start校验不通过
-                logger.exception(self.__cu_warning.format(builder_name))
-                self.__add_request(Request('test', parse='_funny'), builder_name)
-            except Exception as e:  # 其他业务级错误
-                logger.ding_exception(self.__b_warning.format(builder_name), e, builder_name)
-                self.__add_request(Request('test', parse='_funny'), builder_name)
+
+            # 当编写人比较皮，所有业务建造器中的start都是一个空列表时，会出现引擎卡死的现象
+            # 为了防止这种现象，如果start_list为空（或全部被去重过滤）时，加个彩蛋请求，让引擎有机会关闭
+            if empty:
+                self._add_request(Request('test', parse='_funny'), builder_name)
+
+        # 处理异常
+        except FaultReturn:  # 校验yield不通过
+            logger.exception(self.__fr_warning.format(
+                builder_name, 'auto_game_collection' if a_gc else request_type))
+            self._add_request(Request('test', parse='_funny'), builder_name)  # 彩蛋请求，作用同上
+        except TypeDifferent:  # 校验类型不通过
+            logger.exception(self.__td_warning.format(builder_name))
+            self._add_request(Request('test', parse='_funny'), builder_name)
+        except ArgumentNumError:  # 校验函数传参不通过
+            logger.exception(self.__ane_warning.format(builder_name))
+            self._add_request(Request('test', parse='_funny'), builder_name)
+        except CheckUnPass:  # start校验不通过
+            logger.exception(self.__cu_warning.format(builder_name))
+            self._add_request(Request('test', parse='_funny'), builder_name)
+        except Exception as e:  # 其他业务级错误
+            logger.ding_exception(self.__b_warning.format(builder_name), e, builder_name)
+            self._add_request(Request('test', parse='_funny'), builder_name)
+        return has_task
+
+    def _start_request(self, request_type):
+        """
+        处理每次引擎循环启动的起始请求
+        :param request_type:(type=str) 引擎循环启动的类型
+        """
+
+        # 分布式调度器只由一个节点添加起始请求，其余节点等待其添加完成
+        no_task = self._scheduler.start_stage(request_type)
+        if no_task is not None:
+            if no_task:
+                self.__while_run = False
+            self.__start_done = True
+            return
+
+        # 1.调用每个建造器添加起始请求
+        # 从检查点恢复时，先恢复检查点里的请求对象，只有无法恢复的业务重新添加起始请求
+        builders, resume, self.__resume = self.__builders, self.__resume, None
+        if resume is not None:
+            builders = self.__restore(resume)
+        no_task = resume is None  # 该点是否没有任务的标记
+        for builder_name in builders:
+            if self.__start_builder_request(builder_name, request_type):
+                no_task = False
 
         # 3.检索所有业务建造器后，如该点没有任务，则标记不再循环启动引擎
         if no_task:
             self.__while_run = False
 
-    def __execute_request_response_item(self):
+        # 4.标记起始请求已全部添加，并检查是否已可关闭（起始请求可能在添加完之前就全部完成了）
+        self._scheduler.finish_start(request_type, no_task)
+        with self.__finish_condition:
+            self.__start_done = True
+        self.__notify_finish()
+
+    def __execute_request_response_item(self, block=False):
         """
         处理后续请求与响应
+        :param block:(type=bool) 获取请求对象时是否阻塞等待，常驻线程模式为True，默认False
         """
 
+        # 开启管道阶段时，管道积压则暂不获取新的请求对象，等待积压消退（下载侧背压）
+        if not self._wait_pipeline(F_worker_timeout):
+            return
+
         # 3.调用调度器，获取请求对象
         # 如果获取请求对象的时候出错，就抛出框架级错误
         # 抛出错误后完成请求数+1（否则引擎会陷入死循环卡死而无法关闭），并直接结束该次任务
+        # 分布式调度器的请求对象可能由其他节点添加，回调模式下也阻塞等待，避免空转请求Redis
+        # 回调模式下请求对象都因并发上限暂不能出队时，在调度器里等待到可以出队，避免回调立即重新提交任务空转
         try:
-            request = self.__scheduler.get_request()
+            begin = perf_counter()
+            request = self._scheduler.get_request(block=block or self._scheduler.distributed,
+                                                  timeout=F_worker_timeout, held=True)
             if request is None:  # 如果没有获取到请求对象，直接结束
                 return
+            claimed_request = request  # 从调度器获取的请求对象，处理完成后交回调度器确认
             builder_name = request.builder_name  # 业务名称
             parse_name = request.parse  # 解析函数
+            self._timing('scheduler', builder_name, parse_name, begin)
         except Exception as e:
-            self.__statistics_lock('error')
-            self.__statistics_lock('response')
+            self._statistics('error')
+            self._statistics('response')
             logger.ding_exception(self.__f_exception, e, self.framework_key)
             return
 
         # 4.调用下载器，获取响应对象
+        # 开启自适应并发时，出队时已占用目标的并发名额，下载后交回耗时与是否出错
+        batch = self._new_batch()
         try:
-            builder = self.__builders[builder_name]  # 业务建造器对象
-            downloader_mw = self.__downloader_mws[builder_name]
-            request = self.__check_return(self.__check_argument(
-                downloader_mw.process_request, request), right_obj=Request)  # 下载器请求处理
+            request = self._prepare_request(request, builder_name)
+            begin = perf_counter()
             try:
                 response = self.__downloader.get_response(request)
             except Exception as e:  # 下载过程中出错，把原生错误对象与请求对象交回给建造器处理
-                result = builder.downloader_error_callback(e, request)
-                if isinstance(result, Request):  # 如果返回的是一个请求对象，则再次添加去调度器
-                    self.__add_request(result, builder_name)
+                self._release_target(claimed_request, perf_counter() - begin, error=True)
+                self._download_error(e, request, builder_name)
                 return
-            response = self.__check_return(self.__check_argument(
-                downloader_mw.process_response, response), right_obj=Response)  # 下载器响应处理
-            response.meta = request.meta  # 信息（数据）互传
+            self._release_target(claimed_request, perf_counter() - begin)
+            self._timing('download', builder_name, request.way, begin)
+            self._handle_response(response, request, builder_name, parse_name, batch)
 
-            # 5.调用建造器，解析响应对象
-            response = self.__check_return(self.__check_argument(
-                self.__builder_mws[builder_name].process_response, response), right_obj=Response)  # 建造器响应处理
+        # 8.完成一个响应，响应+1
+        # 无论是正常执行还是报错，都需要完成响应，否则引擎会一直卡死
+        # 开启管道阶段时，该响应对象的数据对象全部处理完成后才完成响应
+        except Exception as e:
+            self._handle_error(e, builder_name, parse_name)
+        finally:
+            self._release_target(claimed_request)  # 下载前出错时归还目标的并发名额
+            if batch is None:
+                self.__finish_request(claimed_request, builder_name)
+            else:
+                batch.finish(partial(self.__finish_request, claimed_request, builder_name))
+
+    def _release_target(self, request, latency=None, error=False):
+        """
+        开启自适应并发时，归还请求对象出队时占用的目标并发名额，可能有请求对象可以出队时唤醒调度器
+        :param request:(type=Request) 从调度器获取的请求对象
+        :param latency:(type=float) 下载耗时（单位：秒），默认None没有下载，只归还名额
+        :param error:(type=bool) 下载是否出错，默认False
+        :return result:(type=bool) 是否唤醒了调度器
+        """
+
+        result = self.__controller is not None and self.__controller.release(request, latency, error)
+        if result:
+            self._scheduler.notify_ready()
+        return result
+
+    def _wait_pipeline(self, timeout=None):
+        """
+        获取新的请求对象前，管道阶段积压中则等待积压消退
+        :param timeout:(type=int,float) 超时时间（秒），传0则不等待，默认None一直等待
+        :return result:(type=bool) 是否可以获取新的请求对象，没有开启管道阶段时总是为True
+        """
+
+        result = self.__pipeline_stage is None or self.__pipeline_stage.wait(timeout)
+        return result
+
+    def _new_batch(self):
+        """
+        创建一个响应对象交给管道阶段的数据对象批次
+        :return batch:(type=Batch,None) 批次，没有开启管道阶段则为None
+        """
+
+        batch = Batch() if self.__pipeline_stage is not None else None
+        return batch
+
+    def __finish_request(self, request, builder_name):
+        """
+        完成一个响应，把请求对象交回调度器确认，响应+1
+        :param request:(type=Request) 从调度器获取的请求对象
+        :param builder_name:(type=str) 业务名称
+        """
+
+        self._scheduler.ack(request)
+        self._statistics('response', builder_name)
+
+    def _prepare_request(self, request, builder_name):
+        """
+        下载前的处理，经过下载器中间件处理请求对象
+        :param request:(type=Request) 从调度器获取的请求对象
+        :param builder_name:(type=str) 业务名称
+        :return request:(type=Request) 处理后准备交给下载器的请求对象
+        """
+
+        begin = perf_counter()
+        downloader_mw = self.__downloader_mws[builder_name]
+        request = self.__check_return(self.__check_argument(
+            downloader_mw.process_request, request), right_obj=Request)  # 下载器请求处理
+        self._timing('downloader_mw', builder_name, request.parse, begin)
+        return request
+
+    def _download_error(self, e, request, builder_name):
+        """
+        下载过程中出错，把原生错误对象与请求对象交回给建造器处理
+        :param e:(type=Exception) 下载器抛出的异常对象
+        :param request:(type=Request) 交给下载器的请求对象
+        :param builder_name:(type=str) 业务名称
+        """
+
+        result = self.__builders[builder_name].downloader_error_callback(e, request)
+        if isinstance(result, Request):  # 如果返回的是一个请求对象，则再次添加去调度器，重试的请求对象不参与去重
+            result.dont_filter = True
+            self._add_request(result, builder_name)
+
+    def _handle_response(self, response, request, builder_name, parse_name, batch=None):
+        """
+        下载后的处理，经过中间件处理响应对象，再交给建造器解析，解析结果交给调度器或管道
+        :param response:(type=Response) 下载器获取的响应对象
+        :param request:(type=Request) 交给下载器的请求对象
+        :param builder_name:(type=str) 业务名称
+        :param parse_name:(type=str) 解析函数名
+        :param batch:(type=Batch) 数据对象批次，传入则数据对象放入管道阶段的通道，默认None在当前线程交给管道
+        """
+
+        builder = self.__builders[builder_name]  # 业务建造器对象
+        begin = perf_counter()
+        response = self.__check_return(self.__check_argument(
+            self.__downloader_mws[builder_name].process_response, response), right_obj=Response)  # 下载器响应处理
+        response.meta = request.meta  # 信息（数据）互传
+        begin = self._timing('downloader_mw', builder_name, parse_name, begin)
+
+        # 5.调用建造器，解析响应对象
+        # 解析函数是生成器，耗时在迭代时统计，不包括添加请求对象与管道处理的耗时
+        response = self.__check_return(self.__check_argument(
+            self.__builder_mws[builder_name].process_response, response), right_obj=Response)  # 建造器响应处理
+        begin = self._timing('builder_mw', builder_name, parse_name, begin)
+        if builder.process_parse:  # 进程池模式，解析函数在子进程执行，当前线程等待结果
+            response_list = self.__process_pool.submit(process_parse, type(builder), parse_name, response).result()
+        else:
             response_list = self.__check_return(
                 self.__check_argument(self.__check_parse(builder, parse_name), response))
+        if self.__timings is not None:
+            response_list = self.__timings.iterate(response_list, 'parse', builder_name, parse_name,
+                                                  perf_counter() - begin)
 
-            # 6.根据响应对象类型，把该对象添加至调度器或交给管道
-            for result in response_list:
-                pipeline_result = None
-                if isinstance(result, Request):
-                    self.__add_request(result, builder_name)
-                elif isinstance(result, Item):
-                    pipeline_result = self.__check_argument(
-                        self.__check_parse(self.__pipelines[builder_name], result.parse), result)
-                    if pipeline_result is not None:  # 如果不是返回None，还需要校验是否yield生成器
-                        self.__check_return(pipeline_result)
+        # 6.根据响应对象类型，把该对象添加至调度器或交给管道，开启管道阶段时放入通道，由管道线程处理
+        for result in response_list:
+            if isinstance(result, Request):
+                self._add_request(result, builder_name)
+            elif isinstance(result, Item):
+                if batch is not None:
+                    self.__pipeline_stage.put(batch, builder_name, result)
                 else:
-                    raise TypeDifferent([Request, Item])
+                    self.__process_item(result, builder_name)
+            else:
+                raise TypeDifferent([Request, Item])
 
-                # 7.管道处理完数据对象后，根据处理结果返回的对象类型，添加请求对象至调度器或结束当次响应任务
-                if pipeline_result is not None:
-                    for one_request in pipeline_result:
-                        self.__add_request(one_request, builder_name)
+    def __process_item(self, item, builder_name, block=True):
+        """
+        把数据对象交给管道处理
+        :param item:(type=Item) 数据对象
+        :param builder_name:(type=str) 业务名称
+        :param block:(type=bool) 管道返回的请求对象添加至调度器时，达到上限是否阻塞等待，默认True
+        """
 
-        # 8.完成一个响应，响应+1
-        # 无论是正常执行还是报错，都需要完成响应，否则引擎会一直卡死
+        begin = perf_counter()
+        pipeline_result = self.__check_argument(self.__check_parse(self.__pipelines[builder_name], item.parse), item)
+        if pipeline_result is not None:  # 如果不是返回None，还需要校验是否yield生成器
+            self.__check_return(pipeline_result)
+            if self.__timings is not None:  # 管道函数是生成器，耗时在迭代时统计
+                pipeline_result = self.__timings.iterate(pipeline_result, 'pipeline', builder_name, item.parse,
+                                                        perf_counter() - begin)
+        else:
+            self._timing('pipeline', builder_name, item.parse, begin)
+
+        # 7.管道处理完数据对象后，根据处理结果返回的对象类型，添加请求对象至调度器或结束当次响应任务
+        if pipeline_result is not None:
+            for one_request in pipeline_result:
+                self._add_request(one_request, builder_name, block=block)
+
+    def __stage_process(self, builder_name, item):
+        """
+        管道线程处理一个数据对象，出错只影响该数据对象，错误数+1
+        管道返回的请求对象添加时不阻塞，避免与阻塞在放入通道的工作线程互相等待而卡死
+        :param builder_name:(type=str) 业务名称
+        :param item:(type=Item) 数据对象
+        """
+
+        try:
+            self.__process_item(item, builder_name, block=False)
+        except Exception as e:
+            self._handle_error(e, builder_name, item.parse)
+
+    def _timing(self, phase, builder_name, name, begin):
+        """
+        记录一个阶段的耗时，没有开启分阶段耗时统计则不记录
+        :param phase:(type=str) 阶段
+        :param builder_name:(type=str) 业务名称
+        :param name:(type=str) 函数名称
+        :param begin:(type=float) 阶段开始时间（perf_counter）
+        :return end:(type=float) 阶段结束时间，可作为下一阶段的开始时间
+        """
+
+        end = perf_counter()
+        if self.__timings is not None:
+            self.__timings.record(phase, builder_name, name, end - begin)
+        return end
+
+    def _handle_error(self, e, builder_name, parse_name):
+        """
+        处理请求任务过程中捕获到的异常，错误数+1，并根据异常类型记录日志
+        :param e:(type=Exception) 捕获到的异常对象
+        :param builder_name:(type=str) 业务名称
+        :param parse_name:(type=str) 解析函数名
+        """
+
+        self._statistics('error')
+        try:
+            raise e  # 抛出异常后，才能被日志进行完整记录下来
         except FaultReturn:
-            self.__statistics_lock('error')
             logger.exception(self.__fr_warning.format(builder_name, parse_name))
         except TypeDifferent:
-            self.__statistics_lock('error')
             logger.exception(self.__td_warning.format(builder_name))
         except ArgumentNumError:
-            self.__statistics_lock('error')
             logger.exception(self.__ane_warning.format(builder_name))
         except ParameterError:
-            self.__statistics_lock('error')
             logger.exception(self.__pe_warning.format(builder_name))
         except ParseUnExist:
-            self.__statistics_lock('error')
             logger.exception(self.__pue_warning.format(builder_name))
         except Exception as e:
-            self.__statistics_lock('error')
             logger.ding_exception(self.__b_warning.format(builder_name), e, builder_name)
-        finally:
-            self.__statistics_lock('response')
 
-    def __start_engine(self, request_type):
+    def __prepare_workers(self, request_type):
         """
-        调用组件，框架运作
+        校验并发配置，计算实际开启的并发数，并创建线程池或常驻线程
+        :param request_type:(type=str) 引擎循环启动的类型
+        :return real_count:(type=int) 实际开启的并发数
         """
 
-        # 循环启动初始化
-        cf.print_log('执行%s任务！' % request_type)
-        if self.total_response_nums > self.total_request_nums:
-            self.total_response_nums = self.total_request_nums
-
         # 默认有多少个业务，就开启多少倍并发
         # 如果业务数大于控制的最大并发数，则使用配置的最大并发数
         # 可通过传参灵活控制并发倍数
-        # 第一次循环启动引擎才做校验，后面都不需要做校验，校验通过则创建线程池
-        if self.__pool is None:
+        # 第一次循环启动引擎才做校验，后面都不需要做校验，校验通过则创建线程池（常驻线程模式不需要线程池）
+        if not self.__async_checked:
             if not isinstance(F_max_async, int) or F_max_async < 1:
                 raise CheckUnPass('配置config中的最大并发数F_max_async不为int类型或小于1，请修改！')
             if not isinstance(F_every_async, int) or F_every_async < 1:
                 raise CheckUnPass('配置config中的并发倍数F_every_async不为int类型或小于1，请修改！')
-            self.__pool = Pool(F_max_async)
+            if not F_worker_loop:
+                self.__pool = Pool(F_max_async)
+            self.__async_checked = True
         argv_ea = cp.get_argv(pk_ea)
         if argv_ea is not None:
             try:
@@ -485,27 +1018,190 @@ class Engine(object):
         every_async = argv_ea if argv_ea is not None else F_every_async
         async_count = self.__builders_num * every_async
 
-        # 使用异步任务添加初始请求
-        self.__is_running = True  # 启动引擎，设置状态为True
-        self.__pool.apply_async(self.__start_request, args=(request_type,), error_callback=self.__error_callback)
-
-        # 异步处理解析过程中产生的请求
         real_count = async_count if async_count <= F_max_async else F_max_async
         if request_type == 'start_requests':
             cf.print_log('实际开启并发数%s！' % real_count)
-        for i in range(real_count):
-            self.__pool.apply_async(self.__execute_request_response_item, callback=self.__call_back,
-                                    error_callback=self.__error_callback)
+        self._scheduler.set_consumers(real_count)  # 调度器有上限时，防止工作线程全部阻塞在添加请求对象
+
+        # 常驻线程模式的工作线程只在第一次循环启动引擎时创建，之后各轮循环共用，引擎真正结束时才退出
+        if F_worker_loop and not self.__workers:
+            for i in range(real_count):
+                worker = Thread(target=self.__worker_loop, daemon=True)
+                worker.start()
+                self.__workers.append(worker)
+        return real_count
+
+    def _start_engine(self, request_type):
+        """
+        调用组件，框架运作
+        """
+
+        # 循环启动初始化
+        self._init_stage(request_type)
+        real_count = self.__prepare_workers(request_type)
+
+        # 常驻线程模式
+        # 工作线程已在等待请求对象，直接在主线程添加初始请求即可
+        if F_worker_loop:
+            self._start_request(request_type)
+
+        # 回调模式
+        # 使用异步任务添加初始请求，并异步处理解析过程中产生的请求，每完成一个任务再回调提交下一个任务
+        else:
+            self.__pool.apply_async(self._start_request, args=(request_type,), error_callback=self.__error_callback)
+            for i in range(real_count):
+                self.__pool.apply_async(self.__execute_request_response_item, callback=self.__call_back,
+                                        error_callback=self.__error_callback)
 
         # 控制判断引擎关闭时机，由于是异步任务，需要符合特定条件才判断，否则引擎会过快关闭
-        # 由于引擎会循环启动，需要请求数大于上一次循环结束（初始值为0）才开始判定
-        # 并且完成请求数要大于等于发起请求数，才能关闭引擎
+        # 主线程在条件变量上休眠，由添加请求与完成响应的线程在符合条件时唤醒，不再轮询空转
+        # 具体关闭条件详见_is_finish函数
+        # 分布式调度器的完成条件由所有节点决定，没有线程会唤醒主线程，需定时检查
+        timeout = F_worker_timeout if self._scheduler.distributed else None
+        with self.__finish_condition:
+            while not self.__finish_condition.wait_for(self._is_finish, timeout=timeout):
+                pass
+        self._finish_stage()
+
+    def _pipelined(self):
+        """
+        判断是否按业务各自推进引擎循环启动，分布式调度器只能使用全局统一的循环启动
+        :return result:(type=bool) 是否按业务推进
+        """
+
+        result = not F_stage_barrier and not self._scheduler.distributed
+        return result
+
+    def __is_builder_finish(self, builder_name):
+        """
+        判断业务当前的循环启动是否已完成，与_is_finish一致，先读响应数、再读请求数
+        :param builder_name:(type=str) 业务名称
+        :return result:(type=bool) 是否完成
+        """
+
+        if not self.__builder_start_done.get(builder_name):
+            return False
+        response_nums = self.__counters.get(('response', builder_name))
+        result = self.__counters.get(('request', builder_name)) <= response_nums
+        return result
+
+    def __stage_loop(self):
+        """
+        按业务推进时添加起始请求的专用线程，依次处理各业务每次推进的任务，收到None时退出
+        所有推进共用这一个线程，不再每次推进都新建线程（每个新线程都会在计数器里多一个条带）
+        """
+
         while True:
-            time.sleep(0.001)  # 防止CPU空转
-            if self.last_finish < self.total_request_nums <= self.total_response_nums:
-                self.__is_running = False  # 标记引擎关闭
-                self.last_finish = self.total_request_nums  # 记录该次引擎请求数
-                break
+            task = self.__stage_tasks.get()
+            if task is None:
+                return
+            self.__start_builder_stage(*task)
+
+    def __start_builder_stage(self, builder_name, request_type):
+        """
+        在专用线程里添加业务该次循环启动的起始请求，添加完成后唤醒主线程检查
+        :param builder_name:(type=str) 业务名称
+        :param request_type:(type=str) 引擎循环启动的类型
+        """
+
+        try:
+            self.__start_builder_request(builder_name, request_type)
+        except Exception as e:
+            self.__error_callback(e)
+        finally:
+            self.__builder_start_done[builder_name] = True
+            with self.__finish_condition:
+                self.__finish_condition.notify_all()
+
+    def __next_stage(self, builder_name, end_num):
+        """
+        获取业务的下一个循环启动编号，跳过业务没有定义的end_requests
+        :param builder_name:(type=str) 业务名称
+        :param end_num:(type=int) 当前的循环启动编号，start_requests为0
+        :return end_num:(type=int,None) 下一个循环启动编号，没有则为None
+        """
+
+        builder = self.__builders[builder_name]
+        for num in range(end_num + 1, 11):  # 与全局循环启动一致，限制10次内结束
+            if hasattr(builder, 'end_requests_%s' % num):
+                return num
+        return None
+
+    def __start_pipeline(self):
+        """
+        按业务各自推进引擎循环启动
+        1.所有业务同时执行start_requests任务，起始请求由专用线程依次添加
+        2.某个业务的请求全部完成后，立即执行该业务的下一个end_requests任务，不等待其他业务
+        3.业务没有下一个end_requests任务时，该业务结束；所有业务都结束后，引擎真正结束
+        """
+
+        self._init_stage('start_requests')
+        real_count = self.__prepare_workers('start_requests')
+        if not F_worker_loop:
+            for i in range(real_count):
+                self.__pool.apply_async(self.__execute_request_response_item, callback=self.__call_back,
+                                        error_callback=self.__error_callback)
+
+        # 所有业务先执行start_requests任务，0即为start_requests
+        # 从检查点恢复时，各业务从检查点里的任务继续，只有无法恢复的业务重新添加该任务的起始请求
+        resume, self.__resume = self.__resume, None
+        if resume is None:
+            stages = self.__stages = {builder_name: 0 for builder_name in self.__builders}
+            restart = list(stages)
+        else:
+            stages = self.__stages = {name: num for name, num in resume['stages'].items() if name in self.__builders}
+            restart = self.__restore(resume)
+        Thread(target=self.__stage_loop, daemon=True).start()
+        for builder_name in stages:
+            self.__builder_start_done[builder_name] = builder_name not in restart
+            if builder_name in restart:
+                self.__stage_tasks.put((builder_name, self.__request_type(stages[builder_name])))
+
+        # 主线程在条件变量上休眠，有业务完成当前任务时被唤醒，推进该业务的下一个任务
+        # 收到终止信号后不再推进，等待处理中的请求完成后停止
+        with self.__finish_condition:
+            while stages:
+                self.__finish_condition.wait_for(lambda: self.__drained or (
+                    self.__stop_deadline is None and any(self.__is_builder_finish(name) for name in stages)))
+                if self.__stop_deadline is not None:
+                    if self.__drained:
+                        break
+                    continue
+                for builder_name in [name for name in stages if self.__is_builder_finish(name)]:
+                    end_num = self.__next_stage(builder_name, stages[builder_name])
+                    if end_num is None:
+                        cf.print_log('业务%s没有后续请求任务，该业务结束！' % builder_name)
+                        del stages[builder_name]
+                        continue
+                    request_type = self.__request_type(end_num)
+                    cf.print_log('业务%s执行%s任务！' % (builder_name, request_type))
+                    stages[builder_name] = end_num
+                    self.__builder_start_done[builder_name] = False
+                    self.__stage_tasks.put((builder_name, request_type))
+        self.__stage_tasks.put(None)
+        self._finish_stage()
+
+    def _init_stage(self, request_type):
+        """
+        每次引擎循环启动前的初始化
+        :param request_type:(type=str) 引擎循环启动的类型
+        """
+
+        cf.print_log('执行%s任务！' % request_type)
+        if self.total_response_nums > self.total_request_nums and not self._scheduler.distributed:  # 分布式时各节点互相处理
+            self.total_response_nums = self.total_request_nums
+        self.__is_running = True  # 启动引擎，设置状态为True
+        with self.__finish_condition:  # 与写入检查点互斥，检查点里的循环启动编号与请求对象一致
+            self.__start_done = False
+            self.__stage = 0 if request_type == 'start_requests' else int(request_type.rsplit('_', 1)[1])
+
+    def _finish_stage(self):
+        """
+        每次引擎循环启动完成后的收尾
+        """
+
+        self.__is_running = False  # 标记引擎关闭
+        self.last_finish = self.total_request_nums  # 记录该次引擎请求数
 
     def start(self):
         """
@@ -514,21 +1210,355 @@ class Engine(object):
         2.先启动start_requests任务（必有），然后end_requests_1任务、end_requests_2任务、end_requests_3任务...以此类推
         3.end_request系列的任务不一定会有，这取决于所有加载成功的业务建造器
         4.当按顺序检索到所有业务建造器到某一点没有end_request任务，引擎不再循环启动，真正结束
+        5.以上为全局统一循环启动（F_stage_barrier为True），否则每个业务各自推进，详见_start_pipeline函数
+        6.开启检查点时定时写入检查点，从检查点恢复时从中断的任务继续，正常结束后删除检查点文件
+        7.收到终止信号后不再执行后续任务，详见__on_signal函数
         """
 
-        end_num = 1
+        finished = False  # 是否正常结束
+        handlers = dict()  # 引擎替换掉的信号处理函数，结束后恢复
+        if self.__metrics is not None:
+            self.__metrics.start()
+        if self.__pipeline_stage is not None:
+            self.__pipeline_stage.start()
+        if self.__checkpoint is not None:
+            Thread(target=self.__checkpoint_loop, daemon=True).start()
         try:
-            self.__start_engine('start_requests')  # 先执行start_request任务
-            while True:
-                request_type = 'end_requests_%s' % end_num
-                self.__start_engine(request_type)
-                if not self.__while_run or end_num >= 10:  # 防止未知BUG导致死循环，限制10次内结束，根据实际需求再调整
-                    cf.print_log('%s没有请求任务，引擎循环启动结束！' % request_type)
-                    break
+            handlers = self.__handle_signals()
+            if self._pipelined():  # 按业务各自推进，详见_start_pipeline函数
+                self.__start_pipeline()
+            else:
+                # 先执行start_request任务，从检查点恢复时则先执行中断的任务
+                end_num = max(self.__resume['stages'].values(), default=0) if self.__resume is not None else 0
+                self._start_engine(self.__request_type(end_num))
                 end_num += 1
+                while self.__stop_deadline is None:
+                    request_type = self.__request_type(end_num)
+                    self._start_engine(request_type)
+                    if not self.__while_run or end_num >= 10:  # 防止未知BUG导致死循环，限制10次内结束，根据实际需求再调整
+                        cf.print_log('%s没有请求任务，引擎循环启动结束！' % request_type)
+                        break
+                    end_num += 1
+            finished = self.__stop_deadline is None
         except CheckUnPass as e:
             logger.exception(e)
         except Exception as e:
             logger.ding_exception(self.__f_exception, e, self.framework_key)
+        self.__checkpoint_stop.set()
+        if self.__stop_deadline is not None:
+            self.__report_stop()
+        self._close_workers()
+        self.__close_pipelines()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        self.__signal_event.set()  # 没有收到终止信号时，让等待中的__drain线程退出
         cf.print_log('总共完成业务%s个！添加请求%s个，完成响应%s个，其中错误响应%s个！' % (
             self.__builders_num, self.total_request_nums, self.total_response_nums, self.total_error_nums))
+        peak, overflow = self._scheduler.peak()
+        cf.print_log('调度器等待中的请求对象峰值%s个（上限%s），超出上限添加%s个！' % (peak, F_scheduler_max, overflow))
+        if F_dupe_filter is not None:
+            cf.print_log('去重过滤重复请求%s个！' % self._scheduler.filtered())
+        for builder_name, (running, peak, limit) in sorted(self._scheduler.slots().items()):
+            cf.print_log('业务%s同时处理的请求峰值%s个（并发上限%s）！' % (builder_name, peak, limit))
+        if self.__session_pool is not None and self.__session_pool.stats()[0]:
+            created, reused = self.__session_pool.stats()
+            cf.print_log('网络请求会话池创建会话%s个（%s），复用会话%s次！' % (
+                sum(created.values()), '、'.join('%s：%s个' % one for one in sorted(created.items())), reused))
+        if self._http_cache is not None and any(self._http_cache.stats()):
+            cf.print_log('响应缓存直接返回%s次，条件请求返回304共%s次！' % self._http_cache.stats())
+        for key, (times, seconds) in sorted(self._rate_limiter.stats().items()):
+            cf.print_log('限流标识%s等待令牌%s次，共等待%.1f秒！' % (key, times, seconds))
+        if self.__pipeline_stage is not None:
+            peak, paused = self.__pipeline_stage.peak()
+            cf.print_log('管道阶段通道里等待中的数据对象峰值%s个（积压上限%s），因积压暂停获取请求对象%s次！' % (
+                peak, F_pipeline_backlog, paused))
+        if self.__controller is not None:
+            for (way, target), (limit, low, high) in sorted(self.__controller.limits().items()):
+                cf.print_log('自适应并发%s（%s）最终并发上限%s个，调整范围%s~%s个！' % (way, target, limit, low, high))
+        if F_timings:
+            self.__print_timings()
+        if self.__metrics is not None:
+            self.__metrics.close()
+        if self.__checkpoint is not None and finished:
+            self.__checkpoint.remove()
+            cf.print_log('运行正常结束，已删除检查点文件%s！' % self.__checkpoint.file)
+
+    def __handle_signals(self):
+        """
+        注册终止信号（SIGTERM）的处理函数，只能在主线程注册，F_drain_timeout为None时不注册
+        :return handlers:(type=dict) 信号为key，原来的处理函数为value，引擎结束后恢复
+        """
+
+        handlers = dict()
+        if F_drain_timeout is None or current_thread() is not main_thread():
+            return handlers
+        if not isinstance(F_drain_timeout, (int, float)) or F_drain_timeout < 0:
+            raise CheckUnPass('配置config中的F_drain_timeout不为None或大于等于0的数字，请修改！')
+        Thread(target=self.__drain, daemon=True).start()
+        for signum in (signal.SIGTERM,):
+            handlers[signum] = signal.signal(signum, self.__on_signal)
+        return handlers
+
+    def __on_signal(self, signum, frame):
+        """
+        终止信号的处理函数，在主线程执行，只做标记并唤醒__drain线程，其余都交给__drain线程
+        1.主线程收到信号时可能正持有调度器或引擎的锁，处理函数里不能获取任何锁，否则会死锁
+        2.再次收到终止信号时不再等待处理中的请求
+        :param signum:(type=int) 信号
+        :param frame:(type=frame) 收到信号时的栈帧，固定写法
+        """
+
+        if self.__stop_deadline is not None:
+            self.__forced = True
+            self.__stop_deadline = monotonic()
+            return
+        self.__signal_name = signal.Signals(signum).name
+        self.__stop_deadline = monotonic() + F_drain_timeout
+        self.__while_run = False
+        self.__signal_event.set()
+
+    def __running_nums(self):
+        """
+        获取处理中（已从调度器出队、未确认）的请求数
+        :return nums:(type=int) 请求数
+        """
+
+        nums = sum(running for running, peak, limit in self._scheduler.slots().values())
+        return nums
+
+    def __drain(self):
+        """
+        注册终止信号时启动的线程，等待收到终止信号（引擎结束时也会唤醒，没有收到终止信号则直接退出）
+        1.调度器暂停出队，不再分发新的请求，也不再执行后续任务
+        2.等待处理中的请求（包括解析与管道入库）完成，最多等待到截止时间，然后唤醒主线程停止
+        """
+
+        self.__signal_event.wait()
+        if self.__stop_deadline is None:
+            return
+        self._scheduler.pause()
+        cf.print_log('收到终止信号%s，停止分发新的请求，等待处理中的请求%s个完成（最多%s秒）...' % (
+            self.__signal_name, self.__running_nums(), F_drain_timeout))
+        self._wake()
+        while self.__running_nums() and monotonic() < self.__stop_deadline:
+            sleep(0.1)
+        with self.__finish_condition:
+            self.__drained = True
+        self._wake()
+
+    def _stop_deadline(self):
+        """
+        获取收到终止信号后等待处理中的请求完成的截止时间
+        :return deadline:(type=float,None) 截止时间（monotonic），没有收到终止信号则为None
+        """
+
+        deadline = self.__stop_deadline
+        return deadline
+
+    def _wake(self):
+        """
+        收到终止信号或停止时，唤醒等待中的主线程
+        """
+
+        with self.__finish_condition:
+            self.__finish_condition.notify_all()
+
+    def __report_stop(self):
+        """
+        收到终止信号停止后，播报放弃的请求，开启了检查点时写入最终的检查点
+        """
+
+        depth = {name: size for name, size in sorted(self._scheduler.depth().items()) if size}
+        running = {name: nums for name, (nums, peak, limit) in sorted(self._scheduler.slots().items()) if nums}
+        cf.print_log('收到终止信号，引擎已停止！放弃等待中的请求%s个，处理中未完成的请求%s个！' % (
+            sum(depth.values()), sum(running.values())))
+        for builder_name in sorted(set(depth) | set(running)):
+            cf.print_log('业务%s放弃等待中的请求%s个，未完成的请求%s个！' % (
+                builder_name, depth.get(builder_name, 0), running.get(builder_name, 0)))
+        if self.__checkpoint is None:
+            return
+        try:
+            saved = self.__save_checkpoint(final=True)
+        except Exception as e:
+            logger.exception('写入检查点文件（%s）失败：%s' % (self.__checkpoint.file, e))
+        else:
+            if saved:
+                cf.print_log('已写入检查点文件%s，以相同的脚本传参加上-r 1重新运行即从中断处继续！' % self.__checkpoint.file)
+            else:
+                logger.exception('当前任务的起始请求还没全部添加完，无法写入检查点，检查点文件%s仍为上一次写入的！' % self.__checkpoint.file)
+
+    @staticmethod
+    def __request_type(end_num):
+        """
+        根据循环启动编号获取引擎循环启动的类型
+        :param end_num:(type=int) 循环启动编号，start_requests为0
+        :return request_type:(type=str) 引擎循环启动的类型
+        """
+
+        request_type = 'start_requests' if end_num == 0 else 'end_requests_%s' % end_num
+        return request_type
+
+    def __load_checkpoint(self):
+        """
+        读取检查点，检查点不存在、读取失败或与当前的循环启动方式不一致时从头开始运行
+        :return state:(type=dict,None) 引擎的运行状态
+        """
+
+        try:
+            state = self.__checkpoint.load()
+        except Exception as e:
+            logger.exception('检查点文件（%s）读取失败，已从头开始运行：%s' % (self.__checkpoint.file, e))
+            return None
+        if state is None:
+            cf.print_log('没有找到检查点文件%s，从头开始运行！' % self.__checkpoint.file)
+        elif state['pipelined'] != self._pipelined():
+            logger.exception('检查点的引擎循环启动方式（F_stage_barrier）与当前配置不一致，已从头开始运行！')
+            state = None
+        else:
+            cf.print_log('从检查点文件%s（写入时间%s）恢复运行！' % (self.__checkpoint.file, state['time']))
+        return state
+
+    def __checkpoint_loop(self):
+        """
+        定时写入检查点，直到引擎结束
+        """
+
+        while not self.__checkpoint_stop.wait(F_checkpoint_interval):
+            try:
+                self.__save_checkpoint()
+            except Exception as e:
+                logger.exception('写入检查点文件（%s）失败：%s' % (self.__checkpoint.file, e))
+
+    def __save_checkpoint(self, final=False):
+        """
+        写入检查点
+        1.在主线程推进循环启动的条件变量里获取快照，快照期间循环启动编号不会变化
+        2.当前任务的起始请求还没全部添加完时跳过（起始请求的生成器无法保存），等下一次再写入
+        3.收到终止信号停止后写入最终的检查点，此时该次循环启动可能已完成收尾，不再要求引擎运作中
+        4.调度器的锁内只复制快照，序列化与写入文件都在锁外；磁盘调度器溢出的请求对象只引用分段文件，不读出
+        5.快照里的去重过滤器被冻结，需在解除引用（unpin）之前序列化
+        :param final:(type=bool) 是否停止后写入的最终检查点，默认False
+        :return saved:(type=bool) 是否已写入
+        """
+
+        with self.__checkpoint_lock:
+            with self.__finish_condition:
+                if self._pipelined():
+                    stages = dict(self.__stages)
+                    ready = all(self.__builder_start_done.get(name) for name in stages)
+                else:
+                    stages = {name: self.__stage for name in self.__builders}
+                    ready = (self.__is_running or final) and self.__start_done
+                if not ready:
+                    return False
+                requests, segments, dupe_filter = self._scheduler.snapshot()
+                counters = self.__counters.snapshot()
+            try:
+                requests, restart = self.__checkpoint.dumps_requests(requests)
+                linked = self.__checkpoint.link_segments(
+                    {name: value for name, value in segments.items() if name not in restart})
+                dupe_filter = pickle.dumps(dupe_filter, pickle.HIGHEST_PROTOCOL) if dupe_filter is not None else None
+            finally:
+                self._scheduler.unpin(segments)
+            self.__checkpoint.save({
+                'pipelined': self._pipelined(), 'stages': stages, 'requests': requests, 'segments': linked,
+                'restart': restart, 'counters': counters, 'dupe_filter': dupe_filter,
+                'time': cf.datetime_timedelta('seconds', 0, format_=format_datetime_n)})
+        return True
+
+    def __restore(self, state):
+        """
+        从检查点恢复请求对象与统计计数
+        1.完成响应数与错误数沿用检查点里的，请求数为完成响应数加上恢复的请求对象数
+        2.无法恢复的业务（有无法序列化或反序列化的请求对象）需重新执行当前任务，由调用方重新添加起始请求
+        3.检查点引用的分段文件在交给调度器时才逐个读出，不一次性读入内存
+        :param state:(type=dict) 引擎的运行状态
+        :return restart:(type=list) 需要重新执行当前任务的业务
+        """
+
+        # 1.反序列化请求对象，只恢复本次开启了的、还未结束的业务
+        restart, requests, spilled = list(), dict(), dict()
+        for builder_name in state['stages']:
+            if builder_name not in self.__builders:
+                continue
+            if builder_name in state['restart']:
+                restart.append(builder_name)
+                continue
+            try:
+                requests[builder_name] = [pickle.loads(data) for data in state['requests'].get(builder_name, list())]
+                files, count = state.get('segments', dict()).get(builder_name, (list(), 0))
+                self.__checkpoint.check_segments(files)
+                spilled[builder_name] = (files, count)
+            except Exception as e:
+                logger.exception('业务%s的请求对象从检查点恢复失败，将重新执行当前任务：%s' % (builder_name, e))
+                requests.pop(builder_name, None)
+                restart.append(builder_name)
+
+        # 2.先恢复统计计数，再把请求对象交给调度器，避免请求对象在计数前就已完成响应
+        counters = state['counters']
+        nums = {name: len(value) + spilled[name][1] for name, value in requests.items()}
+        self.__counters.set('response', counters['response'])
+        self.__counters.set('error', counters['error'])
+        self.__counters.set('request', counters['response'] + sum(nums.values()))
+        for builder_name in self.__builders:
+            response_nums = counters.get(('response', builder_name), 0)
+            self.__counters.set(('response', builder_name), response_nums)
+            self.__counters.set(('request', builder_name), response_nums + nums.get(builder_name, 0))
+
+        # 3.分段文件读取出错时（比如文件损坏），已读出的照常恢复，扣掉没能恢复的请求数，否则引擎永远不会结束
+        lost = dict()
+
+        def read(builder_name):
+            files, count = spilled[builder_name]
+            restored = 0
+            try:
+                for request in self.__checkpoint.read_segments(files):
+                    restored += 1
+                    yield request
+            except Exception as e:
+                logger.exception('业务%s从检查点引用的分段文件恢复请求对象失败，已恢复%s个，放弃%s个：%s' % (
+                    builder_name, restored, count - restored, e))
+            lost[builder_name] = count - restored
+
+        self._scheduler.restore(chain.from_iterable(chain(value, read(name)) for name, value in requests.items()),
+                                state['dupe_filter'])
+        for builder_name, missing in lost.items():
+            if missing:
+                self.__counters.incr('request', -missing)
+                self.__counters.incr(('request', builder_name), -missing)
+        cf.print_log('从检查点恢复请求对象%s个！%s' % (sum(nums.values()) - sum(lost.values()), '业务%s重新执行当前任务！' % '、'.join(
+            restart) if restart else ''))
+        return restart
+
+    def __metrics_snapshot(self):
+        """
+        采集运行指标，供运行指标组件输出
+        :return snapshot:(type=dict) 计数、每个业务等待中与处理中的请求数、分阶段耗时、管道写入的数据行数与管道阶段的积压数
+        """
+
+        snapshot = {
+            'counters': self.__counters.snapshot(),
+            'depth': self._scheduler.depth(),
+            'running': {name: running for name, (running, peak, limit) in self._scheduler.slots().items()},
+            'timings': self.__timings.summary(),
+            'rows': written_rows(),
+            'backlog': self.__pipeline_stage.qsize() if self.__pipeline_stage is not None else 0
+        }
+        return snapshot
+
+    def __print_timings(self):
+        """
+        打印分阶段耗时统计（按总耗时倒序），配置了F_timings_path则同时写入json文件
+        """
+
+        for one in self.__timings.summary():
+            cf.print_log('耗时统计%s（%s.%s）：%s次，总耗时%.3f秒，平均%.2f毫秒，P50/P90/P99为%.2f/%.2f/%.2f毫秒，最大%.2f毫秒！' % (
+                one['phase'], one['builder'], one['name'], one['count'], one['total'], one['avg'] * 1000,
+                one['p50'] * 1000, one['p90'] * 1000, one['p99'] * 1000, one['max'] * 1000))
+        if F_timings_path is not None:
+            try:
+                self.__timings.dump(F_timings_path)
+            except Exception as e:
+                logger.exception('分阶段耗时统计写入文件（%s）失败：%s' % (F_timings_path, e))
+            else:
+                cf.print_log('分阶段耗时统计已写入文件%s！' % F_timings_path)
@@ -0,0 +1,346 @@
+"""
+网络请求响应缓存组件：
+1.请求对象的下载信息带上web_cache=True才使用缓存，按请求方式、请求地址、请求体与带有身份的请求头的特征值缓存原生响应
+2.缓存时间（cache_ttl，秒）内直接返回缓存的响应，不发起网络请求
+3.超过缓存时间后带上If-None-Match/If-Modified-Since发起条件请求，服务端返回304时直接使用缓存的响应，只花一次304的代价
+4.内存里按最久未使用淘汰（LRU），可同时保存到磁盘，下次运行仍可使用，适合定时重复拉取同一份没有变化的报表
+5.只缓存状态码为200、没有上传文件的响应，且需带有ETag/Last-Modified或设置了缓存时间，否则缓存没有意义
+6.遵守响应头的Vary，缓存时记下Vary列出的请求头，之后的请求这些请求头不同则不使用缓存；Vary为*的响应不缓存
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import requests
+from threading import Lock
+from collections import OrderedDict
+from framework.error.check_error import CheckUnPass
+
+# 参与计算特征值的请求头（小写），带有身份的请求头不同时响应可能不同，比如不同账号的报表
+_key_headers = ('authorization', 'proxy-authorization', 'cookie')
+
+# 名称（小写）包含这些字样的请求头同样视为带有身份，比如X-Access-Token、X-Api-Key
+_key_words = ('token', 'auth', 'key', 'session', 'sign')
+
+
+class HttpCache(object):
+    """
+    网络请求响应缓存组件
+    """
+
+    def __init__(self, size=1000, path=None):
+        """
+        初始配置
+        :param size:(type=int) 内存里缓存的响应数上限，必须为大于等于1的整数，默认1000
+        :param path:(type=str) 磁盘缓存目录，默认None只缓存在内存里
+        """
+
+        if not isinstance(size, int) or size < 1:
+            raise CheckUnPass('响应缓存内存里缓存的响应数上限必须为大于等于1的整数！')
+        self.__size = size
+        self.__path = path
+        self.__entries = OrderedDict()  # 内存里的缓存，特征值为key，缓存条目为value，最近使用的在最后
+        self.__hits = 0  # 缓存时间内直接返回的次数
+        self.__revalidated = 0  # 条件请求返回304的次数
+        self.__lock = Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(method, url, data=None, headers=None):
+        """
+        计算缓存的特征值，请求体的key排序后再计算，与传参顺序无关
+        请求头只有带有身份的参与计算（见_key_headers、_key_words），User-Agent等其余请求头不影响特征值
+        :param method:(type=str) 请求方式
+        :param url:(type=str) 请求地址
+        :param data:(type=dict,str,bytes) 请求体，默认None
+        :param headers:(type=dict) 请求头，默认None
+        :return key:(type=str) 特征值
+        """
+
+        if isinstance(data, bytes):
+            data = data.hex()
+        body = json.dumps(data, sort_keys=True, ensure_ascii=False, default=repr)
+        identity = sorted((name.lower(), str(value)) for name, value in (headers or dict()).items()
+                          if name.lower() in _key_headers or any(word in name.lower() for word in _key_words))
+        identity = json.dumps(identity, ensure_ascii=False)
+        key = hashlib.sha1(('%s\0%s\0%s\0%s' % (method.lower(), url, body, identity)).encode()).hexdigest()
+        return key
+
+    @staticmethod
+    def __vary(response, headers):
+        """
+        获取响应头Vary列出的请求头在该次请求里的值
+        :param response:(type=requests.Response) 原生响应对象
+        :param headers:(type=dict) 发起请求的请求头
+        :return vary:(type=dict,None) 请求头名称（小写）为key，请求头的值为value（没有则为None），Vary为*时返回None
+        """
+
+        headers = {name.lower(): str(value) for name, value in (headers or dict()).items()}
+        names = [name.strip().lower() for name in response.headers.get('Vary', '').split(',') if name.strip()]
+        if '*' in names:
+            return None
+        vary = {name: headers.get(name) for name in names}
+        return vary
+
+    @staticmethod
+    def match(entry, headers):
+        """
+        判断缓存条目是否可用于该次请求，即Vary列出的请求头与缓存时的一致
+        :param entry:(type=dict) 缓存条目
+        :param headers:(type=dict) 该次请求的请求头
+        :return result:(type=bool) 是否可用
+        """
+
+        headers = {name.lower(): str(value) for name, value in (headers or dict()).items()}
+        result = all(headers.get(name) == value for name, value in entry.get('vary', dict()).items())
+        return result
+
+    def __file(self, key):
+        """
+        获取缓存条目在磁盘上的文件路径
+        :param key:(type=str) 特征值
+        :return path:(type=str) 文件路径
+        """
+
+        path = os.path.join(self.__path, key + '.cache')
+        return path
+
+    def get(self, key):
+        """
+        获取缓存条目，内存里没有则从磁盘读取
+        :param key:(type=str) 特征值
+        :return entry:(type=dict,None) 缓存条目，没有则返回None
+        """
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                return entry
+        if self.__path is None:
+            return None
+        try:
+            with open(self.__file(key), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        self.__remember(key, entry)
+        return entry
+
+    def __remember(self, key, entry):
+        """
+        把缓存条目放入内存，超过上限时淘汰最久未使用的
+        :param key:(type=str) 特征值
+        :param entry:(type=dict) 缓存条目
+        """
+
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__size:
+                self.__entries.popitem(last=False)
+
+    def __save(self, key, entry):
+        """
+        保存缓存条目到内存，开启磁盘缓存时同时写入磁盘（先写临时文件再替换，不会读到写了一半的文件）
+        :param key:(type=str) 特征值
+        :param entry:(type=dict) 缓存条目
+        """
+
+        self.__remember(key, entry)
+        if self.__path is not None:
+            temp = '%s.%s.tmp' % (self.__file(key), os.getpid())
+            with open(temp, 'wb') as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, self.__file(key))
+
+    @staticmethod
+    def ttl(kwargs):
+        """
+        获取下载信息里的缓存时间
+        :param kwargs:(type=dict) 下载信息
+        :return ttl:(type=int,float) 缓存时间（秒），默认0每次都发起条件请求
+        """
+
+        ttl = kwargs.get('cache_ttl', 0)
+        if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl < 0:
+            raise CheckUnPass('响应缓存的缓存时间cache_ttl必须为大于等于0的数字！')
+        return ttl
+
+    def fresh(self, entry, ttl):
+        """
+        判断缓存条目是否仍在缓存时间内，是则计入命中次数
+        :param entry:(type=dict) 缓存条目
+        :param ttl:(type=int,float) 缓存时间（秒）
+        :return result:(type=bool) 是否在缓存时间内
+        """
+
+        result = ttl > 0 and time.time() - entry['time'] < ttl
+        if result:
+            with self.__lock:
+                self.__hits += 1
+        return result
+
+    @staticmethod
+    def validators(entry):
+        """
+        获取条件请求需要带上的请求头
+        :param entry:(type=dict,None) 缓存条目
+        :return headers:(type=dict) 请求头，没有缓存条目或缓存条目没有ETag/Last-Modified则为空
+        """
+
+        headers = dict()
+        if entry is not None:
+            if entry['etag'] is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, key, response, ttl, headers=None):
+        """
+        缓存响应，不满足缓存条件则不缓存
+        :param key:(type=str) 特征值
+        :param response:(type=requests.Response) 原生响应对象
+        :param ttl:(type=int,float) 缓存时间（秒）
+        :param headers:(type=dict) 发起请求的请求头，用于记下Vary列出的请求头，默认None
+        """
+
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if response.status_code != 200 or (etag is None and last_modified is None and ttl <= 0):
+            return
+        vary = self.__vary(response, headers)
+        if vary is None:
+            return
+        entry = {'status_code': response.status_code, 'reason': response.reason, 'headers': dict(response.headers),
+                 'encoding': response.encoding, 'url': response.url, 'content': response.content, 'etag': etag,
+                 'last_modified': last_modified, 'time': time.time(), 'vary': vary}
+        self.__save(key, entry)
+
+    def revalidate(self, key, entry, response):
+        """
+        条件请求返回304时，更新缓存条目的时间与服务端返回的新校验值，重新开始计算缓存时间
+        :param key:(type=str) 特征值
+        :param entry:(type=dict) 缓存条目
+        :param response:(type=requests.Response) 304的原生响应对象
+        :return entry:(type=dict) 更新后的缓存条目
+        """
+
+        entry = dict(entry, time=time.time(), etag=response.headers.get('ETag', entry['etag']),
+                     last_modified=response.headers.get('Last-Modified', entry['last_modified']))
+        self.__save(key, entry)
+        with self.__lock:
+            self.__revalidated += 1
+        return entry
+
+    @staticmethod
+    def response(entry):
+        """
+        根据缓存条目构造原生响应对象，业务代码可以像网络请求一样使用text、content、json等
+        :param entry:(type=dict) 缓存条目
+        :return response:(type=requests.Response) 原生响应对象
+        """
+
+        response = requests.models.Response()
+        response.status_code = entry['status_code']
+        response.reason = entry['reason']
+        response.headers = requests.structures.CaseInsensitiveDict(entry['headers'])
+        response.encoding = entry['encoding']
+        response.url = entry['url']
+        response._content = entry['content']
+        return response
+
+    def client(self, ttl=0, session=None):
+        """
+        获取带缓存的请求客户端，传给非业务公共函数的session参数使用
+        :param ttl:(type=int,float) 缓存时间（秒），见ttl函数，默认0每次都发起条件请求
+        :param session:(type=Session) 实际发起请求的会话，默认None使用requests
+        :return client:(type=CachedClient) 请求客户端
+        """
+
+        client = CachedClient(self, ttl, session)
+        return client
+
+    def stats(self):
+        """
+        获取缓存的使用情况
+        :return hits:(type=int) 缓存时间内直接返回的次数
+        :return revalidated:(type=int) 条件请求返回304的次数
+        """
+
+        with self.__lock:
+            hits, revalidated = self.__hits, self.__revalidated
+        return hits, revalidated
+
+
+class CachedClient(object):
+    """
+    带缓存的请求客户端，与requests一样提供get、post方法
+    """
+
+    def __init__(self, cache, ttl, session=None):
+        """
+        初始配置
+        :param cache:(type=HttpCache) 响应缓存
+        :param ttl:(type=int,float) 缓存时间（秒）
+        :param session:(type=Session) 实际发起请求的会话，默认None使用requests
+        """
+
+        self.__cache = cache
+        self.__ttl = ttl
+        self.__client = requests if session is None else session
+
+    def __request(self, method, url, headers=None, data=None, files=None, **kwargs):
+        """
+        发起请求，缓存时间内直接返回缓存的响应，否则发起条件请求，Vary列出的请求头与缓存时不同则不使用缓存
+        :param method:(type=str) 请求方式，get或post
+        :param url:(type=str) 请求地址
+        :param headers:(type=dict) 请求头，默认None
+        :param data:(type=dict) 请求体，默认None
+        :param files:(type=dict) 上传的文件，有则不使用缓存，默认None
+        :param kwargs:(type=dict) 其余传给requests的关键字参数
+        :return response:(type=requests.Response) 原生响应对象
+        """
+
+        if files is not None:
+            return getattr(self.__client, method)(url, headers=headers, data=data, files=files, **kwargs)
+        key = self.__cache.key(method, url, data if method == 'post' else None, headers)
+        entry = self.__cache.get(key)
+        if entry is not None and not self.__cache.match(entry, headers):
+            entry = None
+        if entry is not None and self.__cache.fresh(entry, self.__ttl):
+            return self.__cache.response(entry)
+        request_headers = dict(headers or dict(), **self.__cache.validators(entry))
+        if method == 'post':
+            kwargs['data'] = data
+        response = getattr(self.__client, method)(url, headers=request_headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            response = self.__cache.response(self.__cache.revalidate(key, entry, response))
+        else:
+            self.__cache.put(key, response, self.__ttl, headers)
+        return response
+
+    def get(self, url, **kwargs):
+        """
+        发起get请求
+        :param url:(type=str) 请求地址
+        :param kwargs:(type=dict) 其余传给requests的关键字参数
+        :return response:(type=requests.Response) 原生响应对象
+        """
+
+        response = self.__request('get', url, **kwargs)
+        return response
+
+    def post(self, url, **kwargs):
+        """
+        发起post请求
+        :param url:(type=str) 请求地址
+        :param kwargs:(type=dict) 其余传给requests的关键字参数
+        :return response:(type=requests.Response) 原生响应对象
+        """
+
+        response = self.__request('post', url, **kwargs)
+        return response
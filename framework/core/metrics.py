@@ -0,0 +1,190 @@
+"""
+运行指标组件：
+1.引擎运行期间，以Prometheus文本格式输出运行指标，方便观察吞吐量、发现卡住的业务，不需要解析日志
+2.可开启HTTP端点（GET任意路径均返回指标），也可定时把指标写入文件，两者可同时开启
+3.指标包括请求、响应与错误总数，每个业务等待中与处理中的请求数，分阶段耗时直方图，管道写入每个表的数据行数，管道阶段的积压数
+4.HTTP端点与定时写入都在守护线程里运行，每次都重新采集，不影响引擎工作线程
+"""
+
+import os
+from threading import Thread, Event
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from utils import common_function as cf
+from services import logger
+
+
+def _escape(value):
+    """
+    转义标签的值
+    :param value:(type=str) 标签的值
+    :return value:(type=str) 转义后的值
+    """
+
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return value
+
+
+def _labels(**labels):
+    """
+    拼接标签
+    :param labels:(type=dict) 标签名为key，标签的值为value
+    :return text:(type=str) 拼接后的标签，没有标签则为空字符串
+    """
+
+    text = '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in labels.items()) if labels else ''
+    return text
+
+
+def render(snapshot):
+    """
+    把引擎采集的指标转为Prometheus文本格式
+    :param snapshot:(type=dict) 引擎采集的指标，详见引擎的__metrics_snapshot函数
+    :return text:(type=str) Prometheus文本格式的指标
+    """
+
+    lines = list()
+
+    def metric(name, type_, help_, samples):
+        lines.append('# HELP %s %s' % (name, help_))
+        lines.append('# TYPE %s %s' % (name, type_))
+        for labels, value in samples:
+            lines.append('%s%s %s' % (name, _labels(**labels), value))
+
+    # 1.请求、响应与错误总数
+    counters = snapshot['counters']
+    for type_, help_ in (('request', '添加的请求总数'), ('response', '完成的响应总数'), ('error', '错误响应总数')):
+        metric('c3_%ss_total' % type_, 'counter', help_, [({}, counters[type_])])
+    for type_, help_ in (('request', '每个业务添加的请求数'), ('response', '每个业务完成的响应数')):
+        metric('c3_builder_%ss_total' % type_, 'counter', help_, [
+            ({'builder': key[1]}, value) for key, value in sorted(counters.items(), key=str)
+            if isinstance(key, tuple) and key[0] == type_])
+
+    # 2.调度器等待中与处理中的请求数
+    metric('c3_scheduler_depth', 'gauge', '每个业务在调度器里等待中的请求数', [
+        ({'builder': name}, size) for name, size in sorted(snapshot['depth'].items())])
+    metric('c3_active_requests', 'gauge', '每个业务处理中的请求数', [
+        ({'builder': name}, running) for name, running in sorted(snapshot['running'].items())])
+    metric('c3_inflight_requests', 'gauge', '处理中（已出队、未完成）的请求总数', [({}, sum(snapshot['running'].values()))])
+
+    # 3.分阶段耗时直方图，直方图的区间上限由毫秒转为秒，并转为累计值
+    samples = list()
+    for one in snapshot['timings']:
+        labels = {'phase': one['phase'], 'builder': one['builder'], 'name': one['name']}
+        accumulate = 0
+        for bound, num in one['histogram'].items():
+            accumulate += num
+            le = '+Inf' if bound == 'inf' else repr(float(bound) / 1000)
+            samples.append(('_bucket', dict(labels, le=le), accumulate))
+        samples.append(('_sum', labels, one['total']))
+        samples.append(('_count', labels, one['count']))
+    lines.append('# HELP c3_stage_seconds 分阶段耗时（phase为阶段，download阶段的name为采集方式）')
+    lines.append('# TYPE c3_stage_seconds histogram')
+    for suffix, labels, value in samples:
+        lines.append('c3_stage_seconds%s%s %s' % (suffix, _labels(**labels), value))
+
+    # 4.管道写入每个表的数据行数，Redis按连接名称统计
+    metric('c3_pipeline_rows_total', 'counter', '管道通用入库接口写入的数据行数', [
+        ({'db_type': db_type, 'table': table}, rows) for (db_type, table), rows in sorted(snapshot['rows'].items())])
+    metric('c3_pipeline_backlog', 'gauge', '管道阶段通道里等待中的数据对象数', [({}, snapshot['backlog'])])
+    text = '\n'.join(lines) + '\n'
+    return text
+
+
+class Metrics(object):
+    """
+    运行指标组件
+    """
+
+    def __init__(self, collect, host='127.0.0.1', port=None, path=None, interval=10):
+        """
+        初始配置
+        :param collect:(type=function) 采集指标的函数，返回引擎采集的指标
+        :param host:(type=str) HTTP端点监听的地址，默认127.0.0.1
+        :param port:(type=int) HTTP端点监听的端口，默认None不开启
+        :param path:(type=str) 定时写入指标的文件路径，默认None不写入
+        :param interval:(type=int,float) 定时写入的间隔（单位：秒），默认10
+        """
+
+        self.__collect = collect
+        self.__host = host
+        self.__port = port
+        self.__path = path
+        self.__interval = interval
+        self.__server = None  # HTTP服务
+        self.__writer = None  # 定时写入文件的线程
+        self.__stop = Event()
+
+    def text(self):
+        """
+        采集一次指标
+        :return text:(type=str) Prometheus文本格式的指标
+        """
+
+        text = render(self.__collect())
+        return text
+
+    def start(self):
+        """
+        开启HTTP端点与定时写入，开启失败只记录日志，不影响引擎运行
+        """
+
+        if self.__port is not None:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = metrics.text().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                self.__server = ThreadingHTTPServer((self.__host, self.__port), Handler)
+            except OSError as e:
+                logger.exception('运行指标HTTP端点（%s:%s）开启失败：%s' % (self.__host, self.__port, e))
+            else:
+                self.__server.daemon_threads = True
+                Thread(target=self.__server.serve_forever, daemon=True).start()
+                cf.print_log('运行指标HTTP端点已开启：http://%s:%s/metrics' % (self.__host, self.__port))
+        if self.__path is not None:
+            self.__writer = Thread(target=self.__write_loop, daemon=True)
+            self.__writer.start()
+
+    def __write(self):
+        """
+        把指标写入文件，先写临时文件再替换，读取方不会读到写了一半的文件
+        """
+
+        temporary = '%s.tmp' % self.__path
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.write(self.text())
+            os.replace(temporary, self.__path)
+        except Exception as e:
+            logger.exception('运行指标写入文件（%s）失败：%s' % (self.__path, e))
+
+    def __write_loop(self):
+        """
+        定时把指标写入文件，直到关闭
+        """
+
+        while not self.__stop.wait(self.__interval):
+            self.__write()
+
+    def close(self):
+        """
+        关闭HTTP端点与定时写入，关闭前把最终的指标写入文件
+        """
+
+        self.__stop.set()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+        if self.__writer is not None:
+            self.__writer.join()
+            self.__write()
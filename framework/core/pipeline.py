@@ -11,6 +11,21 @@ from utils import common_profession as cp
 from utils import common_function as cf
 from utils.mysql import ExecuteError as mysql_exe
 
+# 通用入库接口写入的数据行数，(数据库类型, 表名)为key（Redis为连接名称），所有业务管道共用
+_rows = dict()
+_rows_lock = Lock()
+
+
+def written_rows():
+    """
+    获取通用入库接口写入的数据行数
+    :return rows:(type=dict) (数据库类型, 表名)为key（Redis为连接名称），数据行数为value
+    """
+
+    with _rows_lock:
+        rows = dict(_rows)
+    return rows
+
 
 class Pipeline(object):
     """
@@ -111,6 +126,15 @@ class Pipeline(object):
         result = None
         return result
 
+    def close(self):
+        """
+        1.引擎真正结束后（包括收到终止信号停止后）调用，多个业务共用的管道只调用一次
+        2.继承后，可重写该方法，比如管道里缓冲了数据批量入库时，在此把缓冲中的数据写入数据库
+        3.默认管道每个数据对象直接入库，没有需要收尾的数据
+        """
+
+        pass
+
     @staticmethod
     def request(*args, **kwargs):
         """
@@ -166,3 +190,11 @@ class Pipeline(object):
                 clickhouse_db.insert(**data)
         else:
             raise ParameterError('db_type', ['mysql', 'redis', 'clickhouse'])
+
+        # 统计写入的数据行数，MySQL的values、ClickHouse的parameters为多条数据时按条数统计，Redis每次写入统计为一行
+        # Redis的键通常带有实体编号，按键统计会让指标的标签无限增长，因此按连接名称统计
+        values = data.get('values', data.get('parameters'))
+        rows = len(values) if isinstance(values, list) and values and isinstance(values[0], (list, tuple, dict)) else 1
+        key = (db_type, str(db_name if db_type == 'redis' else data.get('table')))
+        with _rows_lock:
+            _rows[key] = _rows.get(key, 0) + rows
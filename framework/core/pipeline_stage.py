@@ -0,0 +1,231 @@
+"""
+管道阶段组件：
+1.开启后，解析函数yield的数据对象不再在解析的线程里直接交给管道，而是放入有界通道，由单独的管道线程处理
+2.下载、解析与管道入库在不同的线程里同时进行，解析出大量数据对象的响应不再长时间占用一个工作线程
+3.通道已满时，放入数据对象的解析线程阻塞等待，实现背压，防止内存无限增长
+4.管道线程数与下载的并发数分开配置，写入慢的业务与下载慢的业务可分别调整
+5.可设置积压上限，通道里等待中的数据对象达到上限时，下载侧暂停获取新的请求对象，降到一半以下再继续
+6.同一个响应对象的数据对象组成一个批次，批次全部处理完成（且解析已结束）后才回调，由引擎确认请求对象并计入完成响应
+7.每个管道线程有自己的通道，同一个批次的数据对象只放入一个通道，由同一个管道线程按yield的顺序处理（如先删除再插入）
+8.收到终止信号停止时放弃通道里剩余的数据对象，最多等待指定秒数让管道线程退出，并返回放弃的数据对象数
+"""
+
+from time import monotonic
+from queue import Queue, Full
+from threading import Thread, Lock, Condition
+from framework.error.check_error import CheckUnPass
+
+
+class Batch(object):
+    """
+    一个响应对象交给管道阶段的数据对象批次
+    """
+
+    def __init__(self):
+        """
+        初始配置
+        """
+
+        self.__pending = 1  # 未完成数，解析本身占一个，解析结束时释放
+        self.__callback = None  # 批次全部完成后的回调函数
+        self.channel = None  # 批次分配到的通道序号，放入第一个数据对象时分配
+        self.__lock = Lock()
+
+    def add(self):
+        """
+        批次新增一个数据对象
+        """
+
+        with self.__lock:
+            self.__pending += 1
+
+    def done(self):
+        """
+        一个数据对象处理完成，批次全部完成且解析已结束时调用回调函数
+        """
+
+        with self.__lock:
+            self.__pending -= 1
+            callback = self.__callback if self.__pending == 0 else None
+        if callback is not None:
+            callback()
+
+    def finish(self, callback):
+        """
+        解析已结束，设置回调函数，数据对象已全部处理完成时立即回调
+        :param callback:(type=function) 回调函数，不接收参数
+        """
+
+        with self.__lock:
+            self.__callback = callback
+        self.done()
+
+
+class PipelineStage(object):
+    """
+    管道阶段组件
+    """
+
+    def __init__(self, process, size=1000, workers=1, backlog=None, error_callback=None):
+        """
+        初始配置
+        :param process:(type=function) 处理一个数据对象的函数，接收业务名称与数据对象
+        :param size:(type=int) 通道容量（数据对象数），按管道线程数平分给每个通道，必须为大于等于1的整数，默认1000
+        :param workers:(type=int) 管道线程数，必须为大于等于1的整数，默认1
+        :param backlog:(type=int) 积压上限（数据对象数），必须为None或1到通道容量之间的整数，默认None不限制
+        :param error_callback:(type=function) 管道线程出现框架级错误时的回调函数，接收异常对象，默认None
+        """
+
+        if not isinstance(size, int) or size < 1:
+            raise CheckUnPass('管道阶段的通道容量必须为大于等于1的整数！')
+        if not isinstance(workers, int) or workers < 1:
+            raise CheckUnPass('管道阶段的管道线程数必须为大于等于1的整数！')
+        if backlog is not None and (not isinstance(backlog, int) or not 1 <= backlog <= size):
+            raise CheckUnPass('管道阶段的积压上限必须为None或1到通道容量之间的整数！')
+        self.__process = process
+        self.__error_callback = error_callback
+        # 每个管道线程一个有界通道，元素为(批次, 业务名称, 数据对象)，None为结束标记
+        self.__queues = [Queue(max(1, size // workers)) for i in range(workers)]
+        self.__workers = [Thread(target=self.__work, args=(queue,), daemon=True) for queue in self.__queues]
+        self.__backlog = backlog
+        self.__congested = False  # 是否积压中，积压中下载侧暂停获取新的请求对象
+        self.__condition = Condition()  # 等待积压消退
+        self.__peak = 0  # 通道里等待中的数据对象数的峰值
+        self.__paused = 0  # 因积压而暂停的次数
+        self.__abandon = False  # 是否放弃通道里剩余的数据对象，收到终止信号停止时为True
+        self.__dropped = 0  # 放弃的数据对象数
+        self.__busy = 0  # 正在调用管道的管道线程数
+        self.__lock = Lock()
+
+    def start(self):
+        """
+        启动管道线程
+        """
+
+        for worker in self.__workers:
+            worker.start()
+
+    def put(self, batch, builder_name, item):
+        """
+        把数据对象放入批次分配到的通道，通道已满时阻塞等待
+        批次放入第一个数据对象时分配等待中的数据对象最少的通道，之后都放入该通道，保证批次内的处理顺序
+        :param batch:(type=Batch) 数据对象所属的批次
+        :param builder_name:(type=str) 业务名称
+        :param item:(type=Item) 数据对象
+        """
+
+        if batch.channel is None:  # 同一个批次只在解析的线程里放入，不需要加锁
+            batch.channel = min(range(len(self.__queues)), key=lambda i: self.__queues[i].qsize())
+        batch.add()
+        self.__queues[batch.channel].put((batch, builder_name, item))
+        size = self.qsize()
+        if size > self.__peak:
+            self.__peak = size
+        # 在条件变量里重新判断，确保标记积压时通道里仍有足够的数据对象，之后必有管道线程取出时解除积压
+        if self.__backlog is not None and size >= self.__backlog and not self.__congested:
+            with self.__condition:
+                if not self.__congested and self.qsize() >= self.__backlog:
+                    self.__congested = True
+                    self.__paused += 1
+
+    @property
+    def congested(self):
+        """
+        是否积压中
+        :return congested:(type=bool) 是否积压中
+        """
+
+        congested = self.__congested
+        return congested
+
+    def wait(self, timeout=None):
+        """
+        下载侧获取新的请求对象前调用，积压中则阻塞等待积压消退
+        :param timeout:(type=int,float) 超时时间（秒），默认None一直等待
+        :return result:(type=bool) 是否已不积压，超时仍积压时为False
+        """
+
+        if not self.__congested:
+            return True
+        with self.__condition:
+            result = self.__condition.wait_for(lambda: not self.__congested, timeout)
+        return result
+
+    def __work(self, queue):
+        """
+        管道线程的循环，处理完一个数据对象后标记批次（出错也要标记，否则该请求对象永远不会确认），获取到结束标记后退出
+        :param queue:(type=Queue) 该管道线程的通道
+        """
+
+        while True:
+            one = queue.get()
+            if one is None:
+                break
+            batch, builder_name, item = one
+            with self.__lock:  # 与close函数互斥，放弃之后不会再有管道线程开始调用管道
+                if self.__abandon:  # 放弃的数据对象不标记批次，所属的请求对象不会确认
+                    self.__dropped += 1
+                    continue
+                self.__busy += 1
+            if self.__congested:  # 降到积压上限的一半以下，积压消退
+                with self.__condition:
+                    if self.__congested and self.qsize() <= self.__backlog // 2:
+                        self.__congested = False
+                        self.__condition.notify_all()
+            try:
+                try:
+                    self.__process(builder_name, item)
+                finally:
+                    with self.__lock:
+                        self.__busy -= 1
+                    batch.done()
+            except Exception as e:
+                if self.__error_callback is not None:
+                    self.__error_callback(e)
+
+    def qsize(self):
+        """
+        获取所有通道里等待中的数据对象数
+        :return size:(type=int) 数据对象数
+        """
+
+        size = sum(queue.qsize() for queue in self.__queues)
+        return size
+
+    def peak(self):
+        """
+        获取通道里等待中的数据对象数的峰值，与因积压而暂停的次数
+        :return peak:(type=int) 峰值
+        :return paused:(type=int) 暂停次数
+        """
+
+        return self.__peak, self.__paused
+
+    def close(self, timeout=None):
+        """
+        引擎真正结束后，关闭管道线程
+        1.timeout为None时，管道线程处理完通道里的数据对象后退出，等待所有管道线程退出
+        2.否则放弃通道里剩余的数据对象，最多等待timeout秒让管道线程处理完手上的数据对象后退出
+        :param timeout:(type=int,float) 等待管道线程退出的秒数，收到终止信号停止时传入，默认None处理完再退出
+        :return stopped:(type=bool) 管道线程是否都已不再调用管道，否则关闭管道时可能与管道线程同时写入
+        :return dropped:(type=int) 放弃的数据对象数
+        """
+
+        deadline = None
+        if timeout is not None:
+            with self.__lock:
+                self.__abandon = True
+            deadline = monotonic() + timeout
+        for queue in self.__queues:  # 通道已满时，放弃的数据对象很快会被取出，超过截止时间则不再放入结束标记
+            try:
+                queue.put(None, timeout=None if deadline is None else max(0, deadline - monotonic()))
+            except Full:
+                pass
+        for worker in self.__workers:
+            worker.join(None if deadline is None else max(0, deadline - monotonic()))
+        with self.__lock:
+            stopped, dropped = self.__busy == 0, self.__dropped
+        for queue in self.__queues:  # 没有退出的管道线程的通道里剩余的数据对象同样放弃
+            with queue.mutex:
+                dropped += sum(1 for one in queue.queue if one is not None)
+        return stopped, dropped
@@ -0,0 +1,223 @@
+"""
+限流器组件：
+1.下载器web方式的限流保护机制，每个限流标识一个令牌桶，按速率（每秒请求数）补充令牌，桶的容量即突发上限
+2.取令牌时只在计算的瞬间加锁，令牌不足则预支并返回需要等待的秒数，等待时不持有锁，同一个限流标识的线程不再互相串行等待
+3.可按限流标识设置同时处理的请求数上限，与速率限制同时生效
+4.可使用Redis共享令牌桶，多个进程（多台机器）共同遵守同一个接口配额，同时处理数上限仍按进程计算
+5.异步下载器只向限流器预支令牌，在事件循环里等待，不占用线程
+"""
+
+import services
+from time import sleep, monotonic
+from threading import Lock, BoundedSemaphore
+from contextlib import contextmanager
+from framework.error.check_error import CheckUnPass
+
+# 预支一个令牌，返回需要等待的秒数，令牌桶的状态与时间都以Redis为准
+# 超过补满令牌桶所需的时间后键自动过期，等同于令牌桶已满
+# KEYS：令牌桶
+# ARGV：速率（每秒令牌数）、容量、键不存在时的初始令牌数
+_reserve_script = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'time')
+local tokens = tonumber(state[1])
+if tokens == nil then
+    tokens = tonumber(ARGV[3])
+else
+    tokens = math.min(burst, tokens + (now - tonumber(state[2])) * rate)
+end
+tokens = tokens - 1
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'time', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+
+class TokenBucket(object):
+    """
+    本进程内的令牌桶
+    """
+
+    def __init__(self, rate, burst, full=True):
+        """
+        初始配置
+        :param rate:(type=int,float) 速率（每秒补充的令牌数）
+        :param burst:(type=int) 容量（突发上限）
+        :param full:(type=bool) 初始是否是满的，否则第一次取令牌也需要等待，默认True
+        """
+
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = burst if full else 0
+        self.__time = monotonic()
+        self.__lock = Lock()
+
+    def reserve(self):
+        """
+        预支一个令牌，令牌不足时欠下的令牌由之后补充的抵扣
+        :return wait:(type=float) 需要等待的秒数，0为不需要等待
+        """
+
+        with self.__lock:
+            now = monotonic()
+            self.__tokens = min(self.__burst, self.__tokens + (now - self.__time) * self.__rate) - 1
+            self.__time = now
+            tokens = self.__tokens
+        wait = 0 if tokens >= 0 else -tokens / self.__rate
+        return wait
+
+
+class RateLimiter(object):
+    """
+    限流器组件
+    """
+
+    def __init__(self, limits=None, redis_name=None):
+        """
+        初始配置
+        :param limits:(type=dict) 按限流标识单独配置的限流参数，优先于请求对象里的限流参数，默认None
+        :param redis_name:(type=str) 共享令牌桶使用的Redis连接名称，即account模块下Redis配置的key，默认None只在本进程内限流
+        """
+
+        self.__limits = dict() if limits is None else limits
+        for key, limit in self.__limits.items():
+            if not isinstance(limit, dict) or not set(limit) <= {'rate', 'burst', 'concurrency'}:
+                raise CheckUnPass('限流标识%s的配置必须为dict，且只能包含rate、burst、concurrency！' % key)
+            self.__check(key, limit.get('rate'), limit.get('burst', 1), limit.get('concurrency'))
+        self.__redis = None
+        if redis_name is not None:
+            self.__redis = services.redis.get(redis_name) if services.redis is not None else None
+            if self.__redis is None:
+                raise CheckUnPass('限流器使用的Redis连接%s不存在，请检查配置！' % redis_name)
+        self.__settings = dict()  # 每个限流标识第一次使用时确定的(速率, 容量, 同时处理数上限, 初始是否是满的)
+        self.__buckets = dict()  # 本进程内的令牌桶
+        self.__slots = dict()  # 同时处理数上限的信号量
+        self.__waited = dict()  # 每个限流标识等待的次数与总秒数
+        self.__lock = Lock()
+
+    @staticmethod
+    def __check(key, rate, burst, concurrency):
+        """
+        校验限流参数
+        :param key:(type=str) 限流标识
+        :param rate:(type=int,float) 速率（每秒请求数），None为不限速率
+        :param burst:(type=int) 突发上限
+        :param concurrency:(type=int) 同时处理的请求数上限，None为不限制
+        """
+
+        if rate is not None and (isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate <= 0):
+            raise CheckUnPass('限流标识%s的速率必须为None或大于0的数字！' % key)
+        if not isinstance(burst, int) or burst < 1:
+            raise CheckUnPass('限流标识%s的突发上限必须为大于等于1的整数！' % key)
+        if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+            raise CheckUnPass('限流标识%s的同时处理数上限必须为None或大于等于1的整数！' % key)
+
+    @property
+    def shared(self):
+        """
+        令牌桶是否保存在Redis里，预支令牌需要访问网络
+        :return shared:(type=bool) 是否共享
+        """
+
+        shared = self.__redis is not None
+        return shared
+
+    def settings(self, key, kwargs):
+        """
+        获取限流标识的限流参数，第一次使用时根据配置与请求对象的下载信息确定，之后不再改变
+        1.limit_rate为速率（每秒请求数），没有则按limit_s（默认1）每limit_s秒一个请求，limit_s为0则不限速率
+        2.limit_burst为突发上限（令牌桶容量），默认1
+        3.limit_concurrency为同时处理的请求数上限，默认None不限制
+        4.first_pass为True则令牌桶初始是满的，第一次访问不会阻塞，默认True
+        :param key:(type=str) 限流标识
+        :param kwargs:(type=dict) 下载信息
+        :return settings:(type=tuple) (速率, 突发上限, 同时处理数上限, 初始是否是满的)
+        """
+
+        settings = self.__settings.get(key)
+        if settings is not None:
+            return settings
+        limit = self.__limits.get(key)
+        if limit is not None:
+            rate, burst, concurrency = limit.get('rate'), limit.get('burst', 1), limit.get('concurrency')
+        else:
+            rate = kwargs.get('limit_rate')
+            if rate is None:
+                limit_s = kwargs.get('limit_s', 1)
+                if isinstance(limit_s, bool) or not isinstance(limit_s, (int, float)) or limit_s < 0:
+                    raise CheckUnPass('限流标识%s的limit_s必须为大于等于0的数字！' % key)
+                rate = 1 / limit_s if limit_s > 0 else None
+            burst, concurrency = kwargs.get('limit_burst', 1), kwargs.get('limit_concurrency')
+            self.__check(key, rate, burst, concurrency)
+        with self.__lock:
+            settings = self.__settings.setdefault(key, (rate, burst, concurrency, bool(kwargs.get('first_pass', True))))
+        return settings
+
+    def reserve(self, key, kwargs):
+        """
+        为限流标识预支一个令牌
+        :param key:(type=str) 限流标识
+        :param kwargs:(type=dict) 下载信息
+        :return wait:(type=float) 需要等待的秒数，0为不需要等待
+        """
+
+        rate, burst, concurrency, full = self.settings(key, kwargs)
+        if rate is None:
+            return 0
+        if self.__redis is not None:
+            wait = float(self.__redis.eval(_reserve_script, ['c3:limit:%s' % key], [rate, burst, burst if full else 0]))
+        else:
+            bucket = self.__buckets.get(key)
+            if bucket is None:
+                with self.__lock:
+                    bucket = self.__buckets.setdefault(key, TokenBucket(rate, burst, full))
+            wait = bucket.reserve()
+        if wait > 0:
+            with self.__lock:
+                times, seconds = self.__waited.get(key, (0, 0))
+                self.__waited[key] = (times + 1, seconds + wait)
+        return wait
+
+    @contextmanager
+    def limit(self, key, kwargs):
+        """
+        线程里使用，先占用同时处理数，再等待令牌，退出时释放同时处理数
+        :param key:(type=str) 限流标识
+        :param kwargs:(type=dict) 下载信息
+        """
+
+        concurrency = self.settings(key, kwargs)[2]
+        slot = None
+        if concurrency is not None:
+            slot = self.__slots.get(key)
+            if slot is None:
+                with self.__lock:
+                    slot = self.__slots.setdefault(key, BoundedSemaphore(concurrency))
+            slot.acquire()
+        try:
+            wait = self.reserve(key, kwargs)
+            if wait > 0:
+                sleep(wait)
+            yield
+        finally:
+            if slot is not None:
+                slot.release()
+
+    def stats(self):
+        """
+        获取各限流标识等待令牌的情况
+        :return waited:(type=dict) 限流标识为key，(等待次数, 总等待秒数)为value
+        """
+
+        with self.__lock:
+            waited = dict(self.__waited)
+        return waited
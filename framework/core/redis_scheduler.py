@@ -0,0 +1,436 @@
+"""
+Redis调度器组件：
+1.请求对象保存在Redis里，多台机器上以相同脚本传参启动的多个进程共用同一个调度器，分摊同一次采集
+2.取出请求对象时原子地移入处理中集合，处理完成后确认（ack）再删除；超过可见超时仍未确认的请求对象（比如进程崩溃）会重新入队
+3.请求数与响应数在Redis里统计，所有节点据此判断该次引擎循环启动是否已完成
+4.每次引擎循环启动的起始请求只由最先抢到的节点添加，其余节点等待其添加完成
+5.请求对象必须可以序列化，无法序列化的（比如meta里带有数据库连接）不添加并记录错误日志，不计入请求数
+  （保存在本进程内存里的请求对象，本进程异常退出后其他节点无法接手，所有节点会一直等待它完成）
+6.开启去重过滤时，特征值保存在Redis的集合里，所有节点共同去重
+7.每个节点定时写入心跳，结束时只有没有其他存活节点（心跳未超时）才删除该次采集的数据，异常退出的节点不会让数据永远残留
+8.最后一个节点结束后，引擎循环启动状态与请求数、响应数再保留一个可见超时，期间加入的节点直接结束，不会重新开始该次采集
+"""
+
+import time
+import uuid
+import base64
+import pickle
+import services
+from threading import Lock, Thread, Event
+from itertools import cycle
+from .scheduler import Scheduler
+from .dupe_filter import request_fingerprint
+from framework.error.check_error import CheckUnPass
+
+# 添加请求对象，分数越小越先出队：优先级高的在前，优先级相同按入队序号先进先出
+# 带有特征值时先去重，重复则不添加并返回0
+# KEYS：子队列、请求对象数据、请求对象所属信息、入队序号、请求数、特征值集合
+# ARGV：业务名称、优先级、序列化后的请求对象、特征值（不去重则为空字符串）
+_add_script = """
+if ARGV[4] ~= '' and redis.call('SADD', KEYS[6], ARGV[4]) == 0 then
+    return 0
+end
+local id = redis.call('INCR', KEYS[4])
+local score = -tonumber(ARGV[2]) * 1000000000000 + id
+redis.call('ZADD', KEYS[1], score, id)
+redis.call('HSET', KEYS[2], id, ARGV[3])
+redis.call('HSET', KEYS[3], id, ARGV[1] .. '|' .. score)
+redis.call('INCR', KEYS[5])
+return id
+"""
+
+# 按顺序尝试各业务子队列，取出第一个请求对象并移入处理中集合，分数为可见超时的截止时间（毫秒）
+# 返回请求对象id、序列化后的请求对象与子队列的序号（从1开始）
+# KEYS：处理中集合、请求对象数据、各业务子队列
+# ARGV：可见超时（毫秒）
+_claim_script = """
+for i = 3, #KEYS do
+    local ids = redis.call('ZRANGE', KEYS[i], 0, 0)
+    if ids[1] then
+        local t = redis.call('TIME')
+        redis.call('ZREM', KEYS[i], ids[1])
+        redis.call('ZADD', KEYS[1], t[1] * 1000 + math.floor(t[2] / 1000) + tonumber(ARGV[1]), ids[1])
+        return {ids[1], redis.call('HGET', KEYS[2], ids[1]), i - 2}
+    end
+end
+return false
+"""
+
+# 把超过可见超时仍未确认的请求对象放回原来的子队列
+# KEYS：处理中集合、请求对象所属信息
+# ARGV：子队列键前缀、单次最多处理数
+_reap_script = """
+local t = redis.call('TIME')
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', t[1] * 1000 + math.floor(t[2] / 1000), 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    local info = redis.call('HGET', KEYS[2], id)
+    if info then
+        local sep = string.find(info, '|', 1, true)
+        redis.call('ZADD', ARGV[1] .. string.sub(info, 1, sep - 1), tonumber(string.sub(info, sep + 1)), id)
+    end
+end
+return #ids
+"""
+
+# 把取出的请求对象放回原来的子队列，分数不变（目标达到自适应并发上限，留给之后或其他节点处理）
+# KEYS：处理中集合、请求对象所属信息
+# ARGV：子队列键前缀、请求对象id
+_requeue_script = """
+if redis.call('ZREM', KEYS[1], ARGV[2]) == 1 then
+    local info = redis.call('HGET', KEYS[2], ARGV[2])
+    local sep = string.find(info, '|', 1, true)
+    redis.call('ZADD', ARGV[1] .. string.sub(info, 1, sep - 1), tonumber(string.sub(info, sep + 1)), ARGV[2])
+end
+return 1
+"""
+
+# 确认请求对象已处理完成，只有仍在处理中集合里（没有因超时被重新入队）才计入响应数，避免重复统计
+# KEYS：处理中集合、请求对象数据、请求对象所属信息、响应数
+# ARGV：请求对象id
+_ack_script = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    redis.call('INCR', KEYS[4])
+    return 1
+end
+return 0
+"""
+
+# 写入节点心跳，分数为心跳超时的截止时间（毫秒）
+# KEYS：节点集合
+# ARGV：节点标识、心跳超时时间（毫秒）
+_beat_script = """
+local t = redis.call('TIME')
+redis.call('ZADD', KEYS[1], t[1] * 1000 + math.floor(t[2] / 1000) + tonumber(ARGV[2]), ARGV[1])
+"""
+
+# 节点结束，移除本节点与心跳已超时的节点，没有其他存活节点时删除该次采集的数据并返回1
+# 引擎循环启动状态与请求数、响应数不删除，设置过期时间，期间加入的节点据此直接结束
+# KEYS：节点集合、引擎循环启动状态、请求数、响应数、业务名称集合，其余为要删除的键
+# ARGV：节点标识、保留时间（毫秒）、子队列键前缀
+_leave_script = """
+local t = redis.call('TIME')
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', t[1] * 1000 + math.floor(t[2] / 1000))
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    return 0
+end
+for _, name in ipairs(redis.call('SMEMBERS', KEYS[5])) do
+    redis.call('DEL', ARGV[3] .. name)
+end
+for i = 5, #KEYS do
+    redis.call('DEL', KEYS[i])
+end
+for i = 2, 4 do
+    redis.call('PEXPIRE', KEYS[i], ARGV[2])
+end
+return 1
+"""
+
+# 统计多个子队列的请求对象数
+# KEYS：各业务子队列
+_size_script = """
+local sizes = {}
+for i = 1, #KEYS do
+    sizes[i] = redis.call('ZCARD', KEYS[i])
+end
+return sizes
+"""
+
+
+class RedisScheduler(Scheduler):
+    """
+    Redis调度器组件
+    """
+
+    distributed = True
+
+    def __init__(self, redis_name, run_key, visibility=600, interval=0.1, dupe_filter=None, heartbeat=30):
+        """
+        初始配置
+        :param redis_name:(type=str) 使用的Redis连接名称，即account模块下Redis配置的key
+        :param run_key:(type=str) 该次采集的标识，共同分摊同一次采集的节点必须相同
+        :param visibility:(type=int) 可见超时（秒），请求对象取出后超过该时间仍未确认则重新入队，默认600
+        :param interval:(type=int,float) 阻塞等待请求对象时轮询Redis的间隔时间（秒），默认0.1
+        :param dupe_filter:(type=SetFilter,BloomFilter) 去重过滤器，不为None则开启去重，Redis里的请求对象统一使用Redis的集合去重
+        :param heartbeat:(type=int,float) 节点心跳超时（秒），超过该时间没有心跳的节点视为已退出，每三分之一的时间写入一次，默认30
+        """
+
+        super().__init__(dupe_filter=dupe_filter)
+        self.__redis = services.redis.get(redis_name) if services.redis is not None else None
+        if self.__redis is None:
+            raise CheckUnPass('Redis调度器使用的Redis连接%s不存在，请检查配置！' % redis_name)
+        self.__visibility = int(visibility * 1000)
+        self.__interval = interval
+        self.__prefix = 'c3:scheduler:%s:' % run_key
+        self.__keys = {name: self.__prefix + name for name in (
+            'data', 'info', 'seq', 'request', 'response', 'processing', 'stage', 'nodes', 'seen', 'builders')}
+        self.__builders = list()  # 已知的业务名称
+        self.__weights = dict()  # 每个业务的权重
+        self.__claimed = dict()  # 处理中的请求对象，内存地址为key，Redis里的id为value，确认时使用
+        self.__order = None  # 按权重展开后的业务轮询顺序，取请求对象时从轮到的业务开始尝试
+        self.__order_lock = Lock()
+        self.__wake = 0  # 待取出的结束标记数
+        self.__wake_lock = Lock()
+        self.__reap_time = 0  # 上一次处理超时请求对象的时间
+        self.__filtered = 0  # 本节点添加时被Redis过滤的重复请求对象数
+        self.__node = uuid.uuid4().hex  # 本节点的标识
+        self.__heartbeat = int(heartbeat * 1000)
+        self.__closed = Event()
+        self.__beat()
+        Thread(target=self.__beat_loop, daemon=True).start()
+
+    def __beat(self):
+        """
+        写入本节点的心跳
+        """
+
+        self.__redis.eval(_beat_script, [self.__keys['nodes']], [self.__node, self.__heartbeat])
+
+    def __beat_loop(self):
+        """
+        心跳线程，每三分之一的心跳超时写入一次，直到关闭；写入失败只记录日志，下一次继续
+        """
+
+        while not self.__closed.wait(self.__heartbeat / 3000):
+            try:
+                self.__beat()
+            except Exception as e:
+                services.logger.exception('Redis调度器写入节点心跳失败：%s' % e)
+
+    def __queue_key(self, builder_name):
+        """
+        获取业务子队列的键
+        :param builder_name:(type=str) 业务名称
+        :return key:(type=str) 键
+        """
+
+        key = '%squeue:%s' % (self.__prefix, builder_name)
+        return key
+
+    def __add_builder(self, builder_name):
+        """
+        记录业务名称（同时记入Redis，供最后结束的节点删除所有节点的子队列），并重新生成轮询顺序
+        :param builder_name:(type=str) 业务名称
+        """
+
+        with self.__order_lock:
+            if builder_name not in self.__builders:
+                self.__builders.append(builder_name)
+                self.__redis.sadd(self.__keys['builders'], [builder_name])
+            order = [name for name in self.__builders for i in range(self.__weights.get(name, 1))]
+            self.__order = cycle(order)
+
+    def set_weight(self, builder_name, weight):
+        """
+        设置业务的权重，与调度器一致
+        :param builder_name:(type=str) 业务名称
+        :param weight:(type=int) 权重
+        """
+
+        super().set_weight(builder_name, weight)
+        self.__weights[builder_name] = weight
+        self.__add_builder(builder_name)
+
+    def add_request(self, request, block=True):
+        """
+        添加请求对象，无法序列化的不添加
+        1.只保存在本进程内存里的请求对象也要计入Redis里的请求数，本进程异常退出后就再也不会有响应数与之对应
+        2.其他节点判断完成时会一直等待，且可见超时也无法让其他节点接手，因此直接拒绝，记录错误日志
+        :param request:(type=Request) 初始请求对象，需已绑定业务名称
+        :param block:(type=bool) 与单进程的调度器保持一致，Redis调度器不阻塞，默认True
+        :return result:(type=bool) 是否已添加，重复的请求对象被过滤或无法序列化时为False
+        """
+
+        if request.builder_name not in self.__builders:
+            self.__add_builder(request.builder_name)
+        try:
+            data = base64.b64encode(pickle.dumps(request, pickle.HIGHEST_PROTOCOL)).decode()
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            services.logger.exception('Redis调度器无法序列化业务%s的请求对象（%s），已丢弃：%s' % (
+                request.builder_name, request.parse, e))
+            return False
+        fp = request_fingerprint(request) if self._need_filter(request) else None
+        fp = fp.hex() if fp is not None else ''
+        result = bool(self.__redis.eval(_add_script, [
+            self.__queue_key(request.builder_name), self.__keys['data'], self.__keys['info'], self.__keys['seq'],
+            self.__keys['request'], self.__keys['seen']], [request.builder_name, request.priority, data, fp]))
+        if not result:
+            self.__filtered += 1
+        return result
+
+    def __claim(self):
+        """
+        从Redis取出一个请求对象，每秒最多一次顺带处理超时的请求对象
+        取出的请求对象的目标达到自适应并发上限时放回原来的子队列，本次不再尝试该业务
+        :return request:(type=Request,None) 请求对象，没有则返回None
+        """
+
+        now = time.monotonic()
+        if now - self.__reap_time >= 1:
+            self.__reap_time = now
+            self.__redis.eval(_reap_script, [self.__keys['processing'], self.__keys['info']],
+                              [self.__prefix + 'queue:', 100])
+        with self.__order_lock:
+            if self.__order is None:
+                return None
+            first = next(self.__order)
+            builders = [first] + [name for name in self.__builders if name != first]
+        builders = [name for name in builders if self._has_slot(name)]  # 跳过达到并发上限的业务
+        while builders:
+            result = self.__redis.eval(_claim_script, [self.__keys['processing'], self.__keys['data']] + [
+                self.__queue_key(name) for name in builders], [self.__visibility])
+            if not result:
+                return None
+            redis_id, data, index = result
+            try:
+                request = pickle.loads(base64.b64decode(data))
+            except Exception:
+                self.__redis.eval(_ack_script, [self.__keys['processing'], self.__keys['data'], self.__keys['info'],
+                                                self.__keys['response']], [redis_id])
+                raise
+            if self._admit(request):
+                break
+            self.__redis.eval(_requeue_script, [self.__keys['processing'], self.__keys['info']],
+                              [self.__prefix + 'queue:', redis_id])
+            del builders[index - 1]
+        else:
+            return None
+        self._acquire(builders[index - 1])
+        self.__claimed[id(request)] = redis_id
+        return request
+
+    def get_request(self, block=False, timeout=None, held=False):
+        """
+        获取一个请求对象并返回
+        :param block:(type=bool) 是否阻塞等待，阻塞时按间隔时间轮询Redis，默认False非阻塞
+        :param timeout:(type=int,float) 阻塞等待的超时时间（秒），只在block为True时有效，默认None一直等待
+        :param held:(type=bool) 与单进程的调度器保持一致，引擎使用分布式调度器时总是阻塞等待，不需要，默认False
+        :return request:(type=Request,None) 请求对象，为空（或超时、获取到结束标记）时返回None
+        """
+
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if not self.paused:  # 暂停出队后，Redis里的请求对象留给其他节点或下一次运行
+                request = self.__claim()
+                if request is not None:
+                    return request
+            with self.__wake_lock:
+                if self.__wake:
+                    self.__wake -= 1
+                    return None
+            remaining = None if end is None else end - time.monotonic()
+            if not block or (remaining is not None and remaining <= 0):
+                return None
+            time.sleep(self.__interval if remaining is None else min(self.__interval, remaining))
+
+    def ack(self, request):
+        """
+        确认请求对象已处理完成，释放业务的并发，并计入响应数
+        :param request:(type=Request) 从调度器获取的请求对象
+        """
+
+        super().ack(request)
+        redis_id = self.__claimed.pop(id(request))
+        self.__redis.eval(_ack_script, [self.__keys['processing'], self.__keys['data'], self.__keys['info'],
+                                        self.__keys['response']], [redis_id])
+
+    def wake(self, count):
+        """
+        放入结束标记，唤醒阻塞等待中的线程
+        :param count:(type=int) 结束标记的数量
+        """
+
+        with self.__wake_lock:
+            self.__wake += count
+
+    def start_stage(self, request_type):
+        """
+        抢占该次引擎循环启动添加起始请求的权利
+        1.抢到则返回None，由本节点添加起始请求
+        2.没抢到则等待抢到的节点添加完成，返回该节点添加起始请求的结果
+        :param request_type:(type=str) 引擎循环启动的类型
+        :return no_task:(type=bool,None) 抢到为None，否则为该点是否没有任务
+        """
+
+        if self.__redis.hsetnx(self.__keys['stage'], request_type, 'running'):
+            return None
+        while True:
+            status = self.__redis.hget(self.__keys['stage'], request_type)
+            if status != 'running':
+                no_task = status == 'no_task'
+                return no_task
+            time.sleep(self.__interval)
+
+    def finish_start(self, request_type, no_task):
+        """
+        标记起始请求已全部添加，其余节点可继续
+        :param request_type:(type=str) 引擎循环启动的类型
+        :param no_task:(type=bool) 该点是否没有任务
+        """
+
+        self.__redis.hset(self.__keys['stage'], request_type, 'no_task' if no_task else 'task')
+
+    def is_finish(self):
+        """
+        根据所有节点的请求数与响应数，判断是否已没有未完成的请求对象
+        :return result:(type=bool) 是否完成
+        """
+
+        request_nums, response_nums = self.__redis.mget([self.__keys['request'], self.__keys['response']])
+        result = int(request_nums or 0) <= int(response_nums or 0)
+        return result
+
+    def qsize(self):
+        """
+        获取Redis里等待中的请求对象总数
+        :return size:(type=int) 请求对象总数
+        """
+
+        size = sum(self.depth_redis().values())
+        return size
+
+    def filtered(self):
+        """
+        获取本节点添加时被Redis过滤的重复请求对象数
+        :return filtered:(type=int) 请求对象数
+        """
+
+        filtered = self.__filtered
+        return filtered
+
+    def depth_redis(self):
+        """
+        获取Redis里每个业务子队列等待中的请求对象数
+        :return depth:(type=dict) 业务名称为key，请求对象数为value
+        """
+
+        builders = list(self.__builders)
+        if not builders:
+            return dict()
+        sizes = self.__redis.eval(_size_script, [self.__queue_key(name) for name in builders], [])
+        depth = dict(zip(builders, sizes))
+        return depth
+
+    def depth(self):
+        """
+        获取每个业务等待中的请求对象数，即Redis里的
+        :return depth:(type=dict) 业务名称为key，请求对象数为value
+        """
+
+        depth = self.depth_redis()
+        return depth
+
+    def close(self):
+        """
+        引擎真正结束后关闭，停止心跳，没有其他存活节点时删除该次采集在Redis里的数据
+        引擎循环启动状态与请求数、响应数保留一个可见超时，之后才加入的节点直接结束，不会重新添加起始请求
+        """
+
+        super().close()
+        self.__closed.set()
+        head = [self.__keys[name] for name in ('nodes', 'stage', 'request', 'response', 'builders')]
+        self.__redis.eval(_leave_script, head + [key for key in self.__keys.values() if key not in head],
+                          [self.__node, self.__visibility, self.__prefix + 'queue:'])
@@ -1,9 +1,156 @@
 """
 调度器组件：
 1.缓存请求对象，并为下载器提供请求对象，实现请求的调度
+2.每个业务一个子队列，子队列之间按权重轮流出队，避免某个业务大量的请求对象让其他业务长时间等待
+3.同一个业务的子队列里，优先级高的请求对象先出队，优先级相同则先进先出
+4.可限制等待中的请求对象总数，达到上限后添加请求对象的线程阻塞等待，实现背压，防止内存无限增长
+5.可开启去重过滤，同一次运行里重复的请求对象不再入队
+6.可限制每个业务同时处理中的请求对象数（并发上限），达到上限的业务暂不出队，处理完成确认后再继续出队
+7.可获取等待中与处理中的请求对象快照，用于写入检查点，并在恢复时重新添加；锁内只复制请求对象列表，去重过滤器冻结后在锁外序列化
+8.可暂停出队，收到终止信号后不再分发新的请求对象，处理中的继续完成
+9.可设置出队闸门（自适应并发控制器），子队列按目标分组，达到并发上限的目标暂不出队，同一业务其他目标的请求对象照常出队
 """
 
-from six.moves.queue import Queue, Empty
+import pickle
+from heapq import heappush, heappop
+from itertools import chain
+from threading import Lock, Condition
+from time import monotonic
+from .dupe_filter import request_fingerprint
+from framework.error.check_error import CheckUnPass
+
+
+class MemoryQueue(object):
+    """
+    业务的内存子队列（堆），优先级高的先出队，优先级相同则先进先出
+    设置了出队闸门时按请求对象的目标分成多个堆，目标达到并发上限时可越过它，让同一业务其他目标的请求对象先出队
+    """
+
+    def __init__(self, key=None):
+        """
+        初始配置
+        :param key:(type=function) 获取请求对象目标的函数，默认None不分组
+        """
+
+        self.__key = key
+        self.__heap = list()  # 不分组时的堆，元素为(-优先级, 入队序号, 请求对象)
+        self.__heaps = dict()  # 分组时目标为key，元素同上的堆为value
+        self.__heads = list()  # 分组时各目标堆顶的(-优先级, 入队序号, 目标)组成的堆，堆顶已变化的元素在遇到时丢弃
+        self.__size = 0
+
+    def push(self, priority, count, request, data=None):
+        """
+        请求对象入队
+        :param priority:(type=int) 优先级
+        :param count:(type=int) 入队序号
+        :param request:(type=Request) 请求对象
+        :param data:(type=bytes) 调度器_encode函数返回的数据，内存子队列不使用，默认None
+        """
+
+        self.__size += 1
+        if self.__key is None:
+            heappush(self.__heap, (-priority, count, request))
+            return
+        target = self.__key(request)
+        heap = self.__heaps.setdefault(target, list())
+        if not heap or (-priority, count) < heap[0][:2]:
+            heappush(self.__heads, (-priority, count, target))
+        heappush(heap, (-priority, count, request))
+
+    def __find(self, admit=None):
+        """
+        按出队顺序找到第一个可以出队的目标，丢弃已失效的元素，越过的目标放回
+        :param admit:(type=function) 判断请求对象能否出队的函数，默认None都可以
+        :return head:(type=tuple,None) 该目标的(-优先级, 入队序号, 目标)，已从堆中取出，没有可以出队的则为None
+        """
+
+        skipped, found = list(), None
+        while self.__heads:
+            head = heappop(self.__heads)
+            heap = self.__heaps.get(head[2])
+            if not heap or heap[0][1] != head[1]:
+                continue
+            if admit is None or admit(heap[0][2]):
+                found = head
+                break
+            skipped.append(head)
+        for head in skipped:
+            heappush(self.__heads, head)
+        return found
+
+    def pop(self, admit=None):
+        """
+        请求对象出队，调用前需确保有可以出队的请求对象
+        :param admit:(type=function) 判断请求对象能否出队的函数，默认None取出优先级最高、最早入队的
+        :return request:(type=Request) 请求对象
+        """
+
+        self.__size -= 1
+        if self.__key is None:
+            return heappop(self.__heap)[2]
+        target = self.__find(admit)[2]
+        heap = self.__heaps[target]
+        request = heappop(heap)[2]
+        if heap:
+            heappush(self.__heads, (heap[0][0], heap[0][1], target))
+        else:
+            del self.__heaps[target]
+        return request
+
+    def peek(self, admit=None):
+        """
+        获取下一个出队的请求对象，不出队
+        :param admit:(type=function) 判断请求对象能否出队的函数，默认None
+        :return request:(type=Request,None) 请求对象，没有可以出队的则为None
+        """
+
+        if self.__key is None:
+            request = self.__heap[0][2] if self.__heap and (admit is None or admit(self.__heap[0][2])) else None
+            return request
+        head = self.__find(admit)
+        if head is None:
+            return None
+        heappush(self.__heads, head)
+        request = self.__heaps[head[2]][0][2]
+        return request
+
+    def requests(self):
+        """
+        按出队顺序获取子队列里所有的请求对象，不出队
+        :return requests:(type=list) 请求对象
+        """
+
+        requests = [one[2] for one in sorted(chain(self.__heap, *self.__heaps.values()), key=lambda x: x[:2])]
+        return requests
+
+    def pin(self):
+        """
+        写入检查点时引用磁盘里的请求对象，内存子队列没有
+        :return segments:(type=list) 分段文件与读取范围
+        :return count:(type=int) 磁盘里的请求对象数
+        """
+
+        return list(), 0
+
+    def unpin(self):
+        """
+        解除写入检查点时的引用，内存子队列不需要处理
+        """
+
+        pass
+
+    def close(self):
+        """
+        关闭子队列，释放占用的资源
+        """
+
+        self.__heap.clear()
+        self.__heaps.clear()
+        self.__heads.clear()
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
 
 
 class Scheduler(object):
@@ -11,26 +158,497 @@ class Scheduler(object):
     调度器组件
     """
 
-    def __init__(self):
-        self.__queue = Queue()
+    # 是否分布式调度器，分布式调度器由所有节点共同判断引擎循环启动是否完成
+    distributed = False
+
+    def __init__(self, max_size=None, dupe_filter=None):
+        """
+        初始配置
+        :param max_size:(type=int) 等待中的请求对象总数上限，必须为大于等于1的整数，默认None不限制
+        :param dupe_filter:(type=SetFilter,BloomFilter) 去重过滤器，默认None不去重
+        """
+
+        if max_size is not None and (not isinstance(max_size, int) or max_size < 1):
+            raise CheckUnPass('调度器的请求对象总数上限必须为None或大于等于1的整数！')
+        self.__max_size = max_size
+        self.__dupe_filter = dupe_filter
+        self.__delta = None  # 去重过滤器被快照冻结期间新出现的特征值，没有冻结为None
+        self.__filtered = 0  # 被过滤的重复请求对象数
+        self.__queues = dict()  # 每个业务的子队列
+        self.__weights = dict()  # 每个业务的权重
+        self.__limits = dict()  # 每个业务的并发上限，没设置过的业务不限制
+        self.__running = dict()  # 每个业务处理中（已出队、未确认）的请求对象数
+        self.__running_peak = dict()  # 每个业务处理中的请求对象数的峰值
+        self.__claimed = dict()  # 处理中（已出队、未确认）的请求对象，id为key，用于写入检查点
+        self.__current = dict()  # 平滑加权轮询用，每个业务当前的权重
+        self.__size = 0  # 所有子队列的请求对象总数
+        self.__count = 0  # 入队序号，保证同优先级的请求对象先进先出
+        self.__wake = 0  # 待取出的结束标记数
+        self.__consumers = 1  # 获取请求对象的线程数，用于判断添加请求对象时能否阻塞等待
+        self.__waiting = 0  # 因达到上限而阻塞等待中的添加线程数
+        self.__peak = 0  # 等待中的请求对象总数的峰值
+        self.__overflow = 0  # 为避免死锁而超出上限添加的请求对象数
+        self.__paused = False  # 是否已暂停出队
+        self.__gate = None  # 出队闸门（自适应并发控制器），None为不设置
+        self.__lock = Lock()
+        self.__condition = Condition(self.__lock)  # 等待有请求对象
+        self.__not_full = Condition(self.__lock)  # 等待未达到上限
+
+    def set_weight(self, builder_name, weight):
+        """
+        设置业务的权重，没设置过的业务权重为1，所有业务权重相同即为轮询
+        :param builder_name:(type=str) 业务名称
+        :param weight:(type=int) 权重，每一轮里该业务最多连续出队的请求对象数
+        """
+
+        with self.__condition:
+            self.__weights[builder_name] = weight
+
+    def set_limit(self, builder_name, limit):
+        """
+        设置业务的并发上限
+        :param builder_name:(type=str) 业务名称
+        :param limit:(type=int,None) 并发上限，即同时处理中的请求对象数上限，None为不限制
+        """
+
+        with self.__condition:
+            self.__limits[builder_name] = limit
+            self.__condition.notify_all()
+
+    def set_gate(self, gate):
+        """
+        设置出队闸门，需在添加请求对象之前设置，之后创建的子队列按目标分组
+        出队时越过达到并发上限的目标，所有目标都达到上限的业务暂不出队，出队的请求对象占用目标的一个并发名额
+        :param gate:(type=ConcurrencyController) 自适应并发控制器，提供target、admit、acquire、try_acquire方法
+        """
+
+        with self.__condition:
+            self.__gate = gate
+
+    @property
+    def _target(self):
+        """
+        获取子队列按目标分组用的函数，供重写_new_queue的子类使用
+        :return target:(type=function,None) 获取请求对象目标的函数，没有设置出队闸门则为None
+        """
+
+        target = self.__gate.target if self.__gate is not None else None
+        return target
+
+    def __has_slot(self, builder_name):
+        """
+        判断业务是否未达到并发上限，调用前需已获得锁
+        :param builder_name:(type=str) 业务名称
+        :return result:(type=bool) 是否可以出队
+        """
+
+        limit = self.__limits.get(builder_name)
+        result = limit is None or self.__running.get(builder_name, 0) < limit
+        return result
+
+    def _has_slot(self, builder_name):
+        """
+        判断业务是否未达到并发上限，供不经过get_request出队的子类使用
+        :param builder_name:(type=str) 业务名称
+        :return result:(type=bool) 是否可以出队
+        """
+
+        with self.__lock:
+            result = self.__has_slot(builder_name)
+        return result
+
+    def _admit(self, request):
+        """
+        判断请求对象的目标是否未达到并发上限，是则占用目标的一个并发名额，供不经过get_request出队的子类使用
+        :param request:(type=Request) 取出的请求对象
+        :return result:(type=bool) 是否可以处理，否则需放回
+        """
+
+        result = self.__gate is None or self.__gate.try_acquire(request)
+        return result
+
+    def _acquire(self, builder_name):
+        """
+        占用业务的一个并发，供不经过get_request出队的子类使用，处理完成后同样通过ack释放
+        :param builder_name:(type=str) 业务名称
+        """
+
+        with self.__lock:
+            self.__take_slot(builder_name)
+
+    def __take_slot(self, builder_name):
+        """
+        占用业务的一个并发，并记录峰值，调用前需已获得锁
+        :param builder_name:(type=str) 业务名称
+        """
+
+        running = self.__running[builder_name] = self.__running.get(builder_name, 0) + 1
+        if running > self.__running_peak.get(builder_name, 0):
+            self.__running_peak[builder_name] = running
+
+    def __ready(self):
+        """
+        判断是否有可以出队的请求对象，即子队列不为空且业务未达到并发上限，调用前需已获得锁
+        :return result:(type=bool) 是否有
+        """
+
+        if self.__paused:
+            return False
+        if not self.__limits and self.__gate is None:
+            return self.__size > 0
+        result = any(self.__can_pop(name, queue) for name, queue in self.__queues.items())
+        return result
+
+    def __can_pop(self, builder_name, queue):
+        """
+        判断业务的子队列是否可以出队：不为空、业务未达到并发上限，且有目标未达到并发上限的请求对象，调用前需已获得锁
+        :param builder_name:(type=str) 业务名称
+        :param queue:(type=MemoryQueue) 子队列
+        :return result:(type=bool) 是否可以出队
+        """
+
+        result = bool(queue) and self.__has_slot(builder_name) and (
+            self.__gate is None or queue.peek(self.__gate.admit) is not None)
+        return result
+
+    def set_consumers(self, count):
+        """
+        设置获取请求对象的线程数
+        1.引擎的工作线程既会获取请求对象，也会添加解析出来的请求对象
+        2.如所有工作线程都因达到上限阻塞在添加请求对象，就没有线程再获取请求对象，引擎会卡死
+        3.因此阻塞等待的添加线程数达到该数量时，不再阻塞，直接超出上限添加
+        :param count:(type=int) 线程数
+        """
+
+        with self.__lock:
+            self.__consumers = count
+            self.__not_full.notify_all()
+
+    def _need_filter(self, request):
+        """
+        判断请求对象是否需要去重，test方式（包括引擎的彩蛋请求）不去重
+        :param request:(type=Request) 请求对象
+        :return result:(type=bool) 是否需要去重
+        """
+
+        result = self.__dupe_filter is not None and not request.dont_filter and request.way != 'test'
+        return result
 
-    def add_request(self, request):
+    def add_request(self, request, block=True):
         """
         添加请求对象
-        :param request:(type=Request) 初始请求对象
+        :param request:(type=Request) 初始请求对象，需已绑定业务名称
+        :param block:(type=bool) 达到上限时是否阻塞等待，False则直接超出上限添加，默认True
+        :return result:(type=bool) 是否已添加，重复的请求对象被过滤（或被_encode函数拒绝）时为False
+        """
+
+        data = self._encode(request)
+        if data is False:
+            return False
+        fp = request_fingerprint(request) if self._need_filter(request) else None
+        with self.__condition:
+            if fp is not None and self.__seen(fp):
+                self.__filtered += 1
+                return False
+
+            # 达到上限则阻塞等待，直到有请求对象出队
+            # 阻塞等待的线程数达到获取请求对象的线程数时，再阻塞就会死锁，则直接超出上限添加
+            # 业务已达到并发上限时，其请求对象要等处理中的完成才能出队，阻塞同样会死锁，也直接超出上限添加
+            # 暂停出队后不会再有请求对象出队，同样直接超出上限添加
+            if self.__max_size is not None and self.__size >= self.__max_size:
+                if block and not self.__paused and self.__waiting + 1 < self.__consumers and self.__has_slot(
+                        request.builder_name):
+                    self.__waiting += 1
+                    try:
+                        while self.__size >= self.__max_size and self.__waiting < self.__consumers and \
+                                not self.__paused:
+                            self.__not_full.wait()
+                    finally:
+                        self.__waiting -= 1
+                if self.__size >= self.__max_size:
+                    self.__overflow += 1
+            self.__push(request, data)
+            self.__condition.notify()
+        return True
+
+    def __seen(self, fp):
+        """
+        判断特征值是否已出现过，没出现过则记录下来，调用前需已获得锁
+        去重过滤器被快照冻结（正在锁外序列化）期间只读不写，新出现的特征值先记在一旁，解除冻结时再并入
+        :param fp:(type=bytes) 特征值
+        :return result:(type=bool) 已出现过为True
+        """
+
+        if self.__delta is None:
+            return self.__dupe_filter.seen(fp)
+        if fp in self.__delta or fp in self.__dupe_filter:
+            return True
+        self.__delta.add(fp)
+        return False
+
+    def _encode(self, request):
+        """
+        添加请求对象时在锁外调用，返回随请求对象一起交给子队列的数据，可重写该方法提前序列化请求对象
+        :param request:(type=Request) 请求对象
+        :return data:(type=bytes,None,bool) 交给子队列的数据，内存子队列不需要则为None，为False时拒绝添加该请求对象
+        """
+
+        return None
+
+    def __push(self, request, data=None):
+        """
+        请求对象放入业务的子队列，调用前需已获得锁
+        :param request:(type=Request) 请求对象，需已绑定业务名称
+        :param data:(type=bytes) _encode函数返回的数据，默认None
+        """
+
+        queue = self.__queues.get(request.builder_name)
+        if queue is None:
+            queue = self.__queues[request.builder_name] = self._new_queue(request.builder_name)
+        queue.push(request.priority, self.__count, request, data)
+        self.__count += 1
+        self.__size += 1
+        if self.__size > self.__peak:
+            self.__peak = self.__size
+
+    def _new_queue(self, builder_name):
+        """
+        创建业务的子队列，可重写该方法更换子队列的存储方式
+        :param builder_name:(type=str) 业务名称
+        :return queue:(type=MemoryQueue) 子队列
+        """
+
+        queue = MemoryQueue(self._target)
+        return queue
+
+    def __select(self):
+        """
+        平滑加权轮询，选出下一个出队的业务，跳过达到并发上限（或所有目标都达到并发上限）的业务，调用前需确保至少有一个业务可以出队
+        :return builder_name:(type=str) 业务名称
         """
 
-        self.__queue.put(request)
+        builder_name, total = None, 0
+        for name, queue in self.__queues.items():
+            if not self.__can_pop(name, queue):
+                continue
+            weight = self.__weights.get(name, 1)
+            total += weight
+            self.__current[name] = self.__current.get(name, 0) + weight
+            if builder_name is None or self.__current[name] > self.__current[builder_name]:
+                builder_name = name
+        self.__current[builder_name] -= total
+        return builder_name
 
-    def get_request(self):
+    def get_request(self, block=False, timeout=None, held=False):
         """
         获取一个请求对象并返回
-        :return request:(type=Request,None) 从Queue获取的请求对象，为空时返回None
+        :param block:(type=bool) 是否阻塞等待，默认False非阻塞
+        :param timeout:(type=int,float) 阻塞等待的超时时间（秒），block或held为True时有效，默认None一直等待
+        :param held:(type=bool) 非阻塞时，如有请求对象但都因并发上限暂不能出队，是否等待到可以出队，默认False直接返回None
+        :return request:(type=Request,None) 请求对象，为空（或所有业务都达到并发上限、超时、获取到结束标记）时返回None
         """
 
-        try:
-            request = self.__queue.get(block=False)  # 设置为非阻塞
-        except Empty:  # 获取为空会抛异常，返回None
-            return None
-        else:
+        with self.__condition:
+            # 回调模式下返回None后会立即重新提交任务，请求对象都因并发上限暂不能出队时在条件变量上等待，避免工作线程空转
+            # 子队列为空时仍直接返回，不影响引擎判断结束
+            if block or held:
+                end = None if timeout is None else monotonic() + timeout
+                while not self.__ready() and not self.__wake and (block or (self.__size and not self.__paused)):
+                    remaining = None if end is None else end - monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self.__condition.wait(remaining)
+            if not self.__ready():
+                if self.__wake:
+                    self.__wake -= 1
+                return None
+            builder_name = self.__select()
+            request = self.__queues[builder_name].pop(self.__gate.admit if self.__gate is not None else None)
+            self.__take_slot(builder_name)
+            if self.__gate is not None:
+                self.__gate.acquire(request)
+            self.__claimed[id(request)] = request
+            self.__size -= 1
+            if self.__waiting:
+                self.__not_full.notify()
             return request
+
+    def wake(self, count):
+        """
+        放入结束标记，唤醒阻塞等待中的线程
+        :param count:(type=int) 结束标记的数量，一般为阻塞等待的线程数
+        """
+
+        with self.__condition:
+            self.__wake += count
+            self.__condition.notify_all()
+
+    def notify_ready(self):
+        """
+        出队条件可能已满足（比如目标归还了并发名额），唤醒阻塞等待中的线程重新判断
+        """
+
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def pause(self):
+        """
+        暂停出队，之后获取请求对象都返回None，已出队的请求对象照常确认，添加请求对象不受影响（不再阻塞）
+        """
+
+        with self.__condition:
+            self.__paused = True
+            self.__condition.notify_all()
+            self.__not_full.notify_all()
+
+    @property
+    def paused(self):
+        """
+        是否已暂停出队
+        :return paused:(type=bool) 是否已暂停
+        """
+
+        paused = self.__paused
+        return paused
+
+    def qsize(self):
+        """
+        获取调度器里等待中的请求对象总数
+        :return size:(type=int) 请求对象总数
+        """
+
+        size = self.__size
+        return size
+
+    def peak(self):
+        """
+        获取等待中的请求对象总数的峰值，与超出上限添加的请求对象数
+        :return peak:(type=int) 峰值
+        :return overflow:(type=int) 超出上限添加的请求对象数
+        """
+
+        return self.__peak, self.__overflow
+
+    def slots(self):
+        """
+        获取每个业务的并发使用情况
+        :return slots:(type=dict) 业务名称为key，(处理中的请求对象数, 峰值, 并发上限)为value
+        """
+
+        with self.__condition:
+            slots = {name: (self.__running.get(name, 0), peak, self.__limits.get(name))
+                     for name, peak in self.__running_peak.items()}
+        return slots
+
+    def filtered(self):
+        """
+        获取被过滤的重复请求对象数
+        :return filtered:(type=int) 请求对象数
+        """
+
+        filtered = self.__filtered
+        return filtered
+
+    def depth(self):
+        """
+        获取每个业务子队列里等待中的请求对象数
+        :return depth:(type=dict) 业务名称为key，请求对象数为value
+        """
+
+        with self.__condition:
+            depth = {name: len(queue) for name, queue in self.__queues.items()}
+        return depth
+
+    def snapshot(self):
+        """
+        获取处理中与等待中的请求对象快照，以及冻结的去重过滤器，用于写入检查点，用完后需调用unpin函数
+        1.锁内只复制请求对象列表，由调用方在锁外序列化，不阻塞添加与获取请求对象
+        2.去重过滤器不复制，冻结后直接返回，调用方在unpin之前于锁外序列化；冻结期间新出现的特征值记在一旁，unpin时并入
+        3.磁盘子队列溢出到磁盘的请求对象不读出，只引用分段文件与读取范围
+        :return requests:(type=list) 内存里的请求对象，处理中的在前，等待中的按出队顺序在后
+        :return segments:(type=dict) 业务名称为key，(分段文件与读取范围, 请求对象数)为value，排在该业务内存里的请求对象之后
+        :return dupe_filter:(type=SetFilter,BloomFilter,None) 冻结的去重过滤器，unpin之前不会被修改，不去重则为None
+        """
+
+        with self.__condition:
+            requests = list(self.__claimed.values())
+            segments = dict()
+            for builder_name, queue in self.__queues.items():
+                requests.extend(queue.requests())
+                segments[builder_name] = queue.pin()
+            if self.__dupe_filter is not None and self.__delta is None:
+                self.__delta = set()
+        return requests, segments, self.__dupe_filter
+
+    def unpin(self, builder_names):
+        """
+        写入检查点后，解除快照对分段文件的引用，并解冻去重过滤器，并入冻结期间新出现的特征值
+        :param builder_names:(type=iterable) 快照里的业务名称
+        """
+
+        with self.__condition:
+            for builder_name in builder_names:
+                self.__queues[builder_name].unpin()
+            if self.__delta is not None:
+                for fp in self.__delta:
+                    self.__dupe_filter.seen(fp)
+                self.__delta = None
+
+    def restore(self, requests, dupe_filter=None):
+        """
+        从检查点恢复请求对象与去重过滤器，恢复的请求对象不参与去重，也不受上限限制
+        :param requests:(type=list) 请求对象，需已绑定业务名称
+        :param dupe_filter:(type=bytes) 去重过滤器的序列化数据，开启了去重时才恢复，默认None
+        """
+
+        with self.__condition:
+            if dupe_filter is not None and self.__dupe_filter is not None:
+                self.__dupe_filter = pickle.loads(dupe_filter)
+            for request in requests:
+                self.__push(request)
+            self.__condition.notify_all()
+
+    def ack(self, request):
+        """
+        确认请求对象已处理完成，释放业务的并发
+        :param request:(type=Request) 从调度器获取的请求对象
+        """
+
+        with self.__condition:
+            self.__claimed.pop(id(request), None)
+            self.__running[request.builder_name] = self.__running.get(request.builder_name, 0) - 1
+            if self.__limits.get(request.builder_name) is not None:
+                self.__condition.notify()
+
+    def start_stage(self, request_type):
+        """
+        开始添加该次引擎循环启动的起始请求，单进程的调度器总是由本进程添加
+        :param request_type:(type=str) 引擎循环启动的类型
+        :return no_task:(type=None) 由本进程添加起始请求
+        """
+
+        return None
+
+    def finish_start(self, request_type, no_task):
+        """
+        起始请求已全部添加，单进程的调度器不需要处理
+        :param request_type:(type=str) 引擎循环启动的类型
+        :param no_task:(type=bool) 该点是否没有任务
+        """
+
+    def is_finish(self):
+        """
+        分布式调度器用，判断所有节点是否都已没有未完成的请求对象，单进程的调度器以引擎自身的统计为准
+        :return result:(type=bool) 是否完成
+        """
+
+        return True
+
+    def close(self):
+        """
+        引擎真正结束后，关闭所有子队列
+        """
+
+        with self.__condition:
+            for queue in self.__queues.values():
+                queue.close()
@@ -0,0 +1,139 @@
+"""
+网络请求会话池：
+1.下载器web方式不再每次请求都新建TCP（与TLS）连接，而是从会话池取出会话发起请求，复用长连接（keep-alive）
+2.会话按目标（协议+域名+端口）分组，每个线程取出一个会话独占使用，用完交回，线程之间互不影响
+3.每个目标空闲的会话数上限默认与引擎的最大并发数一致，可按域名单独配置，超出上限交回的会话直接关闭
+4.会话交回时清空cookies，与直接调用requests.get/post一致，不会把一个请求的cookies带到下一个请求
+"""
+
+from threading import Lock
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from framework.error.check_error import CheckUnPass
+
+
+class SessionPool(object):
+    """
+    网络请求会话池
+    """
+
+    def __init__(self, size=10, host_sizes=None):
+        """
+        初始配置
+        :param size:(type=int) 每个目标空闲的会话数上限，必须为大于等于1的整数，默认10
+        :param host_sizes:(type=dict) 按域名单独配置的上限，域名为key，上限为value，默认None
+        """
+
+        host_sizes = dict() if host_sizes is None else host_sizes
+        for value in [size] + list(host_sizes.values()):
+            if not isinstance(value, int) or value < 1:
+                raise CheckUnPass('会话池每个目标的会话数上限必须为大于等于1的整数！')
+        self.__size = size
+        self.__host_sizes = host_sizes
+        self.__idle = dict()  # 每个目标空闲的会话，目标为key，会话列表为value（后进先出，优先复用刚用过的连接）
+        self.__created = dict()  # 每个目标创建过的会话数
+        self.__reused = 0  # 复用会话的次数
+        self.__closed = False
+        self.__lock = Lock()
+
+    @staticmethod
+    def __target(url):
+        """
+        获取请求地址对应的目标
+        :param url:(type=str) 请求地址
+        :return target:(type=tuple) (协议, 域名与端口)
+        """
+
+        parts = urlsplit(url)
+        target = (parts.scheme.lower(), parts.netloc.lower())
+        return target
+
+    @staticmethod
+    def __new_session():
+        """
+        创建会话，每个会话同一时间只由一个线程使用，每个域名只需要一个连接
+        :return session:(type=Session) 会话
+        """
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def acquire(self, url):
+        """
+        取出请求地址对应目标的一个空闲会话，没有则新建
+        :param url:(type=str) 请求地址
+        :return session:(type=Session) 会话
+        """
+
+        target = self.__target(url)
+        with self.__lock:
+            idle = self.__idle.get(target)
+            if idle:
+                self.__reused += 1
+                return idle.pop()
+            self.__created[target] = self.__created.get(target, 0) + 1
+        session = self.__new_session()
+        return session
+
+    def release(self, url, session):
+        """
+        交回会话，清空cookies，空闲的会话数已达上限或会话池已关闭则直接关闭
+        :param url:(type=str) 请求地址
+        :param session:(type=Session) 会话
+        """
+
+        session.cookies.clear()
+        target = self.__target(url)
+        limit = self.__host_sizes.get(target[1].split(':')[0], self.__size)
+        with self.__lock:
+            idle = self.__idle.setdefault(target, list())
+            if not self.__closed and len(idle) < limit:
+                idle.append(session)
+                return
+        session.close()
+
+    @contextmanager
+    def session(self, url):
+        """
+        取出会话，使用完成后自动交回，请求出错时关闭该会话，不再复用可能已损坏的连接
+        :param url:(type=str) 请求地址
+        :return session:(type=Session) 会话
+        """
+
+        session = self.acquire(url)
+        try:
+            yield session
+        except Exception:
+            session.close()
+            raise
+        else:
+            self.release(url, session)
+
+    def stats(self):
+        """
+        获取会话池的使用情况
+        :return created:(type=dict) 每个目标创建过的会话数，目标为“协议://域名”
+        :return reused:(type=int) 复用会话的次数
+        """
+
+        with self.__lock:
+            created = {'%s://%s' % target: nums for target, nums in self.__created.items()}
+            reused = self.__reused
+        return created, reused
+
+    def close(self):
+        """
+        引擎真正结束后，关闭所有空闲的会话，之后交回的会话也直接关闭
+        """
+
+        with self.__lock:
+            self.__closed = True
+            sessions = [session for idle in self.__idle.values() for session in idle]
+            self.__idle.clear()
+        for session in sessions:
+            session.close()
@@ -0,0 +1,139 @@
+"""
+引擎分阶段耗时统计：
+1.按阶段、业务名称与函数名称（解析函数、管道函数、采集方式等）分别统计耗时，用于分析时间花在了哪个环节
+2.每个统计项记录次数、总耗时、最大耗时与按耗时区间的直方图，分位数由直方图估算（取所在区间的上限）
+3.与计数器一致，每个线程有一份自己的统计（条带），记录时不需要加锁，读取时汇总
+"""
+
+import json
+from bisect import bisect_left
+from threading import Lock, local
+from time import perf_counter
+
+# 直方图的耗时区间上限（单位：毫秒），最后一个区间为超过10秒
+_bounds = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Timings(object):
+    """
+    引擎分阶段耗时统计
+    """
+
+    def __init__(self):
+        """
+        初始配置
+        """
+
+        self.__stripes = list()  # 所有线程的条带
+        self.__local = local()
+        self.__lock = Lock()  # 只在新线程第一次记录时使用
+
+    def __stripe(self):
+        """
+        获取本线程的条带，第一次记录时创建并登记
+        :return stripe:(type=dict) 条带，统计项为key，value为[次数, 总耗时, 最大耗时, 直方图]
+        """
+
+        stripe = getattr(self.__local, 'stripe', None)
+        if stripe is None:
+            stripe = self.__local.stripe = dict()
+            with self.__lock:
+                self.__stripes.append(stripe)
+        return stripe
+
+    def record(self, phase, builder_name, name, seconds):
+        """
+        记录一次耗时，只修改本线程的条带
+        :param phase:(type=str) 阶段
+        :param builder_name:(type=str) 业务名称
+        :param name:(type=str) 函数名称
+        :param seconds:(type=float) 耗时（单位：秒）
+        """
+
+        stripe = self.__stripe()
+        stat = stripe.get((phase, builder_name, name))
+        if stat is None:
+            stat = stripe[(phase, builder_name, name)] = [0, 0.0, 0.0, [0] * (len(_bounds) + 1)]
+        stat[0] += 1
+        stat[1] += seconds
+        if seconds > stat[2]:
+            stat[2] = seconds
+        stat[3][bisect_left(_bounds, seconds * 1000)] += 1
+
+    def iterate(self, iterable, phase, builder_name, name, seconds=0.0):
+        """
+        迭代解析函数、管道函数yield的对象，只统计生成对象的耗时，不包括调用方处理对象的耗时，迭代结束后记录一次
+        :param iterable:(type=generator,list) 解析函数、管道函数的返回值
+        :param phase:(type=str) 阶段
+        :param builder_name:(type=str) 业务名称
+        :param name:(type=str) 函数名称
+        :param seconds:(type=float) 迭代前已花费的耗时（比如调用函数本身），一并记录，默认0
+        :return item:(type=Request,Item) 解析函数、管道函数yield的对象
+        """
+
+        iterator = iter(iterable)
+        try:
+            while True:
+                begin = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += perf_counter() - begin
+                yield item
+        finally:
+            self.record(phase, builder_name, name, seconds)
+
+    def summary(self):
+        """
+        汇总所有线程的统计
+        :return summary:(type=list) 按总耗时倒序的统计项，每项为dict
+        """
+
+        merged = dict()
+        for stripe in list(self.__stripes):
+            for key, (nums, total, maximum, histogram) in list(stripe.items()):
+                stat = merged.setdefault(key, [0, 0.0, 0.0, [0] * (len(_bounds) + 1)])
+                stat[0] += nums
+                stat[1] += total
+                stat[2] = max(stat[2], maximum)
+                stat[3] = [a + b for a, b in zip(stat[3], histogram)]
+        summary = list()
+        for (phase, builder_name, name), (nums, total, maximum, histogram) in merged.items():
+            summary.append({
+                'phase': phase, 'builder': builder_name, 'name': name, 'count': nums, 'total': total,
+                'avg': total / nums, 'max': maximum, 'p50': self.__percentile(histogram, nums, 0.5, maximum),
+                'p90': self.__percentile(histogram, nums, 0.9, maximum),
+                'p99': self.__percentile(histogram, nums, 0.99, maximum),
+                'histogram': dict(zip([str(bound) for bound in _bounds] + ['inf'], histogram))})
+        summary.sort(key=lambda x: x['total'], reverse=True)
+        return summary
+
+    @staticmethod
+    def __percentile(histogram, nums, rate, maximum):
+        """
+        由直方图估算分位数，取所在区间的上限，不超过最大耗时
+        :param histogram:(type=list) 直方图
+        :param nums:(type=int) 总次数
+        :param rate:(type=float) 分位
+        :param maximum:(type=float) 最大耗时（单位：秒）
+        :return value:(type=float) 分位数（单位：秒）
+        """
+
+        target = nums * rate
+        accumulate = 0
+        for bound, num in zip(_bounds, histogram):
+            accumulate += num
+            if accumulate >= target:
+                return min(bound / 1000, maximum)
+        return maximum
+
+    def dump(self, path):
+        """
+        把汇总的统计写入json文件
+        :param path:(type=str) 文件路径
+        """
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
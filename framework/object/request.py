@@ -8,16 +8,20 @@ class Request(object):
     请求对象
     """
 
-    def __init__(self, way, parse='parse', meta=None, **kwargs):
+    def __init__(self, way, parse='parse', meta=None, priority=0, dont_filter=False, **kwargs):
         """
         初始配置
         :param way:(type=str) 数据采集方式，详见下载器
         :param parse:(type=str) 业务建造器中解析该请求对象的解析函数的函数名，默认parse函数
         :param meta:(type=∞) 用于请求对象与响应对象之间互传信息（数据）
+        :param priority:(type=int) 优先级，同一个业务里数字越大越先被调度，默认0
+        :param dont_filter:(type=bool) 开启去重过滤时，是否不参与去重，默认False参与
         :param kwargs:(type=dict) 提供给下载器的信息（URL、文件路径、数据库连接等）
         """
 
         self.way = way
         self.parse = parse
         self.meta = meta
+        self.priority = priority
+        self.dont_filter = dont_filter
         self.kwargs = kwargs
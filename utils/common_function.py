@@ -3,6 +3,7 @@
 """
 
 import sys
+import re
 import time
 import hashlib
 import requests
@@ -12,6 +13,7 @@ import base64
 import subprocess
 import pytz
 import csv
+import codecs
 import services  # 该模块在加载服务前就已经被导入，只能导入总模块，否则所有服务都会是加载前的None
 from config import format_date, format_date_n, format_datetime_n
 
@@ -61,7 +63,8 @@ def calculate_fp(parameters, algorithms='sha1'):
     return fp
 
 
-def request_get_response(url, method='get', retry=2, timeout=60, retry_interval=3, verify=True, **kwargs):
+def request_get_response(url, method='get', retry=2, timeout=60, retry_interval=3, verify=True, session=None,
+                         stream=False, **kwargs):
     """
     获取响应数据，重连失败抛IOError异常。
     :param url:(type=str) 请求地址
@@ -70,6 +73,8 @@ def request_get_response(url, method='get', retry=2, timeout=60, retry_interval=
     :param timeout:(type=int) 超时时间（秒），默认60
     :param retry_interval:(type=int) 重连请求间隔时间（秒），默认3
     :param verify:(type=bool) 是否进行证书验证，默认True
+    :param session:(type=Session) 发起请求的会话，传入则复用会话的长连接，默认None每次新建连接
+    :param stream:(type=bool) 是否流式下载，为True则只读取响应头，响应体需由调用方逐块读取，默认False
     :param kwargs:(type=dict) 其余的关键字参数，用于接收请求头与请求体
     :return response:(type=Response) 响应数据，如果多次尝试请求仍然失败，抛异常
     """
@@ -84,18 +89,19 @@ def request_get_response(url, method='get', retry=2, timeout=60, retry_interval=
     # 发起请求，重连次数达上限后抛异常
     if retry < 1:
         raise ValueError('retry为大于等于1的数字！')
+    client = requests if session is None else session
     for i in range(retry):
         try:
             if method.lower() == 'get':
-                response = requests.get(url, timeout=timeout, headers=kwargs['headers'], verify=verify)
+                response = client.get(url, timeout=timeout, headers=kwargs['headers'], verify=verify, stream=stream)
             elif method.lower() == 'post':
                 files = kwargs.get('files')
                 if files is None:
-                    response = requests.post(url, timeout=timeout, headers=kwargs['headers'], data=kwargs['data'],
-                                             verify=verify)
+                    response = client.post(url, timeout=timeout, headers=kwargs['headers'], data=kwargs['data'],
+                                           verify=verify, stream=stream)
                 else:
-                    response = requests.post(url, timeout=timeout, headers=kwargs['headers'], data=kwargs['data'],
-                                             files=files, verify=verify)
+                    response = client.post(url, timeout=timeout, headers=kwargs['headers'], data=kwargs['data'],
+                                           files=files, verify=verify, stream=stream)
             else:
                 raise ValueError('method只能为"get"或"post"！')
         except requests.exceptions.RequestException as e:
@@ -148,6 +154,154 @@ def repetition_json(url, interval_=1, retry_=3, **kwargs):
             return json_data
 
 
+def iter_json_array(response, encoding=None, block_size=65536):
+    """
+    逐块读取流式下载的响应体，增量解析顶层为数组的json数据，每解析出一个元素就生成，读取完成（或生成器关闭）后关闭响应
+    1.内存里只保留未解析的数据，已生成的元素不再保留；单个元素很大时每次至少读取到原来的两倍再重新解析，避免反复解析
+    2.元素之后的分隔符（逗号或右中括号）已读取到才生成该元素，避免被截断的数字（比如“2.5”只读取到“2.”）提前生成
+    3.顶层不是数组、数据不完整或格式错误时抛ValueError异常
+    :param response:(type=Response) stream=True请求得到的原生响应对象
+    :param encoding:(type=str) 响应体的编码，默认None为utf-8，与repetition_json一致
+    :param block_size:(type=int) 每次读取的字节数，默认65536
+    :return item:(type=generator) 每次生成数组的一个元素
+    """
+
+    blocks = response.iter_content(block_size)
+    text_decoder = codecs.getincrementaldecoder(encoding or 'utf-8')()
+    json_decoder = json.JSONDecoder()
+    whitespace = re.compile(r'[ \t\n\r]*')
+    buffer, pos, eof = '', 0, False
+
+    def read(size=1):
+        """
+        读取数据，直到未解析的数据至少有size个字符或已读取完成
+        :param size:(type=int) 未解析的数据至少的字符数
+        """
+
+        nonlocal buffer, pos, eof
+        parts, length = [buffer[pos:]], len(buffer) - pos
+        while length < size and not eof:
+            block = next(blocks, None)
+            text = text_decoder.decode(b'', final=True) if block is None else text_decoder.decode(block)
+            eof = block is None
+            parts.append(text)
+            length += len(text)
+        buffer, pos = ''.join(parts), 0
+
+    try:
+        state = 'start'  # start为等待左中括号，first为等待第一个元素或右中括号，item为等待元素，end为数组已结束
+        match, raw_decode = whitespace.match, json_decoder.raw_decode
+        while state != 'end':
+            pos = match(buffer, pos).end()
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError('json数据不完整！')
+                read()
+                continue
+            if state == 'start':
+                if buffer[pos] != '[':
+                    raise ValueError('流式解析只支持顶层为数组的json数据！（开头：%s）' % buffer[pos:pos + 100])
+                pos, state = pos + 1, 'first'
+                continue
+            if state == 'first' and buffer[pos] == ']':
+                pos, state = pos + 1, 'end'
+                continue
+
+            # 解析一个元素，连同之后的分隔符一起处理
+            try:
+                item, end = raw_decode(buffer, pos)
+            except json.decoder.JSONDecodeError as e:
+                if eof:
+                    raise ValueError('json格式错误！（报错信息：%s）' % e)
+                read((len(buffer) - pos) * 2)
+                continue
+            after = match(buffer, end).end()
+            if after == len(buffer) or buffer[after] not in ',]':
+                if not eof:
+                    read(len(buffer) - pos + 1)
+                    continue
+                if after == len(buffer):
+                    raise ValueError('json数据不完整！')
+                raise ValueError('json格式错误，数组元素之间缺少逗号！（位置：%s）' % buffer[after:after + 100])
+            pos, state = after + 1, 'item' if buffer[after] == ',' else 'end'
+            yield item
+
+        # 数组之后只允许有空白
+        while True:
+            pos = whitespace.match(buffer, pos).end()
+            if pos < len(buffer):
+                raise ValueError('json格式错误，数组之后还有数据！（位置：%s）' % buffer[pos:pos + 100])
+            if eof:
+                break
+            read()
+    finally:
+        response.close()
+
+
+def stream_json(url, interval_=1, retry_=3, chunk=None, encoding=None, **kwargs):
+    """
+    与repetition_json一致，但流式下载并增量解析顶层为数组的json数据，不把整个响应体读入内存
+    1.第一次请求在调用时发起，请求失败直接抛异常；响应体在遍历返回的生成器时才读取
+    2.读取或解析出错时重新请求，跳过已生成过的元素后继续生成，不会重复也不会遗漏（要求重新请求得到的数据不变）
+    :param url:(type=str) 请求地址
+    :param interval_:(type=int) 重试间隔时间（秒），默认1
+    :param retry_:(type=int) 重试次数，默认3
+    :param chunk:(type=int) 每次生成的元素个数，必须为None或大于等于1的整数，默认None逐个生成
+    :param encoding:(type=str) 响应体的编码，默认None为utf-8
+    :param kwargs:(type=dict) 其余的关键字参数，传参给获取请求数据的函数使用
+    :return result:(type=generator) chunk为None时每次生成数组的一个元素，否则生成最多chunk个元素的list
+    """
+
+    if chunk is not None and (not isinstance(chunk, int) or chunk < 1):
+        raise ValueError('chunk为None或大于等于1的整数！')
+    kwargs['stream'] = True
+    response = request_get_response(url, **kwargs)
+
+    def items():
+        """
+        逐个生成元素，出错时重新请求并跳过已生成过的元素
+        """
+
+        nonlocal response
+        done = 0  # 已生成过的元素个数
+        for i in range(retry_):
+            try:
+                if response is None:
+                    response = request_get_response(url, **kwargs)
+                parsed = iter_json_array(response, encoding)
+                try:
+                    for n, item in enumerate(parsed):
+                        if n >= done:
+                            done += 1
+                            yield item
+                finally:
+                    parsed.close()  # 解析函数提前结束遍历时立即关闭响应
+                return
+            except (ValueError, IOError) as e:
+                response = None
+                if i == retry_ - 1:
+                    raise e
+                else:
+                    time.sleep(interval_)
+
+    def chunks():
+        """
+        按块生成元素
+        """
+
+        rows = list()
+        for item in items():
+            rows.append(item)
+            if len(rows) >= chunk:
+                yield rows
+                rows = list()
+        if rows:
+            yield rows
+
+    result = items() if chunk is None else chunks()
+    return result
+
+
 def datetime_timedelta(td_type, td_count, date_time=None, format_=None):
     """
     把datetime对象根据对应时间间隔获取全新时间
@@ -292,29 +446,92 @@ def analyze_csv(text):
     :return result:(type=list) 解析后的数据，每一个元素为标题为key对应数据为value的dict
     """
 
-    # 处理特殊符号，并按照换行符分行
+    # 处理特殊符号，并按照换行符分行，逐行解析
     lines = text.replace('\0', '').split('\n')
+    result = list(iter_csv(lines))
+    return result
+
+
+def iter_csv(lines, chunk=None):
+    """
+    逐行解析csv格式的数据，第一行非空数据为标题（表头），全部解析完成后如有不完整数据则播报
+    :param lines:(type=iterable) 已按照换行符分好的行
+    :param chunk:(type=int) 每次生成的数据条数，默认None逐条生成
+    :return result:(type=generator) 解析后的数据，chunk为None时每次生成标题为key对应数据为value的dict，否则生成最多chunk个dict的list
+    """
 
     # 转换成csv对象，并遍历处理数据
     csv_data = csv.reader(lines)
     title = None  # 记录标题（表头）
     bad, such_as = 0, None  # 辅助记录不完整数据，便于排查
-    result = list()
+    rows = list()
     for one in csv_data:
         if one:
             if title is None:
                 title = one
                 continue
 
-            # 完整数据则保存，不完整数据则记录
+            # 完整数据则生成，不完整数据则记录
             if len(title) == len(one):
-                result.append(dict(zip(title, one)))
+                if chunk is None:
+                    yield dict(zip(title, one))
+                else:
+                    rows.append(dict(zip(title, one)))
+                    if len(rows) >= chunk:
+                        yield rows
+                        rows = list()
             else:
                 bad += 1
                 if such_as is None:
                     such_as = one
+    if rows:
+        yield rows
 
-    # 返回完整数据，如有不完整数据则播报
+    # 如有不完整数据则播报
     if bad:
         print_log('获取到的csv文本数据中有%s行数据不完整，其中一行数据如下：%s' % (bad, such_as))
+
+
+def iter_lines(response, encoding=None, block_size=65536):
+    """
+    逐块读取流式下载的响应体，增量解码后按照换行符逐行生成，内存里只保留一块数据与未完成的一行，读取完成（或生成器关闭）后关闭响应
+    1.与analyze_csv的处理一致：去掉\0，只按照\n分行，最后一个换行符之后的内容（可能为空字符串）也作为一行
+    2.响应头没有指定编码时，根据第一块数据推测编码，与原生响应对象的text一致
+    :param response:(type=Response) stream=True请求得到的原生响应对象
+    :param encoding:(type=str) 响应体的编码，默认None使用响应头的编码
+    :param block_size:(type=int) 每次读取的字节数，默认65536
+    :return line:(type=generator) 每次生成一行文本，不包含换行符
+    """
+
+    decoder, pending = None, ''
+    try:
+        for block in response.iter_content(block_size):
+            if decoder is None:
+                encoding = encoding or response.encoding
+                if encoding is None and requests.compat.chardet is not None:
+                    encoding = requests.compat.chardet.detect(block)['encoding']
+                decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+            lines = (pending + decoder.decode(block).replace('\0', '')).split('\n')
+            pending = lines.pop()
+            yield from lines
+        if decoder is not None:
+            pending += decoder.decode(b'', final=True).replace('\0', '')
+        yield pending
+    finally:
+        response.close()
+
+
+def stream_csv(response, chunk=None, encoding=None):
+    """
+    流式解析csv格式的响应体，不把整个响应体读入内存，峰值内存与chunk成正比，与报表大小无关
+    :param response:(type=Response) stream=True请求得到的原生响应对象
+    :param chunk:(type=int) 每次生成的数据条数，必须为None或大于等于1的整数，默认None逐条生成
+    :param encoding:(type=str) 响应体的编码，默认None使用响应头的编码
+    :return result:(type=generator) 解析后的数据，见iter_csv
+    """
+
+    if chunk is not None and (not isinstance(chunk, int) or chunk < 1):
+        response.close()
+        raise ValueError('chunk为None或大于等于1的整数！')
+    result = iter_csv(iter_lines(response, encoding), chunk)
     return result
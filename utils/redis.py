@@ -121,38 +121,55 @@ class Redis(object):
         """
         执行Redis操作
         :param type_:(type=str) 执行的操作
-        :param key:(type=str) 键
+        :param key:(type=str,list) 键，mget、delete、eval操作为多个键组成的list
         :param kwargs:(type=dict) 关键字参数，具体参数
-        :return result:(type=bool,str,None,int) 执行结果
+        :return result:(type=bool,str,None,int,list) 执行结果
         """
 
         with redis.StrictRedis(connection_pool=self.__pool) as connection:
             try:
                 if type_ == 'set':
-                    result = connection.set(key, kwargs['value'], ex=kwargs['ex'])
+                    result = connection.set(key, kwargs['value'], ex=kwargs['ex'], nx=kwargs['nx'])
                 elif type_ == 'get':
                     result = connection.get(key)
                 elif type_ == 'rpush':
                     result = connection.rpush(key, *kwargs['values'])
                 elif type_ == 'lpop':
                     result = connection.lpop(key)
+                elif type_ == 'mget':
+                    result = connection.mget(key)
+                elif type_ == 'incr':
+                    result = connection.incr(key, kwargs['amount'])
+                elif type_ == 'delete':
+                    result = connection.delete(*key)
+                elif type_ == 'hsetnx':
+                    result = connection.hsetnx(key, kwargs['field'], kwargs['value'])
+                elif type_ == 'hset':
+                    result = connection.hset(key, kwargs['field'], kwargs['value'])
+                elif type_ == 'hget':
+                    result = connection.hget(key, kwargs['field'])
+                elif type_ == 'sadd':
+                    result = connection.sadd(key, *kwargs['values'])
+                elif type_ == 'eval':
+                    result = connection.eval(kwargs['script'], len(key), *key, *kwargs['args'])
                 else:
                     result = None
             except redis.exceptions.ConnectionError as e:
                 raise ConnectFailed(str(e))
         return result
 
-    def set(self, key, value, ex=None, **kwargs):
+    def set(self, key, value, ex=None, nx=False, **kwargs):
         """
         根据键，设置string类型的值
         :param key:(type=str) 键
         :param value:(type=str) 值
         :param ex:(type=int) 过期时间（单位：秒），默认不过期
+        :param nx:(type=bool) 是否只在键不存在时才设置，默认False
         :param kwargs:(type=dict) 防止传入过多关键字参数而报错
-        :return result:(type=bool) 设置成功为True，否则为False
+        :return result:(type=bool,None) 设置成功为True，否则为False（nx为True且键已存在时为None）
         """
 
-        result = self.__execute('set', key, value=value, ex=ex)
+        result = self.__execute('set', key, value=value, ex=ex, nx=nx)
         return result
 
     def get(self, key, **kwargs):
@@ -188,3 +205,100 @@ class Redis(object):
 
         result = self.__execute('lpop', key)
         return result
+
+    def mget(self, keys, **kwargs):
+        """
+        根据多个键，获取多个string类型的值
+        :param keys:(type=list) 键
+        :param kwargs:(type=dict) 防止传入过多关键字参数而报错
+        :return result:(type=list) 值，与键一一对应，没有结果的为None
+        """
+
+        result = self.__execute('mget', keys)
+        return result
+
+    def incr(self, key, amount=1, **kwargs):
+        """
+        根据键，对string类型的值做原子自增
+        :param key:(type=str) 键
+        :param amount:(type=int) 增量，默认1
+        :param kwargs:(type=dict) 防止传入过多关键字参数而报错
+        :return result:(type=int) 自增后的值
+        """
+
+        result = self.__execute('incr', key, amount=amount)
+        return result
+
+    def delete(self, keys, **kwargs):
+        """
+        删除多个键
+        :param keys:(type=list) 键
+        :param kwargs:(type=dict) 防止传入过多关键字参数而报错
+        :return result:(type=int) 删除成功的键数
+        """
+
+        result = self.__execute('delete', keys)
+        return result
+
+    def hsetnx(self, key, field, value, **kwargs):
+        """
+        根据键，在hash类型里设置字段的值，只在字段不存在时才设置
+        :param key:(type=str) 键
+        :param field:(type=str) 字段
+        :param value:(type=str) 值
+        :param kwargs:(type=dict) 防止传入过多关键字参数而报错
+        :return result:(type=int) 设置成功为1，字段已存在为0
+        """
+
+        result = self.__execute('hsetnx', key, field=field, value=value)
+        return result
+
+    def hset(self, key, field, value, **kwargs):
+        """
+        根据键，在hash类型里设置字段的值
+        :param key:(type=str) 键
+        :param field:(type=str) 字段
+        :param value:(type=str) 值
+        :param kwargs:(type=dict) 防止传入过多关键字参数而报错
+        :return result:(type=int) 新增字段为1，覆盖字段为0
+        """
+
+        result = self.__execute('hset', key, field=field, value=value)
+        return result
+
+    def hget(self, key, field, **kwargs):
+        """
+        根据键，获取hash类型里字段的值
+        :param key:(type=str) 键
+        :param field:(type=str) 字段
+        :param kwargs:(type=dict) 防止传入过多关键字参数而报错
+        :return result:(type=str,None) 值，没有结果则返回None
+        """
+
+        result = self.__execute('hget', key, field=field)
+        return result
+
+    def sadd(self, key, values, **kwargs):
+        """
+        根据键，向set类型里添加多个元素
+        :param key:(type=str) 键
+        :param values:(type=list) 元素
+        :param kwargs:(type=dict) 防止传入过多关键字参数而报错
+        :return result:(type=int) 新增的元素数，已存在的不计入
+        """
+
+        result = self.__execute('sadd', key, values=values)
+        return result
+
+    def eval(self, script, keys, args, **kwargs):
+        """
+        执行Lua脚本，脚本在Redis里原子执行
+        :param script:(type=str) Lua脚本
+        :param keys:(type=list) 脚本用到的键，脚本里为KEYS
+        :param args:(type=list) 脚本用到的参数，脚本里为ARGV
+        :param kwargs:(type=dict) 防止传入过多关键字参数而报错
+        :return result:(type=∞) 脚本的返回值
+        """
+
+        result = self.__execute('eval', keys, script=script, args=args)
+        return result